@@ -1,27 +1,28 @@
 from statistics import mean
-import logging
+import numpy as np
 from SPmodelling import Balancer
 import SPmodelling.Interface as intf
 import specification
+from FallModel.Fall_clock import currenttime
+from FallModel.Fall_log import parselog
+from FallModel.Fall_checkpoint import Checkpointer
+from FallModel.Fall_policy import CapacityController, shiftcapacity
 
 
-def parselog(log):
+def lastdischarges(txl, node="Intervention"):
     """
-    Utility function, parses log strings from agents and converts them to a list of tuples.
+    Utility function, reads the time of the last hospital discharge of every agent at a node that has been discharged,
+    from the last_discharge property set when the discharge is logged, in one query.
 
-    :param log: string log format: "(<event>, <timestep>),..."
+    :param txl: neo4j database transaction
+    :param node: name of the node
 
-    :return: list of tuples [(<event>, <timestep>),...]
+    :return: numpy array of timesteps
     """
-    logging.debug(log)
-    while isinstance(log, list):
-        log = log[0]
-    log = log.split("), (")
-    log[0] = log[0].replace("(", "")
-    log[-1] = log[-1].replace(")", "")
-    log = [entry.split(",") for entry in log]
-    log = [(entry[0], int(entry[1])) for entry in log]
-    return log
+    times = txl.run("MATCH (a:Agent)-[:LOCATED]->(n:Node) "
+                    "WHERE n.name={node} AND exists(a.last_discharge) "
+                    "RETURN a.last_discharge", node=node).values()
+    return np.array([time for time, in times])
 
 
 def timesincedischarge(txl):
@@ -33,16 +34,7 @@ def timesincedischarge(txl):
 
     :return: list of times in integer timesteps
     """
-    times = []
-    agents = intf.getnodeagents(txl, "Intervention", "name")
-    for agent in agents:
-        log = parselog(agent["log"])
-        log.reverse()
-        lasthosdis = [entry for entry in log if entry[0] == "Hos discharge"]
-        if lasthosdis:
-            lasthosdis = lasthosdis[0]
-            times = times + [intf.gettime(txl) - lasthosdis[1]]
-    return times
+    return (currenttime(txl) - lastdischarges(txl, "Intervention")).tolist()
 
 
 def adjustcapasity(txl, history, dynamic=True):
@@ -50,7 +42,8 @@ def adjustcapasity(txl, history, dynamic=True):
     Rule function that applies the capacity change algorithm in the  case of two intervention node systems. This is uses
     a history variable that is cleared when the capacity is adjusted so that another five timesteps must pass before the
     capacity can be changed again. This only modifies OpenIntervention if dynamic is true else only intervention is
-    modified.
+    modified. FlowReaction applies the same rule through a CapacityController, see Fall_policy.WindowPolicy, which keeps
+    its history in a fixed size buffer.
 
     :param txl: neo4j database write transaction
     :param history: List of previous average times since discharge
@@ -71,25 +64,10 @@ def adjustcapasity(txl, history, dynamic=True):
         return history
     else:
         if history[-5] - history[-1] < -1 and history[-1] > 5:
-            if dynamic:
-                if intf.getnodevalue(txl, "InterventionOpen", "cap", uid="name") > 0 and dynamic:
-                    intf.updatenode(txl, "Intervention", "cap",
-                                    intf.getnodevalue(txl, "Intervention", "cap", uid="name")
-                                    + 1, "name")
-                    intf.updatenode(txl, "InterventionOpen", "cap", intf.getnodevalue(txl, "InterventionOpen", "cap",
-                                                                                      uid="name") - 1, "name")
-            else:
-                intf.updatenode(txl, "Intervention", "cap", intf.getnodevalue(txl, "Intervention", "cap", uid="name")
-                                + 1, "name")
+            shiftcapacity(txl, {"Intervention": 1, "InterventionOpen": -1} if dynamic else {"Intervention": 1})
             return []
         elif history[-5] - history[-1] > 0 and history[-1] < 5:
-            if intf.getnodevalue(txl, "Intervention", "cap", uid="name") > 0:
-                intf.updatenode(txl, "Intervention", "cap", intf.getnodevalue(txl, "Intervention", "cap", uid="name")
-                                - 1, "name")
-                if dynamic:
-                    intf.updatenode(txl, "InterventionOpen", "cap", intf.getnodevalue(txl, "InterventionOpen", "cap",
-                                                                                      uid="name") + 1, "name")
-
+            shiftcapacity(txl, {"Intervention": -1, "InterventionOpen": 1} if dynamic else {"Intervention": -1})
             return []
         else:
             return history
@@ -97,19 +75,36 @@ def adjustcapasity(txl, history, dynamic=True):
 
 class FlowReaction(Balancer.FlowReaction):
     """
-    Fall specific implementation of a Balancer for adjusting network values. Applies the adjust capacity rule.
+    Fall specific implementation of a Balancer for adjusting network values. Applies the capacity policy set as
+    capacitypolicy in the specification, the original adjust capacity rule if none is set, see CapacityController.
     """
 
     def __init__(self, uri=None, author=None):
         super(FlowReaction, self).__init__(uri, author)
-        self.storage = []
+        self.controller = CapacityController(getattr(specification, "capacitypolicy", None))
+        self.runname = None
+        self.checkpointer = Checkpointer("Balancer", lambda: {"controller": self.controller}, self.restore)
+
+    def restore(self, txl, state):
+        """
+        Sets the Balancer history back from a checkpoint.
+
+        :param txl: neo4j database transaction
+        :param state: state captured by the checkpointer
+
+        :return: None
+        """
+        self.controller = state["controller"]
 
     def applyrules(self, txl):
         """
-        Applies the adjust capacity rule
+        Applies the capacity policy, checkpointing the Balancer history first when one is due.
 
         :param txl: neo4j database write transaction
 
         :return: None
         """
-        self.storage = adjustcapasity(txl, self.storage, specification.dynamic)
+        if not self.runname:
+            self.runname = intf.getrunname(txl)
+        self.checkpointer.step(txl, self.runname)
+        self.controller.step(txl, timesincedischarge(txl), specification.dynamic)
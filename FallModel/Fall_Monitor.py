@@ -3,6 +3,7 @@ import pickle
 import numpy as np
 from matplotlib import pyplot as plt
 from FallModel.Fall_Balancer import timesincedischarge
+from FallModel.Fall_log import agentlog, formatlog
 import SPmodelling.Interface as intf
 from statistics import mean
 from SPmodelling.Monitor import Monitor as SPMonitor
@@ -126,7 +127,7 @@ class Monitor(SPMonitor):
             # Update plot 2 - Hos to Int
             gaps = timesincedischarge(txl)
             if gaps:
-                hiint = mean(timesincedischarge(txl))
+                hiint = mean(gaps)
                 self.y3storage = self.y3storage + [hiint]
                 if len(self.y3storage) >= 10:
                     self.y3storage = self.y3storage[-10:]
@@ -195,7 +196,8 @@ class Monitor(SPMonitor):
         super(Monitor, self).close(txc)
         runname = intf.getrunname(txc)
         print(self.clock)
-        logs = txc.run("MATCH (a:Agent) RETURN a.log").values()
+        logs = txc.run("MATCH (a:Agent) RETURN properties(a)").values()
+        logs = [[formatlog(agentlog(log[0]))] for log in logs]
         pickle_lout = open(specification.savedirectory + "logs_" + runname + ".p", "wb")
         pickle.dump(logs, pickle_lout)
         pickle_lout.close()
@@ -1,6 +1,107 @@
 from SPmodelling.Agent import MobileAgent, CommunicativeAgent
-import numpy.random as npr
+import numpy as np
 import SPmodelling.Interface as intf
+from FallModel.Fall_state import loadagent, saveagent
+from FallModel.Fall_clock import currenttime
+from FallModel.Fall_log import appendlog
+from FallModel.Fall_random import agentrandom, populationrandom
+from FallModel.Fall_topology import topology
+from FallModel.Fall_social import socialgraph, locationindex, evictions, deletecontacts
+
+
+EDGE_TYPES = ["social", "fall", "medical", "inactive"]
+
+
+def edgearrays(edges):
+    """
+    Utility function, collects the mood thresholds and type codes of a list of edges for inclinationchoice. Edges
+    without a known type get the code -1 and carry no inclination weight.
+
+    :param edges: list of edges
+
+    :return: (array of edge mood thresholds, array of edge type codes)
+    """
+    moods = np.array([edge["mood"] for edge in edges], dtype=float)
+    types = np.array([EDGE_TYPES.index(edge["type"]) if edge["type"] in EDGE_TYPES else -1 for edge in edges],
+                     dtype=int)
+    return moods, types
+
+
+def inclinationchoice(moods, inclinations, edge_moods, edge_types, rng, valid=None):
+    """
+    Utility function, makes the Patient choice for many agents over the same edges at once. Each agent may take the
+    edges whose mood threshold it reaches, weighted by its inclination for the edge type floored at zero, or uniformly
+    if all of those weights are zero. Every choice is sampled with one uniform draw against the cumulative weights.
+
+    :param moods: array of agent moods
+    :param inclinations: agents by edge types array of agent inclinations
+    :param edge_moods: array of edge mood thresholds
+    :param edge_types: array of edge type codes, -1 for edges without a type
+    :param rng: random generator, see Fall_random
+    :param valid: (Optional) agents by edges mask of the edges each agent can see
+
+    :return: array of the index of the chosen edge for each agent, -1 where the agent has no option
+    """
+    mask = edge_moods[None, :] <= moods[:, None]
+    if valid is not None:
+        mask = mask & valid
+    inclinations = np.maximum(np.asarray(inclinations, dtype=float), 0)
+    weights = np.where(edge_types >= 0, inclinations[:, np.maximum(edge_types, 0)], 0) * mask
+    weights = np.where((weights.sum(axis=1) == 0)[:, None], mask, weights)
+    cumulative = np.cumsum(weights, axis=1)
+    draws = rng.random(len(moods)) * cumulative[:, -1]
+    choice = np.minimum((cumulative <= draws[:, None]).sum(axis=1), len(edge_moods) - 1)
+    return np.where(mask.any(axis=1), choice, -1)
+
+
+class ChoicePlan:
+    """
+    Choices made by a node for all of the patients about to leave it, see FallNode.agentschoice. Each plan holds the
+    edges the patient was expected to see, the mood and inclination it was chosen with and the index of the chosen edge.
+    Plans last for the transaction they were made in and are used once.
+    """
+
+    def __init__(self):
+        self.tx = None
+        self.plans = {}
+
+    def set(self, tx, plans):
+        """
+        Adds plans, dropping any left from an earlier transaction.
+
+        :param tx: neo4j database transaction
+        :param plans: dictionary of agent id to (<edge ids>, <mood>, <inclination>, <chosen index>)
+
+        :return: None
+        """
+        if tx is not self.tx:
+            self.plans = {}
+            self.tx = tx
+        self.plans.update(plans)
+
+    def take(self, tx, agent_id, edges, mood, inclination):
+        """
+        Removes the plan of a patient and returns its choice if the plan was made for the same edges, mood and
+        inclination.
+
+        :param tx: neo4j database transaction
+        :param agent_id: id of the patient
+        :param edges: list of the edges the patient can choose from
+        :param mood: mood of the patient
+        :param inclination: inclination of the patient
+
+        :return: index of the chosen edge, -1 if the patient has no option, None if there is no matching plan
+        """
+        if tx is not self.tx:
+            return None
+        plan = self.plans.pop(agent_id, None)
+        if plan is None or plan[0] != tuple(edge.id for edge in edges) or plan[1] != mood or \
+                plan[2] != tuple(inclination):
+            return None
+        return plan[3]
+
+
+choiceplan = ChoicePlan()
 
 
 class Patient(MobileAgent, CommunicativeAgent):
@@ -16,13 +117,15 @@ class Patient(MobileAgent, CommunicativeAgent):
         self.inclination = None
         self.current_energy = None
         self.view = None
-        self.log = None
+        self.events = []
         self.fall = ""
         self.wellbeing = None
         self.referral = None
         self.social = 6
         self.colocated = None
         self.contacts = None
+        self.state = None
+        self.dirty = {}
 
     def generator(self, tx, params):
         """
@@ -35,24 +138,25 @@ class Patient(MobileAgent, CommunicativeAgent):
         :return: None
         """
         super(Patient, self).generator(tx, params)
+        rng = populationrandom(tx)
         # generate a random set of parameters based on a distribution with mean set by params
         [mobility, mood, energy, inclination, min_social, max_social] = params
-        self.mobility = npr.normal(mobility, 0.05)  # draw from normal distribution centred on given value
-        self.energy = npr.normal(energy, 0.05)
-        self.mood = npr.normal(mood, 0.05)
-        self.inclination = [npr.normal(x) for x in inclination]
+        self.mobility = rng.normal(mobility, 0.05)  # draw from normal distribution centred on given value
+        self.energy = rng.normal(energy, 0.05)
+        self.mood = rng.normal(mood, 0.05)
+        self.inclination = [rng.normal(x) for x in inclination]
         self.inclination = [inc/sum(self.inclination) for inc in self.inclination]
         self.wellbeing = "'At risk'"
         self.referral = "false"
-        self.social = npr.choice(range(min_social, max_social+1), 1)[0]
+        self.social = int(rng.integers(min_social, max_social + 1))
         print(self.social)
         # Add agent with params to ind in graph with resources starting at 0
-        time = tx.run("MATCH (a:Clock) RETURN a.time").values()[0][0]
-        self.log = "(CREATED," + str(time) + ")"
+        time = currenttime(tx)
         intf.addagent(tx, {"name": "Home"}, "Agent:Patient",
                       {"mob": self.mobility, "mood": self.mood, "energy": self.energy,
                        "inclination": self.inclination, "wellbeing": self.wellbeing,
-                       "log": "'" + self.log + "'", "referral": self.referral, "social":self.social}, "name")
+                       "log_events": ["CREATED"], "log_times": [time], "referral": self.referral,
+                       "social": self.social}, "name")
 
     @staticmethod
     def positive(num):
@@ -68,6 +172,59 @@ class Patient(MobileAgent, CommunicativeAgent):
         else:
             return num
 
+    def hydrate(self, tx):
+        """
+        Loads all of the patients properties from the database in one query at the start of a move. The later phases of
+        the move read from this state instead of querying each attribute separately.
+
+        :param tx: neo4j database transaction
+
+        :return: None
+        """
+        self.state = loadagent(tx, self.id, "Patient")
+        self.mobility = self.state.get("mob")
+        self.energy = self.state.get("energy")
+        self.mood = self.state.get("mood")
+        self.inclination = self.state.get("inclination")
+        self.wellbeing = self.state.get("wellbeing")
+        self.referral = self.state.get("referral")
+        self.social = self.state.get("social", self.social)
+
+    def stage(self, prop, value):
+        """
+        Records a change to one of the agents properties. Changes are held until the agent is flushed so that repeated
+        writes to the same property within a move reach the database only once.
+
+        :param prop: name of the agent property
+        :param value: new value of the property
+
+        :return: None
+        """
+        self.dirty[prop] = value
+
+    def record(self, event, time):
+        """
+        Adds an entry to the agents log. Entries are appended to the log in the database when the agent is flushed.
+
+        :param event: name of the event
+        :param time: integer timestep of the event
+
+        :return: None
+        """
+        self.events.append((event, time))
+
+    def flush(self, tx):
+        """
+        Writes all staged property changes and new log entries to the database in one query and clears the buffer.
+
+        :param tx: neo4j database write transaction
+
+        :return: None
+        """
+        saveagent(tx, self.id, self.dirty, self.events)
+        self.dirty = {}
+        self.events = []
+
     def perception(self, tx, perc):
         """
         Patient perception function. Filters based on agent having sufficient energy for edge and end node.
@@ -84,8 +241,7 @@ class Patient(MobileAgent, CommunicativeAgent):
             edges = [self.view]
         # filter out options requiring too much energy
         valid_edges = []
-        self.mobility = intf.getnodevalue(tx, self.id, "mob", "Patient")
-        self.energy = intf.getnodevalue(tx, self.id, "energy", "Patient")
+        self.hydrate(tx)
         self.current_energy = self.energy
         if len(self.view) > 1:
             for edge in edges:
@@ -111,35 +267,24 @@ class Patient(MobileAgent, CommunicativeAgent):
         :return: single edge as final choice
         """
         super(Patient, self).choose(tx, perc)
-        # filter out options where the agent does not reach the mood threshold
-        options = []
-        self.mood = intf.getnodevalue(tx, self.id, "mood", "Patient")
-        self.inclination = intf.getnodevalue(tx, self.id, "inclination", "Patient")
-        self.log = intf.getnodevalue(tx, self.id, "log", "Patient")
-        self.wellbeing = intf.getnodevalue(tx, self.id, "wellbeing", "Patient")
-        self.referral = intf.getnodevalue(tx, self.id, "referral", "Patient")
+        if self.state is None:
+            self.hydrate(tx)
         if len(self.view) < 2:
             if type(self.view) == list and self.view:
                 choice = self.view[0]
             else:
                 choice = self.view
         else:
-            for edge in self.view:
-                if edge["mood"] <= self.mood:
-                    options = options + [edge]
-            # choose based on random sample bias by patients inclination
-            if not options:
+            # filter out options where the agent does not reach the mood threshold and choose from the rest by a
+            # random sample biased by the patients inclination, made by the node for all its patients if it planned
+            sample = choiceplan.take(tx, self.id, self.view, self.mood, self.inclination)
+            if sample is None:
+                (edge_moods, edge_types) = edgearrays(self.view)
+                sample = inclinationchoice(np.array([self.mood]), np.array([self.inclination]), edge_moods,
+                                           edge_types, agentrandom(tx, self.id))[0]
+            if sample < 0:
                 return None
-            types = [edge["type"] for edge in options]
-            edge_types = ["social", "fall", "medical", "inactive"]
-            types = [edge_types.index(lable) for lable in types]
-            weights = [self.positive(self.inclination[label]) for label in types]
-            if sum(weights):
-                weights = [w / sum(weights) for w in weights]
-                sample = npr.choice(range(len(options)), 1, p=weights)
-            else:
-                sample = npr.choice(range(len(options)), 1)
-            choice = options[sample[0]]
+            choice = self.view[sample]
         return choice
 
     def learn(self, tx, choice):
@@ -153,46 +298,39 @@ class Patient(MobileAgent, CommunicativeAgent):
         :return: None
         """
         super(Patient, self).learn(tx, choice)
+        rng = agentrandom(tx, self.id)
         # modify mob, conf, res and energy based on new node
         if self.fall and self.fall != "Mild":
             if self.wellbeing != "Fallen":
                 self.wellbeing = "Fallen"
-                intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                clock = tx.run("MATCH (a:Clock) "
-                               "RETURN a.time").values()[0][0]
-                self.log = self.log + ", (Fallen, " + str(clock) + ")"
+                self.stage("wellbeing", self.wellbeing)
+                self.record("Fallen", currenttime(tx))
         if "modm" in choice.end_node:
-            self.mobility = self.positive(npr.normal(choice.end_node["modm"], 0.05) + self.mobility)
-            intf.updateagent(tx, self.id, "mob", self.mobility)
+            self.mobility = self.positive(rng.normal(choice.end_node["modm"], 0.05) + self.mobility)
+            self.stage("mob", self.mobility)
             # check for updates to wellbeing and log any changes
             if self.mobility == 0:
                 if self.wellbeing != "Fallen":
                     self.wellbeing = "Fallen"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (Fallen, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("Fallen", currenttime(tx))
             elif self.mobility > 1:
                 if self.wellbeing != "Healthy":
                     self.wellbeing = "Healthy"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (Healthy, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("Healthy", currenttime(tx))
             elif self.mobility <= 1:
                 if self.wellbeing == "Healthy":
                     self.wellbeing = "At risk"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (At risk, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("At risk", currenttime(tx))
         if "modmood" in choice.end_node:
-            self.mood = self.positive(npr.normal(choice.end_node["modmood"], 0.05) + self.mood)
-            intf.updateagent(tx, self.id, "mood", self.mood)
+            self.mood = self.positive(rng.normal(choice.end_node["modmood"], 0.05) + self.mood)
+            self.stage("mood", self.mood)
         if "energy" in choice.end_node:
-            self.current_energy = npr.normal(choice.end_node["energy"], 0.05) + self.current_energy
+            self.current_energy = rng.normal(choice.end_node["energy"], 0.05) + self.current_energy
             energy_change = self.current_energy - self.energy
-            intf.updateagent(tx, self.id, "energy", self.current_energy)
+            self.stage("energy", self.current_energy)
             edge_types = ["social", "fall", "medical", "inactive"]
             for i in range(len(edge_types)):
                 if choice["type"] == edge_types[i]:
@@ -216,19 +354,15 @@ class Patient(MobileAgent, CommunicativeAgent):
             self.inclination[3] = self.inclination[3] + 1
         elif self.mobility > 0.8:
             self.inclination[3] = self.inclination[3] - 1
-        intf.updateagent(tx, self.id, "inclination", self.inclination)
+        self.stage("inclination", self.inclination)
         # log going into care
         if choice.end_node["name"] == "Care":
-            clock = tx.run("MATCH (a:Clock) "
-                           "RETURN a.time").values()[0][0]
-            self.log = self.log + ", (Care, " + str(clock) + ")"
-        if "cap" in choice.end_node.keys():
-            intf.updatenode(tx, choice.end_node["name"], "load", choice.end_node["load"] + 1, "name")
+            self.record("Care", currenttime(tx))
+        topology.moveload(tx, choice.start_node["name"], choice.end_node["name"])
         if self.view[0]["name"] == "Hos" and choice.end_node["name"] != "Hos":
-            clock = tx.run("MATCH (a:Clock) "
-                           "RETURN a.time").values()[0][0]
-            self.log = self.log + ", (Discharged, " + str(clock) + ")"
-        intf.updateagent(tx, self.id, "log", str(self.log))
+            self.record("Discharged", currenttime(tx))
+        locationindex.relocate(self.id, choice.end_node["name"])
+        self.flush(tx)
 
     def payment(self, tx):
         """
@@ -239,6 +373,7 @@ class Patient(MobileAgent, CommunicativeAgent):
         :return: None
         """
         super(Patient, self).payment(tx)
+        rng = agentrandom(tx, self.id)
         # Deduct energy used on edge
         if "energy" in self.choice.keys():
             if "energy" in self.choice.end_node.keys():
@@ -252,42 +387,36 @@ class Patient(MobileAgent, CommunicativeAgent):
                             intf.updatenode(tx, carer.end_node["id"], "energy", carer.end_node["energy"]
                                             - self.choice["energy"], label='Carer')
                             self.current_energy = self.current_energy+self.choice["energy"]
-                            intf.updateagent(tx, self.id, "energy", self.current_energy)
-                            intf.updatecontactedge(tx, self.id, carer.end_node["id"], "usage", intf.gettime(tx), "Agent",
+                            self.stage("energy", self.current_energy)
+                            intf.updatecontactedge(tx, self.id, carer.end_node["id"], "usage", currenttime(tx), "Agent",
                                                    "Carer")
                             break
                     else:
                         return False
-            self.current_energy = npr.normal(self.choice["energy"], 0.05) + self.current_energy
-            intf.updateagent(tx, self.id, "energy", self.current_energy)
+            self.current_energy = rng.normal(self.choice["energy"], 0.05) + self.current_energy
+            self.stage("energy", self.current_energy)
         # mod variables based on edges
         if "modm" in self.choice:
-            self.mobility = self.positive(npr.normal(self.choice["modm"], 0.05) + self.mobility)
-            intf.updateagent(tx, self.id, "mob", self.mobility)
+            self.mobility = self.positive(rng.normal(self.choice["modm"], 0.05) + self.mobility)
+            self.stage("mob", self.mobility)
             if self.mobility == 0:
                 if self.wellbeing != "Fallen":
                     self.wellbeing = "Fallen"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (Fallen, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("Fallen", currenttime(tx))
             elif self.mobility > 1:
                 if self.wellbeing != "Healthy":
                     self.wellbeing = "Healthy"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (Healthy, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("Healthy", currenttime(tx))
             elif self.mobility <= 1:
                 if self.wellbeing == "Healthy":
                     self.wellbeing = "At risk"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (At risk, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("At risk", currenttime(tx))
         if "modmood" in self.choice:
-            self.mood = self.positive(npr.normal(self.choice["modmood"], 0.05) + self.mood)
-            intf.updateagent(tx, self.id, "mood", self.mood)
+            self.mood = self.positive(rng.normal(self.choice["modmood"], 0.05) + self.mood)
+            self.stage("mood", self.mood)
         return True
 
     def move(self, tx, perc):
@@ -299,20 +428,23 @@ class Patient(MobileAgent, CommunicativeAgent):
 
         :return: Node Agent has moved to
         """
+        self.state = None
+        self.dirty = {}
         super(Patient, self).move(tx, perc)
+        self.flush(tx)
 
-    def logging(self, tx, entry):
+    def logging(self, tx, event, time):
         """
-        Utility function for adding information to the agents log of its activities
+        Utility function for adding information to the agents log of its activities, the entry is appended on the
+        database server without reading the existing log.
 
         :param tx: neo4j database write transaction
-        :param entry: String to be added to the log
+        :param event: name of the event to be added to the log
+        :param time: integer timestep of the event
 
         :return: None
         """
-        self.log = intf.getnodevalue(tx, self.id, "log", "Agent")
-        self.log = self.log + ", (" + entry + ")"
-        intf.updateagent(tx, self.id, "log", str(self.log))
+        appendlog(tx, self.id, [event], [time])
 
     def look(self, tx):
         """
@@ -325,9 +457,14 @@ class Patient(MobileAgent, CommunicativeAgent):
         super(Patient, self).look(tx)
         self.id = self.id[0]
         # If not at home, find co-located agents
-        if intf.locateagent(tx, self.id)["name"] != "Home":
-            self.colocated = intf.colocated(tx, self.id)
-        self.social = intf.getnodevalue(tx, self.id, "social", "Agent")
+        locationindex.ensure(tx, currenttime(tx))
+        if locationindex.locate(self.id) != "Home":
+            self.colocated = locationindex.colocated(self.id)
+        else:
+            self.colocated = []
+        record = locationindex.record(self.id)
+        if record is not None and record["social"] is not None:
+            self.social = record["social"]
 
     def update(self, tx):
         """
@@ -341,9 +478,10 @@ class Patient(MobileAgent, CommunicativeAgent):
         # Update existing com links with latest co-location
         self.contacts = intf.agentcontacts(tx, self.id, "Patient")
         if self.contacts and self.colocated:
-            update = [contact for contact in self.contacts if contact in self.colocated]
+            present = {agent["id"] for agent in self.colocated}
+            update = [contact for contact in self.contacts if contact.end_node["id"] in present]
             for contact in update:
-                intf.updatecontactedge(tx, contact.end_node["id"], self.id, "last_usage", intf.gettime())
+                intf.updatecontactedge(tx, contact.end_node["id"], self.id, "last_usage", currenttime(tx))
 
     def talk(self, tx):
         """
@@ -355,29 +493,28 @@ class Patient(MobileAgent, CommunicativeAgent):
         :return: None
         """
         super(Patient , self).talk(tx)
+        rng = agentrandom(tx, self.id)
         if self.colocated:
-            newcontacts = [nc for nc in self.colocated if nc not in self.contacts]
+            socialgraph.ensure(tx, currenttime(tx))
+            known = set(socialgraph.contacts(("Agent", self.id), "Agent"))
+            newcontacts = [nc for nc in self.colocated if nc["id"] not in known and nc["id"] != self.id]
             if newcontacts:
-                if len(newcontacts) > 1:
-                    newfriend = npr.sample(newcontacts)
-                else:
-                    newfriend = newcontacts
+                newfriend = newcontacts[rng.integers(len(newcontacts))]
                 # Based on relative social values and length of shortest path set probability for forming link with a
                 #  randomly sampled co-located unknown agent. social from 2-8 per agent, combined from 4-16. So combined -4
                 #  over 24 gives value between 0 and 0.5 plus the if minimum path greater than 6 nothing, else from m=2-6
                 #  then 1/(2m-2) gives 0.1-0.5 (m=1 or 0 means itself or already connected).
-                prob1 = (newfriend.end_node["social"]+self.social-4)/24
-                sp = intf.shortestpath(tx, self.id, newfriend.end_node["id"], 'Agent', 'Social')
-                if sp < 2:
-                    prob2 = 0
-                elif sp > 6:
+                prob1 = (newfriend["social"]+self.social-4)/24
+                sp = socialgraph.distance(("Agent", self.id), ("Agent", newfriend["id"]), 6)
+                if sp is None or sp < 2:
                     prob2 = 0
                 else:
                     prob2 = 1/(2*sp-2)
-                if npr.random(1) <= (prob1 + prob2):
+                if rng.random() <= (prob1 + prob2):
                 # form friend link
-                    intf.createedge(self.id, newfriend.end_node["id"], 'Agent', 'Agent', 'SOCIAL:FRIEND', 'created: '
-                                  + intf.gettime() + ', usage: ' + intf.gettime() + ', carer: False')
+                    intf.createedge(tx, self.id, newfriend["id"], 'Agent', 'Agent', 'SOCIAL:FRIEND', 'created: '
+                                    + str(currenttime(tx)) + ', usage: ' + str(currenttime(tx)) + ', carer: False')
+                    socialgraph.add(("Agent", self.id), ("Agent", newfriend["id"]))
                     self.contacts = newfriend
                 else: self.contacts = None
             else:
@@ -394,13 +531,15 @@ class Patient(MobileAgent, CommunicativeAgent):
         :return: None
         """
         super(Patient, self).listen(tx)
+        rng = agentrandom(tx, self.id)
         if self.contacts:
-            carers = intf.agentcontacts(tx, self.contacts.end_node["id"], "Agent", "Carer")
-            carers = [carer for carer in carers if carer["carer"]]
-            carer = npr.sample(carers)
-            if npr.random(1) < 0.5:
-                intf.createedge(self.id, carer.end_node["id"], 'Patient', 'Carer', 'SOCIAL:FRIEND', 'created: '
-                                + intf.gettime() + ', usage: ' + intf.gettime() + ', carer: True')
+            socialgraph.ensure(tx, currenttime(tx))
+            carers = socialgraph.contacts(("Agent", self.contacts["id"]), "Carer")
+            if carers and rng.random() < 0.5:
+                carer = carers[rng.integers(len(carers))]
+                intf.createedge(tx, self.id, carer, 'Patient', 'Carer', 'SOCIAL:FRIEND', 'created: '
+                                + str(currenttime(tx)) + ', usage: ' + str(currenttime(tx)) + ', carer: True')
+                socialgraph.add(("Agent", self.id), ("Carer", carer))
 
     def react(self, tx):
         """
@@ -412,33 +551,12 @@ class Patient(MobileAgent, CommunicativeAgent):
         :return: None
         """
         super(Patient, self).react(tx)
-        self.contacts = intf.agentcontacts(tx, self.id, "Agent")
-        carers = self.contacts + intf.agentcontacts(tx, self.id, "Agent", "Carer")
-        if len(self.contacts) > self.social:
-            while len(carers) > self.social:
-                carer_drop = None
-                latest_time = 0
-                for carer in carers:
-                    if carer["created"] > latest_time:
-                        carer_drop = carer
-                        latest_time = carer["created"]
-                intf.deletecontact(tx, self.id, carer_drop.end_node["id"], "Agent", "Carer")
-            if len(carers) == self.social:
-                for contact in contacts:
-                    intf.deletecontact(tx, self.id, contact.end_node["id"], "Agent", "Agent")
-            if len(carers)+len(contacts) > self.social:
-                for contact in contacts:
-                    if len(carers)+len(contacts) > self.social:
-                        if intf.gettime() - contact['created'] < 5:
-                            intf.deletecontact(tx, self.id, contact.end_node["id"], "Agent", "Agent")
-            oldest_usage = 0
-            contact_drop = None
-            while len(carers)+len(contacts) > self.social:
-                for contact in contacts:
-                    if intf.gettime() - contact["usage"] > oldest_usage:
-                        contact_drop = contact
-                        oldest_usage = intf.gettime() - contact["usage"]
-                intf.deletecontact(tx, self.id, contact_drop.end_node["id"], "Agent", "Agent")
+        friends = intf.agentcontacts(tx, self.id, "Agent")
+        carers = intf.agentcontacts(tx, self.id, "Agent", "Carer")
+        drops = evictions(friends, carers, self.social, currenttime(tx))
+        deletecontacts(tx, self.id, drops)
+        for key in drops:
+            socialgraph.remove(("Agent", self.id), key)
 
 
 class FallAgent(MobileAgent):
@@ -455,10 +573,12 @@ class FallAgent(MobileAgent):
         self.confidence_resources = None
         self.current_energy = None
         self.view = None
-        self.log = None
+        self.events = []
         self.fall = ""
         self.wellbeing = None
         self.referral = None
+        self.state = None
+        self.dirty = {}
 
     def generator(self, tx, params):
         """
@@ -471,19 +591,20 @@ class FallAgent(MobileAgent):
         :return: None
         """
         super(FallAgent, self).generator(tx, params)
+        rng = populationrandom(tx)
         # generate a random set of parameters based on a distribution with mean set by params
         [mobility, confidence, energy] = params
-        self.mobility = npr.normal(mobility, 0.05)  # draw from normal distribution centred on given value
-        self.energy = npr.normal(energy, 0.05)
-        self.confidence = npr.normal(confidence, 0.05)
+        self.mobility = rng.normal(mobility, 0.05)  # draw from normal distribution centred on given value
+        self.energy = rng.normal(energy, 0.05)
+        self.confidence = rng.normal(confidence, 0.05)
         self.wellbeing = "'At risk'"
         self.referral = "false"
         # Add agent with params to ind in graph with resources starting at 0
-        time = tx.run("MATCH (a:Clock) RETURN a.time").values()[0][0]
-        self.log = "(CREATED," + str(time) + ")"
+        time = currenttime(tx)
         intf.addagent(tx, {"name": "Home"}, "Agent", {"mob": self.mobility, "conf": self.confidence, "mob_res": 0,
                                                       "conf_res": 0, "energy": self.energy, "wellbeing": self.wellbeing,
-                                                      "log": "'" + self.log + "'", "referral": self.referral}, "name")
+                                                      "log_events": ["CREATED"], "log_times": [time],
+                                                      "referral": self.referral}, "name")
 
     @staticmethod
     def positive(num):
@@ -499,6 +620,59 @@ class FallAgent(MobileAgent):
         else:
             return num
 
+    def hydrate(self, tx):
+        """
+        Loads all of the agents properties from the database in one query at the start of a move. The later phases of
+        the move read from this state instead of querying each attribute separately.
+
+        :param tx: neo4j database transaction
+
+        :return: None
+        """
+        self.state = loadagent(tx, self.id, "Agent")
+        self.mobility = self.state.get("mob")
+        self.energy = self.state.get("energy")
+        self.confidence = self.state.get("conf")
+        self.mobility_resources = self.state.get("mob_res")
+        self.confidence_resources = self.state.get("conf_res")
+        self.wellbeing = self.state.get("wellbeing")
+        self.referral = self.state.get("referral")
+
+    def stage(self, prop, value):
+        """
+        Records a change to one of the agents properties. Changes are held until the agent is flushed so that repeated
+        writes to the same property within a move reach the database only once.
+
+        :param prop: name of the agent property
+        :param value: new value of the property
+
+        :return: None
+        """
+        self.dirty[prop] = value
+
+    def record(self, event, time):
+        """
+        Adds an entry to the agents log. Entries are appended to the log in the database when the agent is flushed.
+
+        :param event: name of the event
+        :param time: integer timestep of the event
+
+        :return: None
+        """
+        self.events.append((event, time))
+
+    def flush(self, tx):
+        """
+        Writes all staged property changes and new log entries to the database in one query and clears the buffer.
+
+        :param tx: neo4j database write transaction
+
+        :return: None
+        """
+        saveagent(tx, self.id, self.dirty, self.events)
+        self.dirty = {}
+        self.events = []
+
     def perception(self, tx, perc):
         """
         Fall agent perception function. Filters based on agent having sufficient energy for edge and end node.
@@ -516,8 +690,7 @@ class FallAgent(MobileAgent):
             edges = [self.view]
         # filter out options requiring too much energy
         valid_edges = []
-        self.mobility = intf.getnodevalue(tx, self.id, "mob", "Agent")
-        self.energy = intf.getnodevalue(tx, self.id, "energy", "Agent")
+        self.hydrate(tx)
         self.current_energy = self.energy
         if len(self.view) > 1:
             for edge in edges:
@@ -547,12 +720,8 @@ class FallAgent(MobileAgent):
         super(FallAgent, self).choose(tx, perc)
         # filter out options where the agent does not reach the effort threshold
         options = []
-        self.confidence = intf.getnodevalue(tx, self.id, "conf", "Agent")
-        self.mobility_resources = intf.getnodevalue(tx, self.id, "mob_res", "Agent")
-        self.confidence_resources = intf.getnodevalue(tx, self.id, "conf_res", "Agent")
-        self.log = intf.getnodevalue(tx, self.id, "log", "Agent")
-        self.wellbeing = intf.getnodevalue(tx, self.id, "wellbeing", "Agent")
-        self.referral = intf.getnodevalue(tx, self.id, "referral", "Agent")
+        if self.state is None:
+            self.hydrate(tx)
         if len(self.view) < 2:
             if type(self.view) == list and self.view:
                 choice = self.view[0]
@@ -587,64 +756,52 @@ class FallAgent(MobileAgent):
         :return: None
         """
         super(FallAgent, self).learn(tx, choice)
+        rng = agentrandom(tx, self.id)
         # modify mob, conf, res and energy based on new node
         if self.fall and self.fall != "Mild":
             if self.wellbeing != "Fallen":
                 self.wellbeing = "Fallen"
-                intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                clock = tx.run("MATCH (a:Clock) "
-                               "RETURN a.time").values()[0][0]
-                self.log = self.log + ", (Fallen, " + str(clock) + ")"
+                self.stage("wellbeing", self.wellbeing)
+                self.record("Fallen", currenttime(tx))
         if "modm" in choice.end_node:
-            self.mobility = self.positive(npr.normal(choice.end_node["modm"], 0.05) + self.mobility)
-            intf.updateagent(tx, self.id, "mob", self.mobility)
+            self.mobility = self.positive(rng.normal(choice.end_node["modm"], 0.05) + self.mobility)
+            self.stage("mob", self.mobility)
             # check for updates to wellbeing and log any changes
             if self.mobility == 0:
                 if self.wellbeing != "Fallen":
                     self.wellbeing = "Fallen"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (Fallen, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("Fallen", currenttime(tx))
             elif self.mobility > 1:
                 if self.wellbeing != "Healthy":
                     self.wellbeing = "Healthy"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (Healthy, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("Healthy", currenttime(tx))
             elif self.mobility <= 1:
                 if self.wellbeing == "Healthy":
                     self.wellbeing = "At risk"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (At risk, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("At risk", currenttime(tx))
         if "modc" in choice.end_node:
-            self.confidence = self.positive(npr.normal(choice.end_node["modc"], 0.05) + self.confidence)
-            intf.updateagent(tx, self.id, "conf", self.confidence)
+            self.confidence = self.positive(rng.normal(choice.end_node["modc"], 0.05) + self.confidence)
+            self.stage("conf", self.confidence)
         if "modrc" in choice.end_node:
-            self.confidence_resources = self.positive(npr.normal(choice.end_node["modrc"], 0.05) +
+            self.confidence_resources = self.positive(rng.normal(choice.end_node["modrc"], 0.05) +
                                                       self.confidence_resources)
-            intf.updateagent(tx, self.id, "conf_res", self.confidence_resources)
+            self.stage("conf_res", self.confidence_resources)
         if "modrm" in choice.end_node:
-            self.mobility_resources = self.positive(npr.normal(choice.end_node["modrm"], 0.05) + self.mobility)
-            intf.updateagent(tx, self.id, "mob_res", self.mobility_resources)
+            self.mobility_resources = self.positive(rng.normal(choice.end_node["modrm"], 0.05) + self.mobility)
+            self.stage("mob_res", self.mobility_resources)
         if "energy" in choice.end_node:
-            self.current_energy = npr.normal(choice.end_node["energy"], 0.05) + self.current_energy
-            intf.updateagent(tx, self.id, "energy", self.current_energy)
+            self.current_energy = rng.normal(choice.end_node["energy"], 0.05) + self.current_energy
+            self.stage("energy", self.current_energy)
         # log going into care
         if choice.end_node["name"] == "Care":
-            clock = tx.run("MATCH (a:Clock) "
-                           "RETURN a.time").values()[0][0]
-            self.log = self.log + ", (Care, " + str(clock) + ")"
-        if "cap" in choice.end_node.keys():
-            intf.updatenode(tx, choice.end_node["name"], "load", choice.end_node["load"] + 1, "name")
+            self.record("Care", currenttime(tx))
+        topology.moveload(tx, choice.start_node["name"], choice.end_node["name"])
         if self.view[0]["name"] == "Hos" and choice.end_node["name"] != "Hos":
-            clock = tx.run("MATCH (a:Clock) "
-                           "RETURN a.time").values()[0][0]
-            self.log = self.log + ", (Discharged, " + str(clock) + ")"
-        intf.updateagent(tx, self.id, "log", str(self.log))
+            self.record("Discharged", currenttime(tx))
+        self.flush(tx)
 
     def payment(self, tx):
         """
@@ -656,38 +813,33 @@ class FallAgent(MobileAgent):
         :return: None
         """
         super(FallAgent, self).payment(tx)
+        rng = agentrandom(tx, self.id)
         # Deduct energy used on edge
         if "energy" in self.choice.keys():
-            self.current_energy = npr.normal(self.choice["energy"], 0.05) + self.current_energy
-            intf.updateagent(tx, self.id, "energy", self.current_energy)
+            self.current_energy = rng.normal(self.choice["energy"], 0.05) + self.current_energy
+            self.stage("energy", self.current_energy)
         # mod variables based on edges
         if "modm" in self.choice:
-            self.mobility = self.positive(npr.normal(self.choice["modm"], 0.05) + self.mobility)
-            intf.updateagent(tx, self.id, "mob", self.mobility)
+            self.mobility = self.positive(rng.normal(self.choice["modm"], 0.05) + self.mobility)
+            self.stage("mob", self.mobility)
             if self.mobility == 0:
                 if self.wellbeing != "Fallen":
                     self.wellbeing = "Fallen"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (Fallen, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("Fallen", currenttime(tx))
             elif self.mobility > 1:
                 if self.wellbeing != "Healthy":
                     self.wellbeing = "Healthy"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (Healthy, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("Healthy", currenttime(tx))
             elif self.mobility <= 1:
                 if self.wellbeing == "Healthy":
                     self.wellbeing = "At risk"
-                    intf.updateagent(tx, self.id, "wellbeing", self.wellbeing)
-                    clock = tx.run("MATCH (a:Clock) "
-                                   "RETURN a.time").values()[0][0]
-                    self.log = self.log + ", (At risk, " + str(clock) + ")"
+                    self.stage("wellbeing", self.wellbeing)
+                    self.record("At risk", currenttime(tx))
         if "modc" in self.choice:
-            self.confidence = self.positive(npr.normal(self.choice["modc"], 0.05) + self.confidence)
-            intf.updateagent(tx, self.id, "conf", self.confidence)
+            self.confidence = self.positive(rng.normal(self.choice["modc"], 0.05) + self.confidence)
+            self.stage("conf", self.confidence)
 
     def move(self, tx, perc):
         """
@@ -699,17 +851,20 @@ class FallAgent(MobileAgent):
 
         :return: Node Agent has moved to
         """
+        self.state = None
+        self.dirty = {}
         super(FallAgent, self).move(tx, perc)
+        self.flush(tx)
 
-    def logging(self, tx, entry):
+    def logging(self, tx, event, time):
         """
-        Utility function for adding information to the agents log of its activities
+        Utility function for adding information to the agents log of its activities, the entry is appended on the
+        database server without reading the existing log.
 
         :param tx: neo4j database write transaction
-        :param entry: String to be added to the log
+        :param event: name of the event to be added to the log
+        :param time: integer timestep of the event
 
         :return: None
         """
-        self.log = intf.getnodevalue(tx, self.id, "log", "Agent")
-        self.log = self.log + ", (" + entry + ")"
-        intf.updateagent(tx, self.id, "log", str(self.log))
+        appendlog(tx, self.id, [event], [time])
@@ -0,0 +1,194 @@
+import gzip
+import logging
+import os
+import pickle
+import numpy.random as npr
+import specification
+from FallModel.Fall_clock import currenttime
+from FallModel.Fall_queue import EventQueue
+from FallModel.Fall_random import streams
+from FallModel.Fall_topology import topology
+
+VERSION = 3
+NODE_FIELDS = ("runname", "agents", "interval", "mild", "moderate", "severe")
+
+
+def checkpointpath(role, runname):
+    """
+    Utility function, gives the checkpoint file of a process of a run in the specifications save directory.
+
+    :param role: name of the process, "Flow" or "Balancer"
+    :param runname: name of the run
+
+    :return: file path
+    """
+    return specification.savedirectory + "Checkpoint" + role + "_" + str(runname) + ".p.gz"
+
+
+def writecheckpoint(path, time, state):
+    """
+    Utility function, writes a checkpoint of the in memory state of a process. The state is pickled and compressed
+    together with the random stream seed, and the file is replaced in one step so an interrupted write leaves the
+    previous checkpoint in place.
+
+    :param path: checkpoint file
+    :param time: timestep the checkpoint was taken at
+    :param state: picklable state of the process
+
+    :return: None
+    """
+    rng = {"entropy": streams.root.entropy if streams.root is not None else None, "global": npr.get_state()}
+    temp = path + ".tmp"
+    with gzip.open(temp, "wb") as file:
+        pickle.dump({"version": VERSION, "time": time, "state": state, "rng": rng}, file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, path)
+
+
+def readcheckpoint(path):
+    """
+    Utility function, reads a checkpoint and restores the random stream seed it was written with.
+
+    :param path: checkpoint file
+
+    :return: (timestep of the checkpoint, state of the process)
+    """
+    with gzip.open(path, "rb") as file:
+        checkpoint = pickle.load(file)
+    if checkpoint["version"] != VERSION:
+        raise ValueError("Unsupported checkpoint version " + str(checkpoint["version"]))
+    if checkpoint["rng"]["entropy"] is not None:
+        streams.seed(checkpoint["rng"]["entropy"])
+    npr.set_state(checkpoint["rng"]["global"])
+    return checkpoint["time"], checkpoint["state"]
+
+
+def destinationname(edge):
+    """
+    Utility function, gives the name of the node a destination edge leads to. Database edges can not be pickled so
+    queued destinations are held in checkpoints by name.
+
+    :param edge: REACHES edge, or None
+
+    :return: name of the end node of the edge, None if there is no edge
+    """
+    return edge.end_node["name"] if edge is not None else None
+
+
+def destinationedge(tx, name, destination):
+    """
+    Utility function, finds the edge from a node to a destination named in a checkpoint.
+
+    :param tx: neo4j database transaction
+    :param name: name of the node the edge leaves
+    :param destination: name of the node the edge leads to, or None
+
+    :return: REACHES edge, None if there is no destination
+    """
+    if destination is None:
+        return None
+    edges = [edge for edge in topology.outgoing(tx, name) if edge.end_node["name"] == destination]
+    if not edges:
+        raise ValueError("No edge from " + name + " to " + destination + " for checkpointed destination")
+    return edges[0]
+
+
+def nodestate(nodes):
+    """
+    Utility function, collects the in memory state of the nodes run by the Flow process, their queues, pending hospital
+    admissions and the Care node totals. Queue entries are held as (<slot>, <agent id>, <destination name>,
+    <duration>) and admissions as (<agent id>, <mean stay>, <destination name>, <admission time>).
+
+    :param nodes: list of nodes from the specification
+
+    :return: dictionary of node name to node state
+    """
+    state = {}
+    for node in nodes:
+        values = {field: getattr(node, field) for field in NODE_FIELDS if getattr(node, field, None) is not None}
+        queue = getattr(node, "queue", None)
+        if isinstance(queue, EventQueue):
+            values["queue"] = {"visited": queue.visited,
+                               "entries": [(slot, agent_id, destinationname(dest), duration)
+                                           for slot, entries in queue.items()
+                                           for agent_id, (dest, duration) in entries.items()]}
+        admissions = getattr(node, "admissions", None)
+        if admissions is not None:
+            values["admissions"] = [(agent_id, mean, destinationname(dest), admitted)
+                                    for agent_id, mean, dest, admitted in admissions]
+        if values:
+            state[node.name] = values
+    return state
+
+
+def restorenodes(tx, nodes, state):
+    """
+    Utility function, sets the state returned by nodestate back on to the nodes, resolving the queued destinations to
+    the edges of the network.
+
+    :param tx: neo4j database transaction
+    :param nodes: list of nodes from the specification
+    :param state: dictionary of node name to node state
+
+    :return: None
+    """
+    for node in nodes:
+        values = dict(state.get(node.name, {}))
+        queue = values.pop("queue", None)
+        if queue is not None:
+            node.queue = EventQueue()
+            for slot, agent_id, destination, duration in queue["entries"]:
+                node.queue.push(slot, agent_id, (destinationedge(tx, node.name, destination), duration))
+            node.queue.visited = queue["visited"]
+        admissions = values.pop("admissions", None)
+        if admissions is not None:
+            node.admissions = [(agent_id, mean, destinationedge(tx, node.name, destination), admitted)
+                               for agent_id, mean, destination, admitted in admissions]
+        for field, value in values.items():
+            setattr(node, field, value)
+
+
+class Checkpointer:
+    """
+    Writes checkpoints of a process every specification.checkpoint timesteps and, if specification.resume is set,
+    restores the latest checkpoint the first time it is stepped. The database must be restored from a snapshot taken
+    at the same timestep, only the in memory state of the process is held in the checkpoint. Checkpoints are off unless
+    specification.checkpoint is set.
+    """
+
+    def __init__(self, role, capture, restore):
+        """
+        :param role: name of the process, used in the file name
+        :param capture: function returning the picklable state of the process
+        :param restore: function taking a transaction and a captured state and setting the state back on the process
+        """
+        self.role = role
+        self.capture = capture
+        self.restore = restore
+        self.resumed = False
+        self.last = None
+
+    def step(self, tx, runname):
+        """
+        Called once per timestep by the process, restores or writes a checkpoint when one is due.
+
+        :param tx: neo4j database transaction
+        :param runname: name of the run
+
+        :return: None
+        """
+        time = currenttime(tx)
+        path = checkpointpath(self.role, runname)
+        if not self.resumed:
+            self.resumed = True
+            if getattr(specification, "resume", False) and os.path.exists(path):
+                (saved, state) = readcheckpoint(path)
+                if saved != time:
+                    logging.warning(self.role + " checkpoint taken at " + str(saved) + " restored at " + str(time))
+                self.restore(tx, state)
+                self.last = time
+                return
+        every = getattr(specification, "checkpoint", None)
+        if every and time != self.last and time % every == 0:
+            writecheckpoint(path, time, self.capture())
+            self.last = time
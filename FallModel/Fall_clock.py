@@ -0,0 +1,43 @@
+import weakref
+import SPmodelling.Interface as intf
+
+
+class TickClock:
+    """
+    Transaction scoped cache of the simulation clock. The time is read from the database once per transaction and
+    served from memory for every later request in that transaction, a new transaction always reads the clock again.
+    The Flow process runs each node in its own transaction and advances the clock in a transaction of its own, so the
+    cached time is never older than the tick it is read in. Only a weak reference to the transaction is kept, the cache
+    does not keep a closed transaction alive.
+    """
+
+    def __init__(self):
+        self.tx = None
+        self.time = None
+
+    def gettime(self, tx):
+        """
+        Returns the current time, only querying the database the first time it is asked for in a transaction.
+
+        :param tx: neo4j database transaction
+
+        :return: current timestep
+        """
+        if self.tx is None or self.tx() is not tx or self.time is None:
+            self.time = intf.gettime(tx)
+            self.tx = weakref.ref(tx)
+        return self.time
+
+
+clock = TickClock()
+
+
+def currenttime(tx):
+    """
+    Utility function, returns the current time from the shared tick clock.
+
+    :param tx: neo4j database transaction
+
+    :return: current timestep
+    """
+    return clock.gettime(tx)
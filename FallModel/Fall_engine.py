@@ -0,0 +1,643 @@
+"""
+Population engine for the version 0 FallAgent model, see PopulationEngine.
+
+Given a RandomStreams the engine draws from the streams the graph backed path uses, with the same keys and in the same
+order within each stream: the population stream for new agents, each agent's node stream for its fall checks and its
+Home changes and predictions, the Hospital stream for stays and discharges, and each agent's own stream for its payment
+and learn changes. An agent in the same state as in a graph backed run, with the same id at the same timestep, then
+makes the same transition. The two paths still differ where the graph backed path depends on SPmodelling or on the
+database:
+
+- Ids and creation. The engine gives new agents ids in creation order and creates them at the end of each tick to
+  keep the population size, the Population process decides both in the graph backed path.
+- Capacity. Agents at a node choose together and those whose choice is already full choose again, in array order. In
+  the graph backed path the agents that get the last places depend on the order SPmodelling moves them in.
+- Referrals. The graph backed path stores referrals as the strings "false", "True" and "False" as well as True, and
+  every one of them is truthy, so every agent there holds a referral from its creation. The engine reproduces this
+  rather than the rule the strings describe, referral edges never turn an agent away.
+- Waiting. An agent that cannot move is ready again next tick, where the graph backed path leaves it to SPmodelling.
+- Node modifiers. The Home and Hospital changes are read from the network from the start, the graph backed nodes use
+  their defaults until they first read them.
+- New agent wellbeing. The engine holds new agents as at risk, the graph backed path stores their wellbeing as
+  "'At risk'" with the quotes. The Monitor does not count them and edge wellbeing limits do not match them there, so
+  snapshot counts them as at risk and an "At risk" limit lets them through only in the engine.
+
+Without streams every draw comes from one generator seeded with the engine seed. Runs are still reproducible, and are
+much faster, but do not match a graph backed run agent by agent.
+"""
+import numpy as np
+from FallModel.Fall_hazard import predictfalls, fallcheck
+from FallModel.Fall_random import AGENT, NODE, POPULATION
+
+WELLBEING = ("Healthy", "At risk", "Fallen")
+HEALTHY = 0
+AT_RISK = 1
+FALLEN = 2
+NODE_ORDER = ["Care", "Hos", "Social", "GP", "Intervention", "InterventionOpen", "Home"]
+
+
+def _value(props, key):
+    """
+    Utility function, reads an optional numeric property, absent values are returned as NaN.
+
+    :param props: dictionary of node or edge properties
+    :param key: property name
+
+    :return: float value or NaN
+    """
+    value = props.get(key)
+    if value is None:
+        return np.nan
+    return float(value)
+
+
+def _allowed(props):
+    """
+    Utility function, converts the allowed property of an edge to a mask over the wellbeing codes. Edges without the
+    property allow every agent, string limits match in the same way as the node perception filter.
+
+    :param props: dictionary of edge properties
+
+    :return: boolean array indexed by wellbeing code
+    """
+    allowed = props.get("allowed")
+    if allowed is None:
+        return np.ones(len(WELLBEING), dtype=bool)
+    return np.array([wellbeing in allowed for wellbeing in WELLBEING])
+
+
+class Topology:
+    """
+    Static description of the node network in array form. Node and edge properties are held in contiguous arrays
+    indexed by node and edge number, missing properties are NaN so the "property in node" checks of the agent rules
+    become masks.
+    """
+
+    def __init__(self, nodes, edges):
+        """
+        :param nodes: list of node property dictionaries, each with a name
+        :param edges: list of tuples (<start node name>, <end node name>, <edge property dictionary>)
+        """
+        self.names = [node["name"] for node in nodes]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.energy = np.array([_value(node, "energy") for node in nodes])
+        self.modm = np.array([_value(node, "modm") for node in nodes])
+        self.modc = np.array([_value(node, "modc") for node in nodes])
+        self.modrc = np.array([_value(node, "modrc") for node in nodes])
+        self.modrm = np.array([_value(node, "modrm") for node in nodes])
+        self.cap = np.array([np.inf if node.get("cap") is None else float(node["cap"]) for node in nodes])
+        self.load = np.array([float(node.get("load") or 0) for node in nodes])
+        self.start = np.array([self.index[start] for start, _, _ in edges], dtype=int)
+        self.end = np.array([self.index[end] for _, end, _ in edges], dtype=int)
+        self.effort = np.array([_value(props, "effort") for _, _, props in edges])
+        self.mobility = np.array([_value(props, "mobility") for _, _, props in edges])
+        self.confidence = np.array([_value(props, "confidence") for _, _, props in edges])
+        self.worth = np.array([_value(props, "worth") for _, _, props in edges])
+        self.edge_energy = np.array([_value(props, "energy") for _, _, props in edges])
+        self.edge_modm = np.array([_value(props, "modm") for _, _, props in edges])
+        self.edge_modc = np.array([_value(props, "modc") for _, _, props in edges])
+        self.allowed = np.array([_allowed(props) for _, _, props in edges]).reshape(len(edges), len(WELLBEING))
+        self.needsref = np.array([props.get("ref") == "True" for _, _, props in edges], dtype=bool)
+        self.out = [np.flatnonzero(self.start == i) for i in range(len(self.names))]
+
+    @classmethod
+    def fromspec(cls):
+        """
+        Builds the version 0 network described by the specification, the same network ResetV0 writes to the database.
+
+        :return: Topology
+        """
+        from FallModel.Fall_reset import v0nodes, v0edges
+        return cls(v0nodes(), v0edges())
+
+    @classmethod
+    def fromgraph(cls, tx):
+        """
+        Builds the topology from the network currently in the database using one query for nodes and one for edges.
+
+        :param tx: neo4j database transaction
+
+        :return: Topology
+        """
+        nodes = [record[0] for record in tx.run("MATCH (n:Node) RETURN properties(n)").values()]
+        edges = tx.run("MATCH (a:Node)-[r:REACHES]->(b:Node) RETURN a.name, b.name, properties(r)").values()
+        return cls(nodes, [tuple(edge) for edge in edges])
+
+    def node(self, name):
+        """
+        :param name: node name
+
+        :return: node number or -1 if the network has no node of that name
+        """
+        return self.index.get(name, -1)
+
+
+class PopulationEngine:
+    """
+    Optional engine running the FallAgent model on a population held as a struct of NumPy arrays rather than as agent
+    nodes in Neo4j. Each tick the nodes are visited in the Flow order and the node perception, agent perception, choose,
+    payment and learn rules are applied to every agent ready at the node at once as masks over an agents by out-edges
+    matrix. Queued nodes keep an integer ready time per agent in place of a queue dictionary.
+
+    The rules are those of the version 0 algorithms (FallAgent, HomeNodeV0, HosNodeV0, GPNode, InterventionNode and
+    CareNode). A fixed seed reproduces an engine run exactly. With streams an agent's transitions are those it would
+    make in the graph backed path, see the module documentation for where the two paths differ.
+    """
+
+    def __init__(self, topology, size, params=(0.8, 0.9, 1), seed=None, order=None, home=(-0.015, 0.3, -0.02),
+                 hos=(-0.1, 0.2, -0.05), streams=None):
+        """
+        :param topology: Topology of the network
+        :param size: population size, kept constant by replacing agents that leave through Care
+        :param params: [mobility, confidence, energy] means of the normal distributions new agents are drawn from
+        :param seed: (Optional) seed for the engines random generator
+        :param order: (Optional) list of node names in the order they are processed each tick
+        :param home: (mobility change, recovery rate, confidence change) defaults for the Home node
+        :param hos: (mobility change, recovery rate, confidence change) defaults for the Hospital node
+        :param streams: (Optional) RandomStreams to draw from with the keys of the graph backed path, all draws come
+         from the engines random generator if not given
+        """
+        self.topology = topology
+        self.size = size
+        self.params = params
+        self.rng = np.random.default_rng(seed)
+        self.streams = streams
+        self.order = [name for name in (order or NODE_ORDER) if name in topology.index]
+        self.home = self._nodechanges("Home", home)
+        self.hos = self._nodechanges("Hos", hos)
+        self.time = 0
+        self.alive = np.zeros(size, dtype=bool)
+        self.ids = np.zeros(size, dtype=np.int64)
+        self.nextid = 0
+        self.mob = np.zeros(size)
+        self.conf = np.zeros(size)
+        self.mob_res = np.zeros(size)
+        self.conf_res = np.zeros(size)
+        self.energy = np.zeros(size)
+        self.wellbeing = np.zeros(size, dtype=np.int8)
+        self.referral = np.zeros(size, dtype=bool)
+        self.loc = np.zeros(size, dtype=int)
+        self.ready = np.zeros(size, dtype=np.int64)
+        self.dest = np.full(size, -1, dtype=int)
+        self.duration = np.zeros(size)
+        self.admitted = np.full(size, -1, dtype=np.int64)
+        self.staymean = np.zeros(size)
+        self.created = np.zeros(size, dtype=np.int64)
+        self.carein = np.zeros(size, dtype=np.int64)
+        self.lastdischarge = np.full(size, np.nan)
+        self.falls = np.zeros((size, 3), dtype=np.int64)
+        self.exits = 0
+        self.interval = 0.0
+        self.exitfalls = np.zeros(3, dtype=np.int64)
+        self.spawn(np.arange(size))
+
+    def _nodechanges(self, name, defaults):
+        """
+        Reads the mobility change, recovery rate and confidence change of a queued node from its properties falling back
+        to the node defaults where the network does not set them.
+
+        :param name: node name
+        :param defaults: (mobility change, recovery rate, confidence change)
+
+        :return: (mobility change, recovery rate, confidence change)
+        """
+        node = self.topology.node(name)
+        if node < 0:
+            return defaults
+        values = (self.topology.modm[node], self.topology.energy[node], self.topology.modc[node])
+        return tuple(default if np.isnan(value) else value for value, default in zip(values, defaults))
+
+    def _stream(self, scope, *keys):
+        """
+        Returns the generator for a stream of the graph backed path at the current tick, or the engines generator
+        without streams.
+
+        :param scope: AGENT, NODE or POPULATION
+        :param keys: ids or names identifying the stream within the scope
+
+        :return: numpy random Generator
+        """
+        if self.streams is None:
+            return self.rng
+        return self.streams.generator(scope, self.time, *keys)
+
+    def _uniforms(self, name, agents):
+        """
+        Draws one uniform for each agent from its stream at a node, see noderandom.
+
+        :param name: node name
+        :param agents: array of agent indices
+
+        :return: array of draws
+        """
+        if self.streams is None:
+            return self.rng.random(len(agents))
+        return np.array([self._stream(NODE, name, agent_id).random() for agent_id in self.ids[agents]])
+
+    def _normals(self, agents, present):
+        """
+        Draws standard normals for the modifiers present for each agent, from each agent's own stream in column order,
+        see agentrandom.
+
+        :param agents: array of agent indices
+        :param present: agents by modifiers mask of the modifiers to draw for
+
+        :return: agents by modifiers array of draws, zero where no draw was made
+        """
+        normals = np.zeros(present.shape)
+        if self.streams is None:
+            normals[present] = self.rng.standard_normal(np.count_nonzero(present))
+        else:
+            for row, agent_id in enumerate(self.ids[agents]):
+                count = np.count_nonzero(present[row])
+                normals[row, present[row]] = self._stream(AGENT, agent_id).standard_normal(count)
+        return normals
+
+    def spawn(self, slots):
+        """
+        Generates new agents in the given array slots and starts them at the Home node, see FallAgent.generator.
+
+        :param slots: array of slot indices to fill
+
+        :return: None
+        """
+        n = len(slots)
+        if not n:
+            return
+        [mobility, confidence, energy] = self.params
+        # drawn for each agent in turn in the order of FallAgent.generator
+        draws = self._stream(POPULATION).normal([mobility, energy, confidence], 0.05, (n, 3))
+        (self.mob[slots], self.energy[slots], self.conf[slots]) = draws.T
+        self.ids[slots] = np.arange(self.nextid, self.nextid + n)
+        self.nextid = self.nextid + n
+        self.mob_res[slots] = 0
+        self.conf_res[slots] = 0
+        self.wellbeing[slots] = AT_RISK
+        # FallAgent.generator stores the referral as the string "false", which is truthy
+        self.referral[slots] = True
+        self.loc[slots] = self.topology.node("Home")
+        self.ready[slots] = self.time
+        self.dest[slots] = -1
+        self.duration[slots] = 0
+        self.admitted[slots] = -1
+        self.created[slots] = self.time
+        self.lastdischarge[slots] = np.nan
+        self.falls[slots] = 0
+        self.alive[slots] = True
+
+    def step(self):
+        """
+        Runs one tick: every node in turn processes the agents ready at it, then the population is topped back up and
+        the clock advanced.
+
+        :return: None
+        """
+        for name in self.order:
+            node = self.topology.index[name]
+            if name == "Care":
+                self._care(node)
+            elif name == "Hos":
+                self._hos(node)
+            elif name == "Home":
+                self._homenode(node)
+            else:
+                agents = np.flatnonzero(self.alive & (self.loc == node))
+                self._move(agents, node)
+                if np.isfinite(self.topology.cap[node]):
+                    self.topology.load[node] = np.count_nonzero(self.alive & (self.loc == node))
+        self.spawn(np.flatnonzero(~self.alive))
+        self.time = self.time + 1
+
+    def run(self, ticks, callback=None):
+        """
+        Runs the engine for a number of ticks.
+
+        :param ticks: number of ticks to run
+        :param callback: (Optional) called with the engine after every tick, for monitoring or balancing
+
+        :return: None
+        """
+        for _ in range(ticks):
+            self.step()
+            if callback:
+                callback(self)
+
+    def _care(self, node):
+        """
+        Sink node, records the interval and falls of agents arriving in Care and removes them, see CareNode.
+
+        :param node: node number of Care
+
+        :return: None
+        """
+        agents = np.flatnonzero(self.alive & (self.loc == node))
+        if len(agents):
+            intervals = self.carein[agents] - self.created[agents]
+            self.interval = (self.interval * self.exits + intervals.sum()) / (self.exits + len(agents))
+            self.exits = self.exits + len(agents)
+        self.exitfalls = self.exitfalls + self.falls[agents].sum(axis=0)
+        self.alive[agents] = False
+
+    def _duechanges(self, agents, changes, name, peragent):
+        """
+        Applies the changes from time spent at a queued node to agents leaving it after a timed wait, see
+        HomeNodeV0.agentsready and HosNodeV0.agentsready.
+
+        :param agents: array of agent indices ready to leave
+        :param changes: (mobility change, recovery rate, confidence change) of the node
+        :param name: node name
+        :param peragent: draw from each agent's stream at the node as Home does, rather than from the node stream in
+         agent id order as Hospital does
+
+        :return: array of the agents that had a timed wait
+        """
+        (mobchange, recoverrate, confchange) = changes
+        waited = agents[self.duration[agents] > 0]
+        waited = waited[np.argsort(self.ids[waited], kind="stable")]
+        if len(waited):
+            duration = self.duration[waited]
+            if peragent and self.streams is not None:
+                draws = np.array([self._stream(NODE, name, agent_id).normal([wait * mobchange, wait * confchange], 1)
+                                  for agent_id, wait in zip(self.ids[waited], duration)])
+                (self.mob[waited], self.conf[waited]) = draws.T
+            else:
+                rng = self._stream(NODE, name)
+                self.mob[waited] = rng.normal(duration * mobchange, 1)
+                self.conf[waited] = rng.normal(duration * confchange, 1)
+            self.energy[waited] = duration * recoverrate
+        return waited
+
+    def _homenode(self, node):
+        """
+        Processes the agents due to leave Home this tick.
+
+        :param node: node number of Home
+
+        :return: None
+        """
+        agents = np.flatnonzero(self.alive & (self.loc == node) & (self.ready <= self.time))
+        self._duechanges(agents, self.home, "Home", True)
+        self._move(agents, node)
+
+    def _hos(self, node):
+        """
+        Draws the stays of the agents admitted to Hospital since it was last processed, then processes the agents due
+        to be discharged this tick, giving them a referral and recording the discharge, see admitagents and
+        dischargeagents.
+
+        :param node: node number of Hospital
+
+        :return: None
+        """
+        admitted = np.flatnonzero(self.alive & (self.loc == node) & (self.admitted >= 0))
+        admitted = admitted[np.argsort(self.ids[admitted], kind="stable")]
+        stay = self._stream(NODE, "Hos").poisson(np.maximum(self.staymean[admitted], 0))
+        self.duration[admitted] = stay
+        self.ready[admitted] = np.maximum(self.admitted[admitted] + stay, self.time)
+        self.admitted[admitted] = -1
+        agents = np.flatnonzero(self.alive & (self.loc == node) & (self.ready <= self.time) & (self.admitted < 0))
+        waited = self._duechanges(agents, self.hos, "Hos", False)
+        self.referral[waited] = True
+        self.lastdischarge[waited] = self.time
+        self._move(agents, node)
+
+    def _updatewellbeing(self, agents):
+        """
+        Updates wellbeing after a change in mobility.
+
+        :param agents: array of agent indices whose mobility changed
+
+        :return: None
+        """
+        mob = self.mob[agents]
+        self.wellbeing[agents[mob == 0]] = FALLEN
+        self.wellbeing[agents[mob > 1]] = HEALTHY
+        risk = agents[(mob > 0) & (mob <= 1)]
+        self.wellbeing[risk[self.wellbeing[risk] == HEALTHY]] = AT_RISK
+
+    @staticmethod
+    def _modify(agents, means, normals, target, floor=True, base=None):
+        """
+        Adds a normal draw centred on an optional modifier to an agent value, agents whose modifier is absent are left
+        unchanged.
+
+        :param agents: array of agent indices
+        :param means: array of modifier values, NaN where absent
+        :param normals: array of standard normal draws for each agent, see _normals
+        :param target: agent value array to modify
+        :param floor: floor the result at zero
+        :param base: (Optional) agent value array the draw is added to, target if not given
+
+        :return: array of the agents that were modified
+        """
+        present = ~np.isnan(means)
+        changed = agents[present]
+        if len(changed):
+            value = means[present] + 0.05 * normals[present] + (target if base is None else base)[changed]
+            target[changed] = np.maximum(value, 0) if floor else value
+        return changed
+
+    def _move(self, agents, node):
+        """
+        Moves every given agent from the node, applying node perception, agent perception, choose, payment and learn to
+        all of them at once.
+
+        :param agents: array of agent indices at the node
+        :param node: node number
+
+        :return: None
+        """
+        if not len(agents):
+            return
+        top = self.topology
+        names = top.names
+        edges = top.out[node]
+        ends = top.end[edges]
+        mob = self.mob[agents]
+        # Node perception: capacity, wellbeing limits and referrals
+        valid = np.broadcast_to(top.load[ends] < top.cap[ends], (len(agents), len(edges))).copy()
+        valid &= top.allowed[edges][:, self.wellbeing[agents]].T
+        valid &= ~top.needsref[edges] | self.referral[agents][:, None]
+        forced = self.dest[agents] >= 0
+        valid[forced] = edges == self.dest[agents][forced][:, None]
+        reach = {name: (valid & (ends == top.node(name))).any(axis=1) for name in ("Care", "Hos", "GP", "Home")}
+        care = reach["Care"] & (mob <= 0)
+        valid[care] &= ends == top.node("Care")
+        check = ~care & reach["Hos"] & reach["GP"]
+        if check.any():
+            kind = np.full(len(agents), -1)
+            kind[check] = fallcheck(mob[check], self._uniforms(names[node], agents[check]))
+            (severe, moderate, mild) = (kind == 2, kind == 1, kind == 0)
+            valid[severe] &= ends == top.node("Hos")
+            valid[moderate] &= ends == top.node("GP")
+            self.wellbeing[agents[severe | moderate | mild]] = FALLEN
+            self.falls[agents[severe], 2] += 1
+            self.falls[agents[moderate], 1] += 1
+            self.falls[agents[mild], 0] += 1
+        if names[node] == "GP":
+            valid &= np.where((mob < 0.6)[:, None], ends == top.node("Hos"), ends == top.node("Home"))
+            self.referral[agents[(mob >= 0.6) & (mob < 0.85)]] = True
+        elif names[node].startswith("Intervention"):
+            # InterventionNode stores the referral as the string "True" or "False", both of which are truthy
+            self.referral[agents] = True
+        # Agents choose in turn, those whose choice of a capacitated node is already full choose again without it
+        choice = np.full(len(agents), -1)
+        pending = np.ones(len(agents), dtype=bool)
+        taken = np.zeros(len(names))
+        while pending.any():
+            rows = np.flatnonzero(pending)
+            choice[rows] = self._choose(agents[rows], valid[rows], edges)
+            pending[:] = False
+            picked = rows[choice[rows] >= 0]
+            for full in np.flatnonzero(np.isfinite(top.cap)):
+                chosen = picked[ends[choice[picked]] == full]
+                room = int(max(top.cap[full] - top.load[full] - taken[full], 0))
+                taken[full] = taken[full] + min(room, len(chosen))
+                rejected = chosen[room:]
+                valid[np.ix_(rejected, ends == full)] = False
+                pending[rejected] = True
+        moving = choice >= 0
+        stuck = agents[~moving]
+        self.ready[stuck] = self.time + 1
+        self.dest[stuck] = -1
+        agents = agents[moving]
+        chosen = edges[choice[moving]]
+        destination = top.end[chosen]
+        # Payment and learn modifiers in the order FallAgent draws for them
+        means = np.stack([top.edge_energy[chosen], top.edge_modm[chosen], top.edge_modc[chosen], top.modm[destination],
+                          top.modc[destination], top.modrc[destination], top.modrm[destination],
+                          top.energy[destination]], axis=1)
+        normals = self._normals(agents, ~np.isnan(means))
+        # Payment: edge energy, mobility and confidence modifiers
+        self._modify(agents, means[:, 0], normals[:, 0], self.energy, floor=False)
+        self._updatewellbeing(self._modify(agents, means[:, 1], normals[:, 1], self.mob))
+        self._modify(agents, means[:, 2], normals[:, 2], self.conf)
+        # Move
+        self.loc[agents] = destination
+        self.dest[agents] = -1
+        self.duration[agents] = 0
+        np.add.at(top.load, destination[np.isfinite(top.cap[destination])], 1)
+        # Learn: end node modifiers
+        self._updatewellbeing(self._modify(agents, means[:, 3], normals[:, 3], self.mob))
+        self._modify(agents, means[:, 4], normals[:, 4], self.conf)
+        self._modify(agents, means[:, 5], normals[:, 5], self.conf_res)
+        self._modify(agents, means[:, 6], normals[:, 6], self.mob_res, base=self.mob)
+        self._modify(agents, means[:, 7], normals[:, 7], self.energy, floor=False)
+        self.carein[agents[destination == top.node("Care")]] = self.time
+        # Prediction at queued nodes
+        self._predicthome(agents[destination == top.node("Home")])
+        self._predicthos(agents[destination == top.node("Hos")])
+
+    def _choose(self, agents, valid, edges):
+        """
+        Agent perception and choose for a set of agents at the same node. Agents with more than one option drop those
+        they lack the energy for, then those beyond their effort, and take the remaining edge of highest worth.
+
+        :param agents: array of agent indices
+        :param valid: agents by out-edges mask of the options left after node perception
+        :param edges: array of the nodes out-edges
+
+        :return: array of the chosen column of each agent, -1 where the agent has no option
+        """
+        top = self.topology
+        ends = top.end[edges]
+        mob = self.mob[agents]
+        # Agent perception: drop options the agent lacks the energy for when it has a choice
+        cost = np.nan_to_num(top.edge_energy[edges]) + np.nan_to_num(top.energy[ends])
+        affordable = ~np.isin(ends, [top.node("Care"), top.node("GP"), top.node("Hos")])
+        affordable = affordable & (self.energy[agents][:, None] > -cost)
+        several = valid.sum(axis=1) > 1
+        valid[several] &= affordable[several]
+        # Choose: effort threshold then highest worth when the agent has a choice
+        several = valid.sum(axis=1) > 1
+        reachable = top.mobility[edges] * (mob + self.conf[agents] * self.mob_res[agents])[:, None] + \
+            top.confidence[edges] * (self.conf[agents] + mob * self.conf_res[agents])[:, None]
+        valid[several] &= (top.effort[edges] <= reachable)[several]
+        worth = np.where(valid & ~np.isnan(top.worth[edges]), top.worth[edges], -np.inf)
+        choice = np.where(np.isfinite(worth).any(axis=1), worth.argmax(axis=1), valid.argmax(axis=1))
+        return np.where(valid.any(axis=1), choice, -1)
+
+    def _predicthome(self, agents):
+        """
+        Predicts when agents arriving Home will next act and whether they fall first, see HomeNodeV0.agentprediction.
+        Agents with the energy to act leave next tick, others wait to recover unless a moderate or severe fall comes
+        first and sends them to the GP or Hospital.
+
+        :param agents: array of agent indices arriving at Home
+
+        :return: None
+        """
+        if not len(agents):
+            return
+        top = self.topology
+        home = top.node("Home")
+        edges = top.out[home]
+        energies = np.concatenate([top.edge_energy[edges], top.energy[top.end[edges]]])
+        # as TopologyCache.minenergy, requirements of zero are not counted
+        minenergy = np.min(energies[~np.isnan(energies) & (energies != 0)])
+        (mobchange, recoverrate, _) = self.home
+        self.ready[agents] = self.time + 1
+        self.dest[agents] = -1
+        self.duration[agents] = 0
+        tired = agents[self.energy[agents] < minenergy]
+        if not len(tired):
+            return
+        recoverytime = (minenergy - self.energy[tired]) / recoverrate
+        if self.streams is None:
+            (falltime, falltype) = predictfalls(self.mob[tired], mobchange, self.rng)
+        else:
+            predictions = [predictfalls(self.mob[[agent]], mobchange, self._stream(NODE, "Home", self.ids[agent]))
+                           for agent in tired]
+            falltime = np.concatenate([time for time, _ in predictions])
+            falltype = np.concatenate([kind for _, kind in predictions])
+        falling = (falltime < recoverytime) & (falltype != 0)
+        self.wellbeing[tired[falling | (falltype == 0)]] = FALLEN
+        self.falls[tired, falltype] += falling | (falltype == 0)
+        for falls, name in ((falling & (falltype == 2), "Hos"), (falling & (falltype == 1), "GP")):
+            edge = edges[top.end[edges] == top.node(name)]
+            if len(edge):
+                self.dest[tired[falls]] = edge[0]
+        self.duration[tired] = np.where(falling, falltime, recoverytime)
+        self.ready[tired] = self.time + np.ceil(self.duration[tired]).astype(np.int64)
+
+    def _predicthos(self, agents):
+        """
+        Records the mean length of stay of agents admitted to Hospital, see HosNodeV0.agentprediction. The stays are
+        drawn when Hospital is next processed, see _hos.
+
+        :param agents: array of agent indices arriving at Hospital
+
+        :return: None
+        """
+        if not len(agents):
+            return
+        top = self.topology
+        hos = top.node("Hos")
+        mean = np.minimum(-9 * np.minimum(self.mob[agents], 1) + 14,
+                          -9 * (np.minimum(self.conf_res[agents], 1) + np.minimum(self.mob_res[agents], 1)) + 14)
+        home = top.out[hos][top.end[top.out[hos]] == top.node("Home")]
+        self.dest[agents] = home[0] if len(home) else -1
+        self.staymean[agents] = mean
+        self.admitted[agents] = self.time
+
+    def snapshot(self):
+        """
+        Summary statistics of the population, matching those recorded by the Monitor.
+
+        :return: dictionary of statistics
+        """
+        active = self.alive & (self.loc != self.topology.node("Care"))
+        counts = np.bincount(self.wellbeing[active], minlength=len(WELLBEING))
+        intervention = self.alive & (self.loc == self.topology.node("Intervention")) & ~np.isnan(self.lastdischarge)
+        gaps = self.time - self.lastdischarge[intervention]
+        if self.exits:
+            falls = self.exitfalls[::-1] / self.exits
+        else:
+            falls = np.zeros(3)
+        return {"time": self.time,
+                "severe": falls[0], "moderate": falls[1], "mild": falls[2],
+                "intervention_interval": gaps.mean() if len(gaps) else None,
+                "system_interval": self.interval,
+                "healthy": counts[HEALTHY] / max(active.sum(), 1),
+                "at_risk": counts[AT_RISK] / max(active.sum(), 1),
+                "fallen": counts[FALLEN] / max(active.sum(), 1)}
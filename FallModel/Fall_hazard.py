@@ -0,0 +1,70 @@
+import numpy as np
+import numpy.random as npr
+
+FALLTYPES = ["Mild", "Moderate", "Severe"]
+# mobility scaling and type code of the severe, moderate and mild fall draws, in the order ties are resolved
+SCALE = np.array([1, 0.9, 0.7])
+TYPES = np.array([2, 1, 0])
+
+
+def falldraw(mobility, rng=None):
+    """
+    Utility function, draws the time to the next fall of each type for an array of mobilities from poisson
+    distributions with means -log(1-mobility), -log(1-0.9*mobility) and -log(1-0.7*mobility) for severe, moderate and
+    mild falls, and returns the earliest. Ties go to the more severe fall. Means are floored at zero and capped where
+    the mobility reaches one.
+
+    :param mobility: array of mobilities
+    :param rng: (Optional) random generator, defaults to numpy.random
+
+    :return: (array of fall times, array of fall types 0 mild, 1 moderate, 2 severe)
+    """
+    rng = rng or npr
+    mobility = np.asarray(mobility, dtype=float)
+    rate = -np.log1p(-np.minimum(mobility[..., None] * SCALE, 1 - 1e-12))
+    sample = rng.poisson(np.maximum(rate, 0))
+    return sample.min(axis=-1), TYPES[sample.argmin(axis=-1)]
+
+
+def predictfalls(mobility, mobchange, rng=None):
+    """
+    Utility function, predicts the time and type of the next fall for an array of agents whose mobility changes by
+    mobchange each step. A fall is drawn for every step of the mobility path that could still come first, the step t
+    draw counting from t, and the earliest over the path is the prediction. This matches drawing step by step until the
+    current prediction is reached, see HomeNode.agentprediction, but makes all of the draws at once.
+
+    :param mobility: array of agent mobilities
+    :param mobchange: change in mobility per step
+    :param rng: (Optional) random generator, defaults to numpy.random
+
+    :return: (array of fall times, array of fall types 0 mild, 1 moderate, 2 severe)
+    """
+    mobility = np.asarray(mobility, dtype=float)
+    (falltime, falltype) = falldraw(mobility, rng)
+    horizon = int(falltime.max()) if len(falltime) else 0
+    if horizon > 1:
+        steps = np.arange(1, horizon)
+        (times, kinds) = falldraw(mobility[:, None] + steps * mobchange, rng)
+        times = np.where(steps < falltime[:, None], times + steps, np.iinfo(np.int64).max)
+        times = np.concatenate([falltime[:, None], times], axis=1)
+        kinds = np.concatenate([falltype[:, None], kinds], axis=1)
+        first = times.argmin(axis=1)
+        falltime = times[np.arange(len(times)), first]
+        falltype = kinds[np.arange(len(kinds)), first]
+    return falltime, falltype
+
+
+def fallcheck(mobility, draws):
+    """
+    Utility function, classifies the falls of an array of agents from one uniform draw each. An agent has a severe
+    fall if its draw is below exp(-3*mobility), otherwise a moderate fall if below exp(-3*0.9*mobility), otherwise a
+    mild fall if below exp(-3*0.7*mobility). The thresholds are tested in that order so ties go to the more severe fall.
+
+    :param mobility: array of agent mobilities
+    :param draws: array of uniform draws on [0, 1), one per agent
+
+    :return: array of fall types 0 mild, 1 moderate, 2 severe and -1 where the agent did not fall
+    """
+    mobility = np.asarray(mobility, dtype=float)
+    fell = np.asarray(draws, dtype=float)[..., None] < np.exp(-3 * mobility[..., None] * SCALE)
+    return np.where(fell.any(axis=-1), TYPES[fell.argmax(axis=-1)], -1)
@@ -0,0 +1,159 @@
+import pickle
+import numpy as np
+import SPmodelling.Interface as intf
+from FallModel.Fall_Balancer import timesincedischarge
+from FallModel.Fall_log import agentlog, formatlog
+from FallModel.Fall_policy import RingBuffer
+import specification
+
+COLUMNS = ("time", "mild", "moderate", "severe", "intervention", "system", "healthy", "at_risk", "fallen")
+
+
+class SeriesBuffer:
+    """
+    Table of float columns that grows by doubling its storage when full, so appending a row is amortised constant time
+    rather than copying every series on every append.
+    """
+
+    def __init__(self, columns, capacity=256):
+        """
+        :param columns: tuple of column names
+        :param capacity: number of rows allocated to start with
+        """
+        self.columns = {name: i for i, name in enumerate(columns)}
+        self.data = np.zeros((capacity, len(columns)))
+        self.count = 0
+
+    def append(self, row):
+        """
+        Adds a row.
+
+        :param row: sequence of values in column order
+
+        :return: None
+        """
+        if self.count == len(self.data):
+            grown = np.zeros((2 * len(self.data), self.data.shape[1]))
+            grown[:self.count] = self.data
+            self.data = grown
+        self.data[self.count] = row
+        self.count = self.count + 1
+
+    def column(self, name):
+        """
+        :param name: column name
+
+        :return: array of the values of the column, a view of the storage
+        """
+        return self.data[:self.count, self.columns[name]]
+
+    def __len__(self):
+        return self.count
+
+
+class Monitor:
+    """
+    Headless version of the Fall_Monitor Monitor for runs without a display, set it as the Monitor in the
+    specification with "from FallModel import Fall_headless as Monitor". It records the same statistics each snapshot
+    into a SeriesBuffer and never imports matplotlib while the run is going. The figure is drawn once at close, only if
+    monitorfigure in the specification is not False, see render.
+    """
+
+    def __init__(self):
+        self.clock = 0
+        self.metrics = SeriesBuffer(COLUMNS)
+        # the intervention interval is plotted as the mean of the last ten averages, started at 2 as in Fall_Monitor
+        self.recent = RingBuffer(10)
+        for _ in range(10):
+            self.recent.push(2)
+
+    def snapshot(self, txl, ctime):
+        """
+        Captures the current statistics of the system, average number of falls at end of system interval, intervention
+        interval, average system interval and proportions of population in each population category.
+
+        :param txl: neo4j database write transaction
+        :param ctime: current timestep
+
+        :return: True
+        """
+        self.clock = ctime
+        [mild, moderate, severe, agents_n, careint] = txl.run("MATCH (n:Node) "
+                                                              "WHERE n.name={node} "
+                                                              "RETURN n.mild, n.moderate, n.severe, n.agents, "
+                                                              "n.interval", node="Care").values()[0]
+        if agents_n:
+            falls = [mild / agents_n, moderate / agents_n, severe / agents_n]
+        else:
+            falls = [0, 0, 0]
+        gaps = timesincedischarge(txl)
+        if gaps:
+            self.recent.push(float(np.mean(gaps)))
+        counts = dict(txl.run("MATCH (a:Agent)-[r:LOCATED]->(n:Node) "
+                              "WHERE NOT n.name={node} "
+                              "RETURN a.wellbeing, count(*)", node="Care").values())
+        total = max(sum(counts.values()), 1)
+        self.metrics.append([ctime] + falls + [self.recent.mean(), careint or 0] +
+                            [counts.get(state, 0) / total for state in ("Healthy", "At risk", "Fallen")])
+        return True
+
+    def graphdata(self):
+        """
+        :return: the recorded series in the layout Fall_Monitor saves, [mild, moderate, severe, intervention interval,
+                 system interval, healthy, at risk, fallen, time]
+        """
+        return [self.metrics.column(name).copy() for name in COLUMNS[1:]] + [self.metrics.column("time").copy()]
+
+    def render(self, path):
+        """
+        Draws the four graph grid of Fall_Monitor from the recorded series and saves it. matplotlib is imported here,
+        with a backend that does not need a display.
+
+        :param path: file to save the figure to
+
+        :return: None
+        """
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib import pyplot as plt
+        t = self.metrics.column("time")
+        (fig, axes) = plt.subplots(2, 2)
+        fig.suptitle("Network Stats over Time")
+        plots = [('Average falls in lifetime', "No. Falls", [("mild", 'b-', "Mild"), ("moderate", 'g-', "Moderate"),
+                                                             ("severe", 'm-', "Severe")]),
+                 ('Intervention Interval', "Interval", [("intervention", 'm-', None)]),
+                 ('System Interval', "Interval", [("system", 'g-', None)]),
+                 ('Population Distribution', "Proportion", [("healthy", 'b-', "Healthy"), ("at_risk", 'g-', "At Risk"),
+                                                            ("fallen", 'm-', "Fallen")])]
+        for ax, (title, ylabel, series) in zip(axes.flat, plots):
+            for name, style, label in series:
+                ax.plot(t, self.metrics.column(name), style, label=label)
+            ax.set_title(title)
+            ax.set_ylabel(ylabel)
+            ax.set_xlabel("Time")
+            if len(series) > 1:
+                ax.legend()
+        fig.savefig(path)
+        plt.close(fig)
+
+    def close(self, txc):
+        """
+        Saves figure data and logs of agents in system at end of run to the output directory given in Specification
+        with name tag given in database, then draws the figure unless monitorfigure is False in the specification.
+
+        :param txc: neo4j database write transaction
+
+        :return: None
+        """
+        runname = intf.getrunname(txc)
+        print(self.clock)
+        logs = txc.run("MATCH (a:Agent) RETURN properties(a)").values()
+        logs = [[formatlog(agentlog(log[0]))] for log in logs]
+        with open(specification.savedirectory + "logs_" + runname + ".p", "wb") as pickle_lout:
+            pickle.dump(logs, pickle_lout)
+        with open(specification.savedirectory + "records_" + runname + ".p", "wb") as pickle_out:
+            pickle.dump({name: self.metrics.column(name).copy() for name in COLUMNS}, pickle_out)
+        with open(specification.savedirectory + "graphdata_" + runname + ".p", "wb") as pickle_gout:
+            pickle.dump(self.graphdata(), pickle_gout)
+        if getattr(specification, "monitorfigure", True):
+            self.render("../FallData/figure_" + runname + "")
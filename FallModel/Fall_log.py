@@ -0,0 +1,103 @@
+import logging
+
+
+def parselog(log):
+    """
+    Utility function, parses log strings from agents and converts them to a list of tuples. Only needed for outputs
+    written before agent logs were stored as event and time lists.
+
+    :param log: string log format: "(<event>, <timestep>),..."
+
+    :return: list of tuples [(<event>, <timestep>),...]
+    """
+    logging.debug(log)
+    while isinstance(log, list):
+        log = log[0]
+    log = log.split("), (")
+    log[0] = log[0].replace("(", "")
+    log[-1] = log[-1].replace(")", "")
+    log = [entry.split(",") for entry in log]
+    log = [(entry[0], int(entry[1])) for entry in log]
+    return log
+
+
+def readlog(events, times):
+    """
+    Utility function, combines the parallel event and time lists stored on an agent into the list of tuples returned
+    by parselog.
+
+    :param events: list of event names
+    :param times: list of integer timesteps, one per event
+
+    :return: list of tuples [(<event>, <timestep>),...]
+    """
+    return [(event, int(time)) for event, time in zip(events, times)]
+
+
+def agentlog(agent):
+    """
+    Utility function, returns the log of an agent record as a list of tuples. Agents created before the event lists
+    were introduced fall back to parsing their log string.
+
+    :param agent: agent database object returned from Interface, or a dictionary of its properties
+
+    :return: list of tuples [(<event>, <timestep>),...]
+    """
+    if agent.get("log_events") is not None:
+        return readlog(agent["log_events"], agent["log_times"])
+    if agent.get("log"):
+        return parselog(agent["log"])
+    return []
+
+
+def formatlog(entries):
+    """
+    Utility function, renders a list of log tuples in the original log string format so saved outputs can still be
+    read with parselog.
+
+    :param entries: list of tuples [(<event>, <timestep>),...]
+
+    :return: string log format: "(<event>, <timestep>),..."
+    """
+    return ", ".join(["(" + event + ", " + str(time) + ")" for event, time in entries])
+
+
+def appendlog(tx, agent_id, events, times, label="Agent", uid="id"):
+    """
+    Utility function, appends entries to an agents log on the database server without reading the existing log.
+
+    :param tx: neo4j database write transaction
+    :param agent_id: id of the agent to update
+    :param events: list of event names to append
+    :param times: list of integer timesteps, one per event
+    :param label: label of the agent node
+    :param uid: property used to identify the agent
+
+    :return: None
+    """
+    if events:
+        tx.run("MATCH (a:" + label + ") "
+               "WHERE a." + uid + "={agent_id} "
+               "SET a.log_events = coalesce(a.log_events, []) + {events}, "
+               "a.log_times = coalesce(a.log_times, []) + {times}",
+               agent_id=agent_id, events=list(events), times=[int(time) for time in times])
+
+
+def appendlogs(tx, entries, label="Agent", uid="id"):
+    """
+    Utility function, appends log entries for many agents in a single query.
+
+    :param tx: neo4j database write transaction
+    :param entries: list of (<agent id>, <event>, <timestep>) tuples, applied in order
+    :param label: label of the agent nodes
+    :param uid: property used to identify the agents
+
+    :return: None
+    """
+    if entries:
+        tx.run("UNWIND {entries} AS entry "
+               "MATCH (a:" + label + ") "
+               "WHERE a." + uid + "=entry.id "
+               "SET a.log_events = coalesce(a.log_events, []) + entry.event, "
+               "a.log_times = coalesce(a.log_times, []) + entry.time",
+               entries=[{"id": agent_id, "event": event, "time": int(time)} for agent_id, event, time in entries])
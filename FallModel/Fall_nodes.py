@@ -1,12 +1,119 @@
 from SPmodelling.Node import Node
 import SPmodelling.Interface as intf
 import numpy as np
-from random import random
-import numpy.random as npr
-import pickle
-from FallModel.Fall_Balancer import parselog
+from FallModel.Fall_log import agentlog, formatlog, appendlog, appendlogs
 import specification as specification
-from FallModel.Fall_agent import FallAgent
+from FallModel.Fall_agent import edgearrays, inclinationchoice, choiceplan
+from FallModel.Fall_clock import currenttime
+from FallModel.Fall_random import noderandom
+from FallModel.Fall_queue import EventQueue
+from FallModel.Fall_topology import topology
+from FallModel.Fall_checkpoint import Checkpointer, nodestate, restorenodes
+from FallModel.Fall_hazard import FALLTYPES, falldraw, predictfalls, fallcheck
+from FallModel.Fall_sink import ExitSink
+from FallModel.Fall_social import socialgraph, locationindex
+
+
+def dischargeagents(tx, name, due, agents, changes, rng):
+    """
+    Utility function, applies the end of stay changes to all of the agents leaving a hospital node after a timed stay
+    in this timestep. The node modifiers are read in one query. The changes for every agent are drawn in one call
+    each, with mean the stay duration times the node modifier, and written back with the referral and the discharge log
+    entry in one query. The discharge time is also kept in the last_discharge property of the agent, see
+    Fall_Balancer.lastdischarges.
+
+    :param tx: neo4j database write transaction
+    :param name: name of the node
+    :param due: dictionary of agent id to (destination, duration) for the agents ready at this timestep
+    :param agents: agent database objects at the node
+    :param changes: list of (<agent property>, <node property>) pairs to draw changes for
+    :param rng: random generator
+
+    :return: list of the node modifiers in the order of changes followed by the node energy, None if no agent left
+    """
+    leaving = sorted(agent["id"] for agent in agents if agent["id"] in due and due[agent["id"]][1])
+    if not leaving:
+        return None
+    props = [prop for _, prop in changes] + ["energy"]
+    values = tx.run("MATCH (n:Node) "
+                    "WHERE n.name={name} "
+                    "RETURN " + ", ".join(["n." + prop for prop in props]), name=name).values()[0]
+    durations = np.array([due[agent_id][1] for agent_id in leaving], dtype=float)
+    updates = {agentprop: rng.normal(durations * value, 1) for (agentprop, _), value in zip(changes, values)}
+    updates["energy"] = durations * values[-1]
+    rows = [{"id": agent_id, "props": dict([(prop, float(update[i])) for prop, update in updates.items()] +
+                                           [("referral", True)])}
+            for i, agent_id in enumerate(leaving)]
+    tx.run("UNWIND {rows} AS row "
+           "MATCH (a:Agent) "
+           "WHERE a.id=row.id "
+           "SET a += row.props, "
+           "a.log_events = coalesce(a.log_events, []) + 'Hos discharge', "
+           "a.log_times = coalesce(a.log_times, []) + {time}, "
+           "a.last_discharge = {time}", rows=rows, time=currenttime(tx))
+    return values
+
+
+def admitagents(tx, queue, admissions, rng):
+    """
+    Utility function, queues the agents admitted to a hospital node since it was last processed. The stay of every
+    agent is drawn from a poisson distribution in one call, ordered by agent id so the draws do not depend on arrival
+    order, and their admissions are logged in one query. Agents whose stay has already run out leave at this timestep.
+
+    :param tx: neo4j database write transaction
+    :param queue: the nodes EventQueue
+    :param admissions: list of (<agent id>, <mean stay>, <destination edge>, <admission time>) tuples
+    :param rng: random generator
+
+    :return: None
+    """
+    if not admissions:
+        return
+    clock = currenttime(tx)
+    admissions = sorted(admissions, key=lambda admission: admission[0])
+    stays = rng.poisson(np.maximum([mean for _, mean, _, _ in admissions], 0))
+    appendlogs(tx, [(agent_id, "Hos admitted", admitted) for agent_id, _, _, admitted in admissions])
+    for (agent_id, _, dest, admitted), stay in zip(admissions, stays.tolist()):
+        queue.push(max(admitted + stay, clock), agent_id, (dest, stay))
+
+
+def recordfalls(tx, falls):
+    """
+    Utility function, logs the falls of a set of agents and marks them as fallen, in one query each.
+
+    :param tx: neo4j database write transaction
+    :param falls: list of (<agent id>, <fall type>) tuples, fall type one of FALLTYPES
+
+    :return: None
+    """
+    if not falls:
+        return
+    appendlogs(tx, [(agent_id, falltype + " Fall", currenttime(tx)) for agent_id, falltype in falls])
+    tx.run("UNWIND {ids} AS id "
+           "MATCH (a:Agent) "
+           "WHERE a.id=id "
+           "SET a.wellbeing='Fallen'", ids=[agent_id for agent_id, _ in falls])
+
+
+def deleteagents(tx, ids):
+    """
+    Utility function, deletes agents and their links from the database in one query and drops them from the in process
+    social and location mirrors.
+
+    :param tx: neo4j database write transaction
+    :param ids: list of agent ids
+
+    :return: None
+    """
+    if not ids:
+        return
+    tx.run("UNWIND {ids} AS id "
+           "MATCH (a:Agent) "
+           "WHERE a.id=id "
+           "DETACH DELETE a", ids=ids)
+    for agent_id in ids:
+        socialgraph.detach(("Agent", agent_id))
+        locationindex.discard(agent_id)
 
 
 class FallNode(Node):
@@ -17,6 +124,7 @@ class FallNode(Node):
 
     def __init__(self, name, capacity=None, duration=None, queue=None):
         super(FallNode, self).__init__(name, capacity, duration, queue)
+        self.falls = (None, {})
 
     def agentsready(self, tx, agentclass="FallAgent"):
         """
@@ -45,51 +153,151 @@ class FallNode(Node):
 
         :return: view, agents filtered perception of their surroundings
         """
-        view = super(FallNode, self).agentperception(tx, agent, dest, waittime)
-        if type(view) == list:
-            for edge in view:
-                if "allowed" in edge.keys():
-                    if not agent["referral"] and edge["ref"]:
-                        view.remove(edge)
-                    else:
-                        allowed = edge["allowed"]
-                        if not agent["wellbeing"] in allowed:
-                            view.remove(edge)
+        if dest is None and waittime is None:
+            view = list(self.sharedview(tx, agent))
             destinations = [edge.end_node["name"] for edge in view]
         else:
-            destinations = [view.end_node["name"]]
-            if "allowed" in view.keys():
-                if not agent["referral"]:
-                    view = []
-                else:
-                    allowed = view["allowed"].split(',')
-                    if not agent["wellbeing"] in allowed:
+            view = super(FallNode, self).agentperception(tx, agent, dest, waittime)
+            if type(view) == list:
+                view = list(self.filteredges(view, agent))
+                destinations = [edge.end_node["name"] for edge in view]
+            else:
+                destinations = [view.end_node["name"]]
+                if "allowed" in view.keys():
+                    if not agent["referral"]:
                         view = []
-        # If Care in options check for zero mobility
-        if "Care" in destinations and agent["mob"] <= 0:
-            view = [edge for edge in view if edge.end_node["name"] == "Care"]
+                    elif not topology.permits(view, agent["wellbeing"], split=True):
+                        view = []
+            # If Care in options check for zero mobility
+            if "Care" in destinations and agent["mob"] <= 0:
+                view = [edge for edge in view if edge.end_node["name"] == "Care"]
+                destinations = ["Care"]
         # If Hos and GP in options check for fall and return hos or GP,
         #  no prediction just straight check based on  mobility
-        elif "Hos" in destinations and "GP" in destinations:
-            if (r := random()) < np.exp(-3 * agent["mob"]):
+        if "Hos" in destinations and "GP" in destinations:
+            (checked, falls) = self.falls
+            if checked is tx and agent["id"] in falls:
+                # Already checked and recorded for all agents at the node, see checkfalls
+                fall = falls[agent["id"]]
+            else:
+                kind = fallcheck(np.array([agent["mob"]]), np.array([noderandom(tx, self.name, agent["id"]).random()]))
+                fall = FALLTYPES[kind[0]] if kind[0] >= 0 else None
+                if fall:
+                    recordfalls(tx, [(agent["id"], fall)])
+            if fall == "Severe":
                 view = [edge for edge in view if edge.end_node["name"] == "Hos"]
-                # Mark a severe fall has happened in agent log
-                ag = FallAgent(agent["id"])
-                ag.logging(tx, "Severe Fall, " + str(intf.gettime(tx)))
-                intf.updateagent(tx, agent["id"], "wellbeing", "Fallen")
-            elif r < np.exp(-3 * (agent["mob"] - 0.1 * agent["mob"])):
+            elif fall == "Moderate":
                 view = [edge for edge in view if edge.end_node["name"] == "GP"]
-                # Mark a moderate fall has happened in agent log
-                ag = FallAgent(agent["id"])
-                ag.logging(tx, "Moderate Fall, " + str(intf.gettime(tx)))
-                intf.updateagent(tx, agent["id"], "wellbeing", "Fallen")
-            elif r < np.exp(-3 * (agent["mob"] - 0.3 * agent["mob"])):
-                # Mark a mild fall has happened in agent log
-                ag = FallAgent(agent["id"])
-                ag.logging(tx, "Mild Fall, " + str(intf.gettime(tx)))
-                intf.updateagent(tx, agent["id"], "wellbeing", "Fallen")
         return view
 
+    def sharedview(self, tx, agent):
+        """
+        Agents without a predicted destination share the filtered view of agents in the same state, see filteredview.
+
+        :param tx: neo4j database transaction
+        :param agent: The agent object returned from the database via the interface
+
+        :return: tuple of edges
+        """
+        key = (self.name, str(agent["wellbeing"]), bool(agent["referral"]), agent["mob"] <= 0)
+        return topology.memoise(tx, key, lambda: self.filteredview(tx, agent))
+
+    def checkfalls(self, tx, agents):
+        """
+        Fall check for all of the agents at a node without a queue before any of them move. The agents whose view
+        includes both Hospital and GP are checked together, each with one uniform draw from its own stream as
+        agentperception would make for it, and their falls are logged and their wellbeing set in bulk, see recordfalls.
+        agentperception then routes the agents from the stored results rather than checking each agent as it moves.
+
+        :param tx: neo4j database write transaction
+        :param agents: list of the agent database objects at the node returned from Interface
+
+        :return: None
+        """
+        checked = []
+        for agent in agents:
+            destinations = [edge.end_node["name"] for edge in self.sharedview(tx, agent)]
+            if "Hos" in destinations and "GP" in destinations:
+                checked.append(agent)
+        agents = checked
+        draws = np.array([noderandom(tx, self.name, agent["id"]).random() for agent in agents])
+        kinds = fallcheck([agent["mob"] for agent in agents], draws)
+        falls = {agent["id"]: FALLTYPES[kind] if kind >= 0 else None for agent, kind in zip(agents, kinds.tolist())}
+        recordfalls(tx, [(agent_id, fall) for agent_id, fall in falls.items() if fall])
+        self.falls = (tx, falls)
+
+    @staticmethod
+    def filteredges(edges, agent):
+        """
+        Removes the edges with wellbeing limits the agent does not match or a referral requirement it does not meet.
+
+        :param edges: list of edges
+        :param agent: The agent object returned from the database via the interface
+
+        :return: tuple of the edges the agent may use
+        """
+        return tuple(edge for edge in edges if "allowed" not in edge.keys() or
+                     ((agent["referral"] or not edge["ref"]) and topology.permits(edge, agent["wellbeing"])))
+
+    def filteredview(self, tx, agent):
+        """
+        Builds the deterministic part of the perception for an agent without a predicted destination, the cached edges
+        to nodes with spare capacity which the agent may use, redirected to Care for agents with no mobility. It
+        depends only on the agents wellbeing, referral and whether its mobility is above zero, so it is memoised for
+        agents in the same state until a capacity or load changes.
+
+        :param tx: neo4j database transaction
+        :param agent: The agent object returned from the database via the interface
+
+        :return: tuple of edges
+        """
+        view = [edge for edge in topology.outgoing(tx, self.name) if topology.spare(tx, edge.end_node["name"])]
+        view = self.filteredges(view, agent)
+        if agent["mob"] <= 0 and any(edge.end_node["name"] == "Care" for edge in view):
+            view = tuple(edge for edge in view if edge.end_node["name"] == "Care")
+        return view
+
+    def agentschoice(self, tx, agents):
+        """
+        Batch form of Patient.choose for all of the patients about to leave the node without a destination. The edges
+        each patient will be able to choose from are found as Patient.perception would, a mood threshold mask and an
+        inclination weight matrix are built for every patient against the nodes outgoing edges and all of the choices
+        are sampled with one call on the node stream, see inclinationchoice. The choices are left in choiceplan for the
+        patients to take as they move. A patient whose edges, mood or inclination have changed since chooses for
+        itself.
+
+        :param tx: neo4j database write transaction
+        :param agents: list of agent database objects returned from Interface
+
+        :return: None
+        """
+        agents = sorted((agent for agent in agents if agent.get("inclination") is not None),
+                        key=lambda agent: agent["id"])
+        edges = [edge for edge in topology.outgoing(tx, self.name)
+                 if edge.end_node["name"] not in ["Care", "GP", "Hos"]]
+        if not agents or len(edges) < 2:
+            return
+        valid = np.zeros((len(agents), len(edges)), dtype=bool)
+        for i, agent in enumerate(agents):
+            view = {edge.id for edge in self.sharedview(tx, agent)}
+            valid[i] = [edge.id in view and agent["energy"] > -(edge.end_node["energy"] or 0) for edge in edges]
+        # patients with fewer than two edges take the one they have, see Patient.choose
+        planned = valid.sum(axis=1) >= 2
+        if not planned.any():
+            return
+        agents = [agent for agent, plan in zip(agents, planned) if plan]
+        valid = valid[planned]
+        (edge_moods, edge_types) = edgearrays(edges)
+        moods = np.array([agent["mood"] for agent in agents], dtype=float)
+        inclinations = np.array([agent["inclination"] for agent in agents], dtype=float)
+        choice = inclinationchoice(moods, inclinations, edge_moods, edge_types, noderandom(tx, self.name), valid)
+        plans = {}
+        for agent, seen, chosen in zip(agents, valid, choice.tolist()):
+            indices = np.flatnonzero(seen).tolist()
+            plans[agent["id"]] = (tuple(edges[k].id for k in indices), agent["mood"], tuple(agent["inclination"]),
+                                  indices.index(chosen) if chosen >= 0 else -1)
+        choiceplan.set(tx, plans)
+
     def agentprediction(self, tx, agent):
         """
         For nodes with queues this function is specialised to add the agents to the queue with a wait time and
@@ -112,7 +320,7 @@ class HomeNode(FallNode):
     """
 
     def __init__(self, name="Home", mc=-0.015, rr=0.3, moc=-0.02):
-        super(HomeNode, self).__init__(name, queue={})
+        super(HomeNode, self).__init__(name, queue=EventQueue())
         self.mobchange = mc
         self.recoverrate = rr
         self.moodchange = moc
@@ -130,18 +338,23 @@ class HomeNode(FallNode):
         """
         # Apply changes from waittime not dest
         agents = intf.getnodeagents(tx, self.name, "name")
-        clock = intf.gettime(tx)
-        if clock in self.queue.keys():
-            for ag in agents:
-                if ag["id"] in self.queue[clock].keys() and self.queue[clock][ag["id"]][1]:
-                    self.mobchange = intf.getnodevalue(tx, self.name, "modm", "Node", "name")
-                    self.moodchange = intf.getnodevalue(tx, self.name, "modmood", "Node", "name")
-                    self.recoverrate = intf.getnodevalue(tx, self.name, "energy", "Node", "name")
-                    intf.updateagent(ag["id"], "mob",
-                                     npr.normal((self.queue[clock][ag["id"]][1] * self.mobchange), 1, 1))
-                    intf.updateagent(ag["id"], "mood",
-                                     npr.normal((self.queue[clock][ag["id"]][1] * self.moodchange), 1, 1))
-                    intf.updateagent(ag["id"], "energy", self.queue[clock][ag["id"]][1] * self.recoverrate)
+        clock = currenttime(tx)
+        self.queue.advance(clock)
+        due = self.queue.due(clock)
+        waited = [ag for ag in agents if ag["id"] in due and due[ag["id"]][1]]
+        if waited:
+            self.mobchange = intf.getnodevalue(tx, self.name, "modm", "Node", "name")
+            self.moodchange = intf.getnodevalue(tx, self.name, "modmood", "Node", "name")
+            self.recoverrate = intf.getnodevalue(tx, self.name, "energy", "Node", "name")
+        for ag in waited:
+            rng = noderandom(tx, self.name, ag["id"])
+            intf.updateagent(tx, ag["id"], "mob", rng.normal(due[ag["id"]][1] * self.mobchange, 1))
+            intf.updateagent(tx, ag["id"], "mood", rng.normal(due[ag["id"]][1] * self.moodchange, 1))
+            intf.updateagent(tx, ag["id"], "energy", due[ag["id"]][1] * self.recoverrate)
+        if any(entry[0] is None for entry in due.values()):
+            # read again for the values changed above
+            agents = intf.getnodeagents(tx, self.name, "name")
+            self.agentschoice(tx, [ag for ag in agents if ag["id"] in due and due[ag["id"]][0] is None])
         super(HomeNode, self).agentsready(tx)
 
     def agentperception(self, tx, agent, dest=None, waittime=None):
@@ -163,54 +376,38 @@ class HomeNode(FallNode):
 
         :return: None
         """
-        view = intf.perception(tx, agent["id"])[1:]
-        minenergy = min([edge["energy"] for edge in view if edge["energy"]] + [edge.end_node["energy"] for edge in view
-                                                                               if edge.end_node["energy"]])
+        view = topology.outgoing(tx, self.name)
+        minenergy = topology.minenergy(tx, self.name)
         recoverytime = (minenergy - agent["energy"]) / self.recoverrate
         if agent["energy"] < minenergy:
-            (falltime, falltype) = self.predictfall(agent["mob"])
-            t = 1
-            mob = agent["mob"]
-            while t < falltime:
-                mob = mob + self.mobchange
-                (nfalltime, nfalltype) = self.predictfall(mob)
-                if nfalltime + t < falltime:
-                    (falltime, falltype) = (nfalltime + t, nfalltype)
-                t = t + 1
+            rng = noderandom(tx, self.name, agent["id"])
+            (falltimes, falltypes) = predictfalls(np.array([agent["mob"]]), self.mobchange, rng)
+            (falltime, falltype) = (int(falltimes[0]), FALLTYPES[falltypes[0]])
             if falltime < recoverytime and not falltype == "Mild":
                 # Add agent to queue with fall
-                queuetime = falltime + intf.gettime(tx)
+                queuetime = falltime + currenttime(tx)
                 intf.updateagent(tx, agent["id"], "wellbeing", "Fallen")
-                if queuetime not in self.queue.keys():
-                    self.queue[queuetime] = {}
                 if falltype == "Severe":
                     dest = [edge for edge in view if edge.end_node["name"] == "Hos"]
-                    self.queue[queuetime][agent["id"]] = (dest[0], falltime)
-                    ag = FallAgent(agent["id"])
-                    ag.logging(tx, "Severe Fall, " + str(queuetime))
+                    self.queue.push(queuetime, agent["id"], (dest[0], falltime))
+                    appendlog(tx, agent["id"], ["Severe Fall"], [queuetime])
                 elif falltype == "Moderate":
                     dest = [edge for edge in view if edge.end_node["name"] == "GP"]
-                    self.queue[queuetime][agent["id"]] = (dest[0], falltime)
-                    ag = FallAgent(agent["id"])
-                    ag.logging(tx, "Moderate Fall, " + str(queuetime))
+                    self.queue.push(queuetime, agent["id"], (dest[0], falltime))
+                    appendlog(tx, agent["id"], ["Moderate Fall"], [queuetime])
             else:
                 # Add agent to queue with recovery
                 if falltype == "Mild":
-                    queuetime = falltime + intf.gettime(tx)
-                    ag = FallAgent(agent["id"])
-                    ag.logging(tx, "Mild Fall, " + str(queuetime))
+                    queuetime = falltime + currenttime(tx)
+                    appendlog(tx, agent["id"], ["Mild Fall"], [queuetime])
                     intf.updateagent(tx, agent["id"], "wellbeing", "Fallen")
-                if recoverytime + intf.gettime(tx) not in self.queue.keys():
-                    self.queue[recoverytime + intf.gettime(tx)] = {}
-                self.queue[recoverytime + intf.gettime(tx)][agent["id"]] = (None, recoverytime)
+                self.queue.push(recoverytime + currenttime(tx), agent["id"], (None, recoverytime))
         else:
             # Add agent to next time step - no waittime or dest
-            if intf.gettime(tx) + 1 not in self.queue.keys():
-                self.queue[intf.gettime(tx) + 1] = {}
-            self.queue[intf.gettime(tx) + 1][agent["id"]] = (None, None)
+            self.queue.push(currenttime(tx) + 1, agent["id"], (None, None))
 
     @staticmethod
-    def predictfall(mobility):
+    def predictfall(mobility, rng=None):
         """
         We predict how many time steps until the next fall of each type based on a poisson distribution with mean for
         severe falls:
@@ -219,23 +416,14 @@ class HomeNode(FallNode):
         -log(1-0.9*mobility)
         mild falls:
         -log(1-0.7*mobility)
-        We return the earliest fall.
+        We return the earliest fall, ties go to the more severe fall.
 
         :param mobility: Agents current mobility
+        :param rng: (Optional) random generator, defaults to numpy.random
         :return: [fall time, fall type] for the fall occurring first
         """
-        serverfallprediction = npr.poisson(-np.log(1 - mobility), 1)
-        falltype = "Sever"
-        falltime = serverfallprediction
-        moderatefallprediction = npr.poisson(-np.log(1 - (mobility - 0.1 * mobility)), 1)
-        if moderatefallprediction < falltime:
-            falltype = "Moderate"
-            falltime = moderatefallprediction
-        mildfallprediction = npr.poisson(-np.log(1 - (mobility - 0.3 * mobility)), 1)
-        if mildfallprediction < falltime:
-            falltype = "Mild"
-            falltime = mildfallprediction
-        return falltime, falltype
+        (falltimes, falltypes) = falldraw(np.array([mobility]), rng)
+        return int(falltimes[0]), FALLTYPES[falltypes[0]]
 
 
 class HosNode(FallNode):
@@ -245,7 +433,8 @@ class HosNode(FallNode):
     """
 
     def __init__(self, name="Hos", mc=-0.1, rr=0.2, moc=-0.05):
-        super(HosNode, self).__init__(name, queue={})
+        super(HosNode, self).__init__(name, queue=EventQueue())
+        self.admissions = []
         self.mobchange = mc
         self.recoverrate = rr
         self.moodchange = moc
@@ -262,23 +451,19 @@ class HosNode(FallNode):
 
         :return:None
         """
+        # Queue the agents admitted since the last timestep
+        clock = currenttime(tx)
+        admitagents(tx, self.queue, self.admissions, noderandom(tx, self.name))
+        self.admissions = []
+        self.queue.advance(clock)
         # Apply changes from waittime not dest
         agents = intf.getnodeagents(tx, self.name)
-        clock = intf.gettime(tx)
-        if clock in self.queue.keys() and agents:
-            for ag in agents:
-                if ag["id"] in self.queue[clock].keys() and self.queue[clock][ag["id"]][1]:
-                    self.mobchange = intf.getnodevalue(tx, self.name, "modm", "Node", "name")
-                    self.moodchange = intf.getnodevalue(tx, self.name, "modmood", "Node", "name")
-                    self.recoverrate = intf.getnodevalue(tx, self.name, "energy", "Node", "name")
-                    intf.updateagent(tx, ag["id"], "mob",
-                                     npr.normal((self.queue[clock][ag["id"]][1] * self.mobchange), 1, 1)[0])
-                    intf.updateagent(tx, ag["id"], "mood",
-                                     npr.normal((self.queue[clock][ag["id"]][1] * self.moodchange), 1, 1)[0])
-                    intf.updateagent(tx, ag["id"], "energy", self.queue[clock][ag["id"]][1] * self.recoverrate)
-                    intf.updateagent(tx, ag["id"], "referral", True)
-                    agent = FallAgent(ag["id"])
-                    agent.logging(tx, "Hos discharge, " + str(intf.gettime(tx)))
+        due = self.queue.due(clock)
+        if due and agents:
+            values = dischargeagents(tx, self.name, due, agents, [("mob", "modm"), ("mood", "modmood")],
+                                     noderandom(tx, self.name))
+            if values:
+                (self.mobchange, self.moodchange, self.recoverrate) = values
         super(HosNode, self).agentsready(tx)
 
     def agentperception(self, tx, agent, dest=None, waittime=None):
@@ -292,7 +477,8 @@ class HosNode(FallNode):
         This means a fully healthy agent has a mean stay of 5 days in hospital after a severe fall. The predicted
         duration is drawn from a poisson distribution.
         The agent is added to the queue at t = current_time + predicted_duration
-        with destination home.
+        with destination home. Admissions are logged and queued together at the start of the nodes next timestep, see
+        admitagents.
 
         :param tx: neo4j database write transaction
         :param agent: agent database object returned from Interface
@@ -300,15 +486,9 @@ class HosNode(FallNode):
         :return: None
         """
         view = super(HosNode, self).agentprediction(tx, agent)[1:]
-        clock = intf.gettime(tx)
-        ag = FallAgent(agent["id"])
-        ag.logging(tx, "Hos admitted, " + str(clock))
         mean = -9 * min(agent["mob"], 1) + 14
-        time = npr.poisson(mean, 1)[0]
-        if clock + time not in self.queue.keys():
-            self.queue[clock + time] = {}
         dest = [edge for edge in view if edge.end_node["name"] == "Home"]
-        self.queue[clock + time][agent["id"]] = (dest[0], time)
+        self.admissions.append((agent["id"], mean, dest[0], currenttime(tx)))
 
 
 class GPNode(FallNode):
@@ -356,8 +536,12 @@ class SocialNode(FallNode):
 
     def __init__(self, name="Social"):
         super(FallNode, self).__init__(name)
+        self.falls = (None, {})
 
     def agentsready(self, tx, agentclass="FallAgent"):
+        agents = intf.getnodeagents(tx, self.name, "name")
+        self.checkfalls(tx, agents)
+        self.agentschoice(tx, agents)
         super(FallNode, self).agentsready(tx, agentclass)
 
     def agentperception(self, tx, agent, dest=None, waittime=None):
@@ -377,19 +561,23 @@ class InterventionNode(FallNode):
 
     def __init__(self, name="Intervention"):
         super(FallNode, self).__init__(name)
+        self.falls = (None, {})
 
     def agentsready(self, tx, agentclass="FallAgent"):
         """
-        Extends normal Fall node by updating the load value after processing agents.
+        Processes agents as a normal Fall node after checking all of them for falls and making their choices, see
+        FallNode.checkfalls and FallNode.agentschoice. The load value is kept up to date by the agents as they arrive
+        and leave, see TopologyCache.moveload.
 
         :param tx: neo4j database write transaction
         :param agentclass: Class to use for agents at this location
 
         :return: None
         """
+        agents = intf.getnodeagents(tx, self.name, "name")
+        self.checkfalls(tx, agents)
+        self.agentschoice(tx, agents)
         super(FallNode, self).agentsready(tx, agentclass)
-        load = len(intf.getnodeagents(tx, self.name))
-        intf.updatenode(tx, self.name, "load", load, "name")
 
     def agentperception(self, tx, agent, dest=None, waittime=None):
         """
@@ -405,8 +593,7 @@ class InterventionNode(FallNode):
         :return: view from Fall Node agentperception
         """
         view = super(InterventionNode, self).agentperception(tx, agent, dest, waittime)
-        ag = FallAgent(agent["id"])
-        ag.logging(tx, self.name + ", " + str(intf.gettime(tx)))
+        appendlog(tx, agent["id"], [self.name], [currenttime(tx)])
         if agent["mob"] > 0.6:
             intf.updateagent(tx, agent["id"], "referral", "False", "name")
         else:
@@ -435,25 +622,37 @@ class CareNode:
         self.mild = 0
         self.moderate = 0
         self.severe = 0
+        self.sink = None
+        self.checkpointer = Checkpointer("Flow", lambda: nodestate(specification.nodes),
+                                         lambda tx, state: restorenodes(tx, specification.nodes, state))
 
     def agentsready(self, tx):
         """
-        Saves out the log strings of all agents at the Care Node using the runname aquired from the database. Updates
-        its own track of average number of falls and length of interval using information in agent logs. Also updates
-        the total number of agents that have left the system. It then deletes the agents at the Care node.
+        Saves out the log strings of all agents at the Care Node to the exit log of the run, see ExitSink, using the
+        runname aquired from the database. Updates its own track of average number of falls and length of interval
+        using information in agent logs. Also updates the total number of agents that have left the system. The totals
+        are written to the Care node once for all the agents that arrived this timestep, and the agents are then deleted
+        together, see deleteagents. As the Care node is processed once per timestep it also checkpoints the state of all
+        the nodes, see Checkpointer.
 
         :param tx: neo4j database write transaction
 
         :return: None
         """
-        agents = intf.getnodeagents(tx, "Care", "name")
         if not self.runname:
             self.runname = intf.getrunname(tx)
-        file = open(specification.savedirectory + "AgentLogscareag_" + self.runname + ".p", 'ab')
+        self.checkpointer.step(tx, self.runname)
+        if self.sink is None:
+            self.sink = ExitSink(specification.savedirectory + "AgentLogscareag_" + self.runname)
+        agents = intf.getnodeagents(tx, "Care", "name")
+        if not agents:
+            return None
+        time = currenttime(tx)
+        exits = []
+        intervals = 0
         for agent in agents:
-            agl = parselog(agent["log"])
-            agint = agl[-1][1] - agl[0][1]
-            self.interval = (self.interval * self.agents + agint) / (self.agents + 1)
+            agl = agentlog(agent)
+            intervals = intervals + agl[-1][1] - agl[0][1]
             for entry in agl:
                 if entry[0] == "Mild Fall":
                     self.mild = self.mild + 1
@@ -461,16 +660,17 @@ class CareNode:
                     self.moderate = self.moderate + 1
                 if entry[0] == "Severe Fall":
                     self.severe = self.severe + 1
-            self.agents = self.agents + 1
-            intf.updatenode(tx, "Care", "interval", self.interval, "name")
-            intf.updatenode(tx, "Care", "mild", self.mild, "name")
-            intf.updatenode(tx, "Care", "moderate", self.moderate, "name")
-            intf.updatenode(tx, "Care", "severe", self.severe, "name")
-            intf.updatenode(tx, "Care", "agents", self.agents, "name")
-            aglog = "Agent " + str(agent["id"]) + ": " + agent["log"]
-            pickle.dump(aglog, file)
-            intf.deleteagent(tx, agent, "id")
-        # file.close()
+            aglog = "Agent " + str(agent["id"]) + ": " + formatlog(agl)
+            exits.append((agent["id"], time, aglog))
+        self.interval = (self.interval * self.agents + intervals) / (self.agents + len(agents))
+        self.agents = self.agents + len(agents)
+        tx.run("MATCH (n:Node) "
+               "WHERE n.name={name} "
+               "SET n += {props}", name="Care",
+               props={"interval": self.interval, "mild": self.mild, "moderate": self.moderate, "severe": self.severe,
+                      "agents": self.agents})
+        self.sink.write(exits)
+        deleteagents(tx, [agent["id"] for agent in agents])
         return None
 
     # While Care is not actually a node it does have an agentready function which is triggered on arrival.
@@ -485,7 +685,7 @@ class HomeNodeV0(FallNode):
     """
 
     def __init__(self, name="Home", mc=-0.015, rr=0.3, cc=-0.02):
-        super(HomeNodeV0, self).__init__(name, queue={})
+        super(HomeNodeV0, self).__init__(name, queue=EventQueue())
         self.mobchange = mc
         self.recoverrate = rr
         self.confchange = cc
@@ -503,18 +703,19 @@ class HomeNodeV0(FallNode):
         """
         # Apply changes from waittime not dest
         agents = intf.getnodeagents(tx, self.name, "name")
-        clock = intf.gettime(tx)
-        if clock in self.queue.keys():
-            for ag in agents:
-                if ag["id"] in self.queue[clock].keys() and self.queue[clock][ag["id"]][1]:
-                    self.mobchange = intf.getnodevalue(tx, self.name, "modm", "Node", "name")
-                    self.confchange = intf.getnodevalue(tx, self.name, "modc", "Node", "name")
-                    self.recoverrate = intf.getnodevalue(tx, self.name, "energy", "Node", "name")
-                    intf.updateagent(ag["id"], "mob",
-                                     npr.normal((self.queue[clock][ag["id"]][1] * self.mobchange), 1, 1))
-                    intf.updateagent(ag["id"], "conf",
-                                     npr.normal((self.queue[clock][ag["id"]][1] * self.confchange), 1, 1))
-                    intf.updateagent(ag["id"], "energy", self.queue[clock][ag["id"]][1] * self.recoverrate)
+        clock = currenttime(tx)
+        self.queue.advance(clock)
+        due = self.queue.due(clock)
+        waited = [ag for ag in agents if ag["id"] in due and due[ag["id"]][1]]
+        if waited:
+            self.mobchange = intf.getnodevalue(tx, self.name, "modm", "Node", "name")
+            self.confchange = intf.getnodevalue(tx, self.name, "modc", "Node", "name")
+            self.recoverrate = intf.getnodevalue(tx, self.name, "energy", "Node", "name")
+        for ag in waited:
+            rng = noderandom(tx, self.name, ag["id"])
+            intf.updateagent(tx, ag["id"], "mob", rng.normal(due[ag["id"]][1] * self.mobchange, 1))
+            intf.updateagent(tx, ag["id"], "conf", rng.normal(due[ag["id"]][1] * self.confchange, 1))
+            intf.updateagent(tx, ag["id"], "energy", due[ag["id"]][1] * self.recoverrate)
         super(HomeNodeV0, self).agentsready(tx, intf)
 
     def agentperception(self, tx, agent, dest=None, waittime=None):
@@ -536,54 +737,38 @@ class HomeNodeV0(FallNode):
 
         :return: None
         """
-        view = intf.perception(tx, agent["id"])[1:]
-        minenergy = min([edge["energy"] for edge in view if edge["energy"]] + [edge.end_node["energy"] for edge in view
-                                                                               if edge.end_node["energy"]])
+        view = topology.outgoing(tx, self.name)
+        minenergy = topology.minenergy(tx, self.name)
         recoverytime = (minenergy - agent["energy"]) / self.recoverrate
         if agent["energy"] < minenergy:
-            (falltime, falltype) = self.predictfall(agent["mob"])
-            t = 1
-            mob = agent["mob"]
-            while t < falltime:
-                mob = mob + self.mobchange
-                (nfalltime, nfalltype) = self.predictfall(mob)
-                if nfalltime + t < falltime:
-                    (falltime, falltype) = (nfalltime + t, nfalltype)
-                t = t + 1
+            rng = noderandom(tx, self.name, agent["id"])
+            (falltimes, falltypes) = predictfalls(np.array([agent["mob"]]), self.mobchange, rng)
+            (falltime, falltype) = (int(falltimes[0]), FALLTYPES[falltypes[0]])
             if falltime < recoverytime and not falltype == "Mild":
                 # Add agent to queue with fall
-                queuetime = falltime + intf.gettime(tx)
+                queuetime = falltime + currenttime(tx)
                 intf.updateagent(tx, agent["id"], "wellbeing", "Fallen")
-                if queuetime not in self.queue.keys():
-                    self.queue[queuetime] = {}
                 if falltype == "Severe":
                     dest = [edge for edge in view if edge.end_node["name"] == "Hos"]
-                    self.queue[queuetime][agent["id"]] = (dest[0], falltime)
-                    ag = FallAgent(agent["id"])
-                    ag.logging(tx, "Severe Fall, " + str(queuetime))
+                    self.queue.push(queuetime, agent["id"], (dest[0], falltime))
+                    appendlog(tx, agent["id"], ["Severe Fall"], [queuetime])
                 elif falltype == "Moderate":
                     dest = [edge for edge in view if edge.end_node["name"] == "GP"]
-                    self.queue[queuetime][agent["id"]] = (dest[0], falltime)
-                    ag = FallAgent(agent["id"])
-                    ag.logging(tx, "Moderate Fall, " + str(queuetime))
+                    self.queue.push(queuetime, agent["id"], (dest[0], falltime))
+                    appendlog(tx, agent["id"], ["Moderate Fall"], [queuetime])
             else:
                 # Add agent to queue with recovery
                 if falltype == "Mild":
-                    queuetime = falltime + intf.gettime(tx)
-                    ag = FallAgent(agent["id"])
-                    ag.logging(tx, "Mild Fall, " + str(queuetime))
+                    queuetime = falltime + currenttime(tx)
+                    appendlog(tx, agent["id"], ["Mild Fall"], [queuetime])
                     intf.updateagent(tx, agent["id"], "wellbeing", "Fallen")
-                if recoverytime + intf.gettime(tx) not in self.queue.keys():
-                    self.queue[recoverytime + intf.gettime(tx)] = {}
-                self.queue[recoverytime + intf.gettime(tx)][agent["id"]] = (None, recoverytime)
+                self.queue.push(recoverytime + currenttime(tx), agent["id"], (None, recoverytime))
         else:
             # Add agent to next time step - no waittime or dest
-            if intf.gettime(tx) + 1 not in self.queue.keys():
-                self.queue[intf.gettime(tx) + 1] = {}
-            self.queue[intf.gettime(tx) + 1][agent["id"]] = (None, None)
+            self.queue.push(currenttime(tx) + 1, agent["id"], (None, None))
 
     @staticmethod
-    def predictfall(mobility):
+    def predictfall(mobility, rng=None):
         """
         We predict how many time steps until the next fall of each type based on a poisson distribution with mean for
         severe falls:
@@ -592,23 +777,14 @@ class HomeNodeV0(FallNode):
         -log(1-0.9*mobility)
         mild falls:
         -log(1-0.7*mobility)
-        We return the earliest fall.
+        We return the earliest fall, ties go to the more severe fall.
 
         :param mobility: Agents current mobility
+        :param rng: (Optional) random generator, defaults to numpy.random
         :return: [fall time, fall type] for the fall occurring first
         """
-        serverfallprediction = npr.poisson(-np.log(1 - mobility), 1)
-        falltype = "Sever"
-        falltime = serverfallprediction
-        moderatefallprediction = npr.poisson(-np.log(1 - (mobility - 0.1 * mobility)), 1)
-        if moderatefallprediction < falltime:
-            falltype = "Moderate"
-            falltime = moderatefallprediction
-        mildfallprediction = npr.poisson(-np.log(1 - (mobility - 0.3 * mobility)), 1)
-        if mildfallprediction < falltime:
-            falltype = "Mild"
-            falltime = mildfallprediction
-        return falltime, falltype
+        (falltimes, falltypes) = falldraw(np.array([mobility]), rng)
+        return int(falltimes[0]), FALLTYPES[falltypes[0]]
 
 
 class HosNodeV0(FallNode):
@@ -618,7 +794,8 @@ class HosNodeV0(FallNode):
     """
 
     def __init__(self, name="Hos", mc=-0.1, rr=0.2, cc=-0.05):
-        super(HosNodeV0, self).__init__(name, queue={})
+        super(HosNodeV0, self).__init__(name, queue=EventQueue())
+        self.admissions = []
         self.mobchange = mc
         self.recoverrate = rr
         self.confchange = cc
@@ -635,23 +812,19 @@ class HosNodeV0(FallNode):
 
         :return:None
         """
+        # Queue the agents admitted since the last timestep
+        clock = currenttime(tx)
+        admitagents(tx, self.queue, self.admissions, noderandom(tx, self.name))
+        self.admissions = []
+        self.queue.advance(clock)
         # Apply changes from waittime not dest
         agents = intf.getnodeagents(tx, self.name)
-        clock = intf.gettime(tx)
-        if clock in self.queue.keys() and agents:
-            for ag in agents:
-                if ag["id"] in self.queue[clock].keys() and self.queue[clock][ag["id"]][1]:
-                    self.mobchange = intf.getnodevalue(tx, self.name, "modm", "Node", "name")
-                    self.confchange = intf.getnodevalue(tx, self.name, "modc", "Node", "name")
-                    self.recoverrate = intf.getnodevalue(tx, self.name, "energy", "Node", "name")
-                    intf.updateagent(tx, ag["id"], "mob",
-                                     npr.normal((self.queue[clock][ag["id"]][1] * self.mobchange), 1, 1)[0])
-                    intf.updateagent(tx, ag["id"], "conf",
-                                     npr.normal((self.queue[clock][ag["id"]][1] * self.confchange), 1, 1)[0])
-                    intf.updateagent(tx, ag["id"], "energy", self.queue[clock][ag["id"]][1] * self.recoverrate)
-                    intf.updateagent(tx, ag["id"], "referral", True)
-                    agent = FallAgent(ag["id"])
-                    agent.logging(tx, "Hos discharge, " + str(intf.gettime(tx)))
+        due = self.queue.due(clock)
+        if due and agents:
+            values = dischargeagents(tx, self.name, due, agents, [("mob", "modm"), ("conf", "modc")],
+                                     noderandom(tx, self.name))
+            if values:
+                (self.mobchange, self.confchange, self.recoverrate) = values
         super(HosNodeV0, self).agentsready(tx, intf)
 
     def agentperception(self, tx, agent, dest=None, waittime=None):
@@ -666,7 +839,8 @@ class HosNodeV0(FallNode):
         This means a fully healthy agent has a mean stay of 5 days in hospital after a severe fall. The predicted
         duration is drawn from a poisson distribution.
         The agent is added to the queue at t = current_time + predicted_duration
-        with destination home.
+        with destination home. Admissions are logged and queued together at the start of the nodes next timestep, see
+        admitagents.
 
         :param tx: neo4j database write transaction
         :param agent: agent database object returned from Interface
@@ -674,12 +848,6 @@ class HosNodeV0(FallNode):
         :return: None
         """
         view = super(HosNodeV0, self).agentprediction(tx, agent)[1:]
-        clock = intf.gettime(tx)
-        ag = FallAgent(agent["id"])
-        ag.logging(tx, "Hos admitted, " + str(clock))
         mean = min(-9 * min(agent["mob"], 1) + 14, -9 * (min(agent["conf_res"], 1) + min(agent["mob_res"], 1)) + 14)
-        time = npr.poisson(mean, 1)[0]
-        if clock + time not in self.queue.keys():
-            self.queue[clock + time] = {}
         dest = [edge for edge in view if edge.end_node["name"] == "Home"]
-        self.queue[clock + time][agent["id"]] = (dest[0], time)
+        self.admissions.append((agent["id"], mean, dest[0], currenttime(tx)))
@@ -0,0 +1,272 @@
+import numpy as np
+
+
+def shiftcapacity(txl, changes):
+    """
+    Utility function, applies a set of capacity changes to several nodes in one query. The changes are applied together
+    only if no capacity would fall below zero, so capacity moved between nodes is never lost or created part way.
+
+    :param txl: neo4j database write transaction
+    :param changes: dictionary of node name to change in capacity
+
+    :return: dictionary of node name to new capacity, empty if the changes were not applied
+    """
+    if not changes:
+        return {}
+    records = txl.run("UNWIND {changes} AS change "
+                      "MATCH (n:Node) "
+                      "WHERE n.name=change.name "
+                      "WITH collect(n) AS nodes, collect(change.change) AS deltas "
+                      "WHERE all(i IN range(0, size(nodes)-1) WHERE nodes[i].cap + deltas[i] >= 0) "
+                      "UNWIND range(0, size(nodes)-1) AS i "
+                      "WITH nodes[i] AS n, deltas[i] AS delta "
+                      "SET n.cap = n.cap + delta "
+                      "RETURN n.name, n.cap",
+                      changes=[{"name": name, "change": change} for name, change in changes.items()]).values()
+    return dict(records)
+
+
+class RingBuffer:
+    """
+    Fixed size window of the most recent values of a series. The sum of the values and of the values weighted by their
+    position in the window are updated as values are pushed, so the mean and least squares slope of the window are
+    given in constant time however long the run. An exponentially weighted moving average of every value pushed since
+    the buffer was last cleared is kept alongside.
+    """
+
+    def __init__(self, size, alpha=0.2):
+        """
+        :param size: number of values held
+        :param alpha: weight of the newest value in the moving average
+        """
+        self.size = size
+        self.alpha = alpha
+        self.values = np.zeros(size)
+        self.clear()
+
+    def clear(self):
+        """
+        Empties the buffer.
+
+        :return: None
+        """
+        self.start = 0
+        self.count = 0
+        self.total = 0.0
+        self.moment = 0.0
+        self.ewma = None
+
+    def push(self, value):
+        """
+        Adds a value, dropping the oldest value if the buffer is full.
+
+        :param value: new value
+
+        :return: None
+        """
+        if self.count < self.size:
+            self.values[(self.start + self.count) % self.size] = value
+            self.moment = self.moment + self.count * value
+            self.count = self.count + 1
+        else:
+            oldest = self.values[self.start]
+            # every value moves down one position and the new value takes the last
+            self.moment = self.moment - (self.total - oldest) + (self.size - 1) * value
+            self.total = self.total - oldest
+            self.values[self.start] = value
+            self.start = (self.start + 1) % self.size
+        self.total = self.total + value
+        self.ewma = value if self.ewma is None else self.alpha * value + (1 - self.alpha) * self.ewma
+
+    def last(self, steps=1):
+        """
+        :param steps: how far back to look, 1 is the newest value
+
+        :return: the value pushed steps - 1 pushes ago
+        """
+        if steps > self.count:
+            raise IndexError("RingBuffer holds " + str(self.count) + " values")
+        return self.values[(self.start + self.count - steps) % self.size]
+
+    def mean(self):
+        """
+        :return: mean of the values held, None if empty
+        """
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def slope(self):
+        """
+        :return: least squares slope of the values held against their position, None if fewer than two values
+        """
+        n = self.count
+        if n < 2:
+            return None
+        sx = n * (n - 1) / 2
+        sxx = (n - 1) * n * (2 * n - 1) / 6
+        return (n * self.moment - sx * self.total) / (n * sxx - sx * sx)
+
+    def __len__(self):
+        return self.count
+
+
+class WindowPolicy:
+    """
+    The original capacity rule. Once window values have been seen since the last change, capacity is moved to the
+    Intervention node if the average time since discharge has risen by more than rise over the last lag steps and is
+    above high, and moved away if it has fallen and is below low.
+    """
+
+    def __init__(self, window=20, lag=5, rise=1, fall=0, high=5, low=5):
+        self.window = window
+        self.lag = lag
+        self.rise = rise
+        self.fall = fall
+        self.high = high
+        self.low = low
+        self.size = max(window, lag)
+
+    def decide(self, history):
+        """
+        :param history: RingBuffer of average times since discharge
+
+        :return: 1 to add capacity to Intervention, -1 to remove it, 0 to leave it
+        """
+        if len(history) < self.window:
+            return 0
+        change = history.last(self.lag) - history.last()
+        if change < -self.rise and history.last() > self.high:
+            return 1
+        if change > self.fall and history.last() < self.low:
+            return -1
+        return 0
+
+
+class SlopePolicy:
+    """
+    Moves capacity on the trend of the whole window rather than two points of it. Capacity is added when the least
+    squares slope is above rise and the mean above high, and removed when the slope is below -rise and the mean below
+    low.
+    """
+
+    def __init__(self, window=20, rise=0.1, high=5, low=5):
+        self.window = window
+        self.rise = rise
+        self.high = high
+        self.low = low
+        self.size = window
+
+    def decide(self, history):
+        """
+        :param history: RingBuffer of average times since discharge
+
+        :return: 1 to add capacity to Intervention, -1 to remove it, 0 to leave it
+        """
+        if len(history) < self.window:
+            return 0
+        (slope, level) = (history.slope(), history.mean())
+        if slope > self.rise and level > self.high:
+            return 1
+        if slope < -self.rise and level < self.low:
+            return -1
+        return 0
+
+
+class EWMAPolicy:
+    """
+    Moves capacity on the exponentially weighted moving average of the time since discharge, adding capacity when it
+    is above high and removing it when it is below low, at most once every hold steps.
+    """
+
+    def __init__(self, alpha=0.2, hold=5, high=7, low=3):
+        self.alpha = alpha
+        self.hold = hold
+        self.high = high
+        self.low = low
+        self.size = hold
+
+    def decide(self, history):
+        """
+        :param history: RingBuffer of average times since discharge
+
+        :return: 1 to add capacity to Intervention, -1 to remove it, 0 to leave it
+        """
+        if len(history) < self.hold:
+            return 0
+        if history.ewma > self.high:
+            return 1
+        if history.ewma < self.low:
+            return -1
+        return 0
+
+
+class CapacityController:
+    """
+    Runs a capacity policy for the Balancer. Each step the average time since discharge of the agents at Intervention
+    is pushed to a RingBuffer, falling back to the previous average, or default if there is none, when no agent at
+    Intervention has been discharged. The policy decides from the buffer whether to move capacity, the change is
+    applied to Intervention, and taken from or given to InterventionOpen if dynamic, in one query, and the buffer is
+    cleared so the policy waits again before the next change.
+
+    Policies are objects with a size, the number of values they need held, and a decide(history) method returning 1, -1
+    or 0. Set capacitypolicy in the specification to use a policy other than the original WindowPolicy.
+    """
+
+    def __init__(self, policy=None, default=14):
+        """
+        :param policy: (Optional) capacity policy, defaults to WindowPolicy()
+        :param default: average used before any agent at Intervention has been discharged
+        """
+        self.policy = policy or WindowPolicy()
+        self.default = default
+        self.history = RingBuffer(self.policy.size, getattr(self.policy, "alpha", 0.2))
+
+    def observe(self, times):
+        """
+        Adds the average of a set of times since discharge to the history.
+
+        :param times: list of times since discharge
+
+        :return: the average added
+        """
+        if len(times):
+            average = float(np.mean(times))
+        elif len(self.history):
+            average = float(self.history.last())
+        else:
+            average = self.default
+        self.history.push(average)
+        return average
+
+    def decide(self, times, dynamic=True):
+        """
+        Observes the times since discharge and returns the capacity changes the policy decides on, clearing the history
+        if there are any.
+
+        :param times: list of times since discharge of the agents at Intervention
+        :param dynamic: move capacity from and to InterventionOpen rather than creating or removing it
+
+        :return: dictionary of node name to change in capacity, empty if nothing is to change
+        """
+        self.observe(times)
+        direction = self.policy.decide(self.history)
+        if not direction:
+            return {}
+        changes = {"Intervention": direction}
+        if dynamic:
+            changes["InterventionOpen"] = -direction
+        self.history.clear()
+        return changes
+
+    def step(self, txl, times, dynamic=True):
+        """
+        Observes the times since discharge and applies any change the policy decides on to the database.
+
+        :param txl: neo4j database write transaction
+        :param times: list of times since discharge of the agents at Intervention
+        :param dynamic: move capacity from and to InterventionOpen rather than creating or removing it
+
+        :return: dictionary of node name to new capacity, empty if nothing changed
+        """
+        return shiftcapacity(txl, self.decide(times, dynamic))
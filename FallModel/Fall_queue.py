@@ -0,0 +1,115 @@
+import heapq
+import math
+
+
+class EventQueue:
+    """
+    Waiting list for queued nodes. Agents are held in integer timestep slots, a time is rounded up to the slot in which
+    the agent is ready so agents queued at fractional times are still reached. The slot times are kept in a binary
+    heap, adding an agent is O(log n) and the slots that have passed are dropped as the node advances through time.
+    Each agent is held in at most one slot, queueing it again moves it.
+
+    The queue can be read like the dictionary of dictionaries the nodes used before, queue[time][agent id] gives the
+    (destination, duration) entry of an agent.
+    """
+
+    def __init__(self):
+        self.slots = {}
+        self.times = []
+        self.index = {}
+        self.visited = None
+
+    @staticmethod
+    def slot(time):
+        """
+        :param time: timestep, may be fractional
+
+        :return: integer slot the time falls in
+        """
+        return int(math.ceil(time))
+
+    def push(self, time, agent_id, entry):
+        """
+        Adds an agent to the queue, replacing any entry it already has. An agent ready in a slot the node has already
+        processed is put in the next slot, otherwise it would be dropped with the processed slots and never reached.
+
+        :param time: timestep at which the agent is ready
+        :param agent_id: id of the agent
+        :param entry: (destination edge, duration) tuple, either may be None
+
+        :return: None
+        """
+        self.remove(agent_id)
+        slot = self.slot(time)
+        if self.visited is not None:
+            slot = max(slot, self.visited + 1)
+        if slot not in self.slots:
+            self.slots[slot] = {}
+            heapq.heappush(self.times, slot)
+        self.slots[slot][agent_id] = entry
+        self.index[agent_id] = slot
+
+    def remove(self, agent_id):
+        """
+        Removes an agent from the queue if it is queued.
+
+        :param agent_id: id of the agent
+
+        :return: None
+        """
+        slot = self.index.pop(agent_id, None)
+        if slot is not None and slot in self.slots:
+            self.slots[slot].pop(agent_id, None)
+
+    def advance(self, time):
+        """
+        Moves the queue on to a timestep. Slots processed at earlier timesteps are dropped. Slots that were skipped over
+        without being processed are merged into the current slot so their agents are not left waiting forever.
+
+        :param time: current timestep
+
+        :return: None
+        """
+        current = self.slot(time)
+        if current == self.visited:
+            return
+        overdue = {}
+        while self.times and self.times[0] < current:
+            slot = heapq.heappop(self.times)
+            entries = self.slots.pop(slot)
+            if self.visited is None or slot > self.visited:
+                overdue.update(entries)
+            else:
+                for agent_id in entries:
+                    if self.index.get(agent_id) == slot:
+                        del self.index[agent_id]
+        for agent_id, entry in overdue.items():
+            if self.index.get(agent_id) is not None and self.index[agent_id] < current:
+                self.push(current, agent_id, entry)
+        self.visited = current
+
+    def due(self, time):
+        """
+        :param time: current timestep
+
+        :return: dictionary of agent id to (destination, duration) for the agents ready at this timestep
+        """
+        return self.slots.get(self.slot(time), {})
+
+    def keys(self):
+        return self.slots.keys()
+
+    def items(self):
+        return self.slots.items()
+
+    def get(self, time, default=None):
+        return self.slots.get(self.slot(time), default)
+
+    def __contains__(self, time):
+        return self.slot(time) in self.slots
+
+    def __getitem__(self, time):
+        return self.slots[self.slot(time)]
+
+    def __len__(self):
+        return len(self.index)
@@ -0,0 +1,120 @@
+import zlib
+import numpy as np
+from FallModel.Fall_clock import currenttime
+
+AGENT = 0
+NODE = 1
+POPULATION = 2
+
+
+def streamkey(value):
+    """
+    Utility function, converts a part of a stream key to a non negative integer. Names are hashed with crc32 so the
+    key is the same in every process.
+
+    :param value: integer id or string name
+
+    :return: non negative integer
+    """
+    if isinstance(value, str):
+        return zlib.crc32(value.encode("utf-8"))
+    return int(value)
+
+
+class RandomStreams:
+    """
+    Random number streams for agents and nodes spawned from one run seed with numpy's SeedSequence. A stream is
+    identified by its scope, the timestep and the ids of the agent or node it belongs to, so the numbers an agent or
+    node draws do not depend on the order in which agents and nodes are processed, or on which process runs them. The
+    generator for a stream is kept for the rest of the timestep so successive draws continue the same stream.
+    """
+
+    def __init__(self, seed=None):
+        """
+        :param seed: (Optional) run seed, read from specification.seed on first use if not given. Without a seed fresh
+         entropy is used and runs are not reproducible
+        """
+        self.root = None
+        self.time = None
+        self.streams = {}
+        if seed is not None:
+            self.seed(seed)
+
+    def seed(self, seed=None):
+        """
+        Sets the run seed and drops all streams.
+
+        :param seed: run seed
+
+        :return: None
+        """
+        self.root = np.random.SeedSequence(seed)
+        self.time = None
+        self.streams = {}
+
+    def generator(self, scope, time, *keys):
+        """
+        Returns the generator for a stream, spawning it from the run seed the first time it is used in a timestep.
+
+        :param scope: AGENT, NODE or POPULATION
+        :param time: current timestep
+        :param keys: ids or names identifying the stream within the scope
+
+        :return: numpy random Generator
+        """
+        if self.root is None:
+            # the specification imports the model modules so it is only read once they are loaded
+            import specification
+            self.seed(getattr(specification, "seed", None))
+        if time != self.time:
+            self.streams = {}
+            self.time = time
+        key = (scope, streamkey(time)) + tuple(streamkey(k) for k in keys)
+        rng = self.streams.get(key)
+        if rng is None:
+            sequence = np.random.SeedSequence(self.root.entropy, spawn_key=key)
+            rng = np.random.Generator(np.random.PCG64(sequence))
+            self.streams[key] = rng
+        return rng
+
+
+streams = RandomStreams()
+
+
+def agentrandom(tx, agent_id):
+    """
+    Utility function, returns the random stream of an agent for the current timestep.
+
+    :param tx: neo4j database transaction
+    :param agent_id: id of the agent
+
+    :return: numpy random Generator
+    """
+    return streams.generator(AGENT, currenttime(tx), agent_id)
+
+
+def noderandom(tx, name, agent_id=None):
+    """
+    Utility function, returns the random stream of a node for the current timestep. Draws a node makes about one agent
+    use a stream for that agent so they do not depend on the order the node processes its agents.
+
+    :param tx: neo4j database transaction
+    :param name: name of the node
+    :param agent_id: (Optional) id of the agent the draws are made for
+
+    :return: numpy random Generator
+    """
+    if agent_id is None:
+        return streams.generator(NODE, currenttime(tx), name)
+    return streams.generator(NODE, currenttime(tx), name, agent_id)
+
+
+def populationrandom(tx):
+    """
+    Utility function, returns the random stream used to generate new agents in the current timestep.
+
+    :param tx: neo4j database transaction
+
+    :return: numpy random Generator
+    """
+    return streams.generator(POPULATION, currenttime(tx))
@@ -1,8 +1,11 @@
 from FallModel.Fall_agent import FallAgent, Patient
 import SPmodelling.Interface as intf
 from SPmodelling.Reset import Reset as SPreset
-import numpy.random as npr
 import specification
+from FallModel.Fall_clock import currenttime
+from FallModel.Fall_random import populationrandom
+from FallModel.Fall_social import socialgraph, locationindex
+from FallModel.Fall_topology import topology
 
 
 class Reset(SPreset):
@@ -50,6 +53,7 @@ class Reset(SPreset):
 
         :return: None
         """
+        topology.clear()
         tx.run("MATCH (a), (b) "
                "WHERE a.name='Hos' AND b.name='Home' "
                "CREATE (a)-[r:REACHES {mood:0, energy:-0.1, type:'inactive'}]->(b)")
@@ -124,30 +128,90 @@ class Reset(SPreset):
 
         :return: None
         """
+        socialgraph.clear()
+        locationindex.invalidate()
+        rng = populationrandom(tx)
         fa = Patient(None)
         for j in range(ps//4):
             tx.run("CREATE (a:Carer {id:{j_id}, energy:20})", j_id=j)
         for i in range(ps):
             fa.generator(tx, [0.8, 0.9, 1, [2, 0, 1, 2], 2, 8])
-            if npr.random(1) < 0.5:
-                if npr.random(1) < 0.5:
+            if rng.random() < 0.5:
+                if rng.random() < 0.5:
                     samplesize = 2
                 else:
                     samplesize = 1
-                newfriends = npr.choice(range(ps//4), size=samplesize, replace=False)
+                newfriends = rng.choice(ps//4, size=samplesize, replace=False)
                 for nf in newfriends:
                     intf.createedge(tx, i, nf, 'Agent', 'Carer', 'SOCIAL', 'created: '
-                                    + str(intf.gettime(tx)) + ', usage: ' + str(intf.gettime(tx)) + ', carer: True')
+                                    + str(currenttime(tx)) + ', usage: ' + str(currenttime(tx)) + ', carer: True')
                     intf.createedge(tx, i, nf, 'Agent', 'Carer', 'FRIEND')
         for i in range(ps):
-            newfriends = npr.choice(range(ps), size=npr.choice(range(3)), replace=False)
+            newfriends = rng.choice(ps, size=rng.integers(3), replace=False)
             for nf in newfriends:
                 if not nf == i:
                     intf.createedge(tx, i, nf, 'Agent', 'Agent', 'SOCIAL', 'created: '
-                                    + str(intf.gettime(tx)) + ', usage: ' + str(intf.gettime(tx)) + ', carer: False')
+                                    + str(currenttime(tx)) + ', usage: ' + str(currenttime(tx)) + ', carer: False')
                     intf.createedge(tx, i, nf, 'Agent', 'Agent', 'FRIEND')
 
 
+def v0nodes():
+    """
+    Utility function, describes the nodes of the version 0 Fall Model network. The existence of the Open Intervention
+    node and the nodes capacities are given in the specification file.
+
+    :return: list of node property dictionaries
+    """
+    nodes = [{"name": "Hos", "energy": 0.2, "modm": -0.1, "modc": -0.05},
+             {"name": "Home", "energy": 0.3},
+             {"name": "Social", "energy": -0.4, "modm": 0.05, "modc": 0.2, "modrc": 0.2},
+             {"name": "Intervention", "energy": -0.8, "modm": 0.3, "modc": 0.3, "cap": specification.Intervention_cap,
+              "load": 0}]
+    if specification.Open_Intervention:
+        nodes = nodes + [{"name": "InterventionOpen", "energy": -0.8, "modm": 0.3, "modc": 0.3,
+                          "cap": specification.Open_Intervention_cap, "load": 0}]
+    nodes = nodes + [{"name": "Care", "time": "t", "interval": 0, "mild": 0, "moderate": 0, "severe": 0, "agents": 0},
+                     {"name": "GP"}]
+    return nodes
+
+
+def v0edges():
+    """
+    Utility function, describes the REACHES edges of the version 0 Fall Model network. The variation in edges depends
+    on existence of Open Intervention and the types of agents allowed along the edge to the Open Intervention node, this
+    is given in the specification file.
+
+    :return: list of tuples (<start node name>, <end node name>, <edge property dictionary>)
+    """
+    fall_gp = {"worth": -5, "effort": 0, "mobility": 1, "confidence": 1, "energy": -0.3, "modm": -0.1, "modc": -0.025}
+    fall_hos = {"effort": 0, "mobility": 1, "confidence": 1, "energy": -0.8, "modm": -0.25, "modc": -0.35}
+    edges = [("Hos", "Home", {"effort": 0.01, "mobility": 1, "confidence": 1, "energy": -0.1, "worth": 0.1}),
+             ("Home", "GP", dict(fall_gp)),
+             ("Intervention", "GP", dict(fall_gp)),
+             ("Social", "GP", dict(fall_gp)),
+             ("GP", "Hos", {"effort": 0, "mobility": 1, "confidence": 1}),
+             ("GP", "Home", {"effort": 0, "mobility": 1, "confidence": 1}),
+             ("Home", "Social", {"effort": 0.1, "mobility": 0.6, "confidence": 0.4, "worth": 1}),
+             ("Social", "Home", {"effort": 0, "mobility": 1, "confidence": 1, "worth": 0}),
+             ("Home", "Intervention", {"effort": 0.3, "mobility": 0.5, "confidence": 0.5, "worth": 2,
+                                       "allowed": "Fallen", "ref": "True"}),
+             ("Intervention", "Home", {"effort": 0, "mobility": 1, "confidence": 1, "worth": 1}),
+             # Falls
+             ("Intervention", "Hos", dict(fall_hos)),
+             ("Social", "Hos", dict(fall_hos)),
+             ("Home", "Hos", dict(fall_hos, modc=-0.5)),
+             ("Home", "Care", {"effort": 0, "worth": -1, "mobility": 1, "confidence": 1}),
+             ("Hos", "Care", {"effort": 0, "worth": -100, "mobility": 1, "confidence": 1})]
+    if specification.Open_Intervention:
+        edges = edges + [("InterventionOpen", "GP", dict(fall_gp)),
+                         ("InterventionOpen", "Hos", dict(fall_hos)),
+                         ("InterventionOpen", "Home", {"effort": 0, "mobility": 1, "confidence": 1, "worth": 1}),
+                         ("Home", "InterventionOpen", {"effort": 0.3, "mobility": 0.5, "confidence": 0.5, "worth": 2,
+                                                       "allowed": specification.Open_Intervention_Limits,
+                                                       "ref": "False"})]
+    return edges
+
+
 class ResetV0(SPreset):
     """
     Subclass of the SPmodelling Reset class. It is set to generate the networks currently used in Fall models and
@@ -170,16 +234,8 @@ class ResetV0(SPreset):
 
         :return: None
         """
-        tx.run("CREATE (a:Node {name:'Hos', energy:0.2, modm:-0.1, modc:-0.05})")
-        tx.run("CREATE (a:Node {name:'Home', energy:0.3})")
-        tx.run("CREATE (a:Node {name:'Social', energy:-0.4, modm:0.05, modc:0.2, modrc:0.2})")
-        tx.run("CREATE (a:Node {name:'Intervention', energy:-0.8, modm:0.3, modc:0.3, cap:{c}, load:0})",
-               c=specification.Intervention_cap)
-        if specification.Open_Intervention:
-            tx.run("CREATE (a:Node {name:'InterventionOpen', energy:-0.8, modm:0.3, modc:0.3, cap:{c}, load:0})",
-                   c=specification.Open_Intervention_cap)
-        tx.run("CREATE (a:Node {name:'Care', time:'t', interval:0, mild:0, moderate:0, severe:0, agents:0})")
-        tx.run("CREATE (a:Node {name:'GP'})")
+        for props in v0nodes():
+            tx.run("CREATE (a:Node {props})", props=props)
 
     @staticmethod
     def set_edges(tx):
@@ -192,72 +248,12 @@ class ResetV0(SPreset):
 
         :return: None
         """
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Hos' AND b.name='Home' "
-               "CREATE (a)-[r:REACHES {effort:0.01, mobility:1, confidence:1, energy:-0.1, worth:0.1}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Home' AND b.name='GP' "
-               "CREATE (a)-[r:REACHES {worth:-5, effort:0, mobility:1, confidence:1, energy: -0.3, modm:-0.1, "
-               "modc:-0.025}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Intervention' AND b.name='GP' "
-               "CREATE (a)-[r:REACHES {worth:-5, effort:0, mobility:1, confidence:1, energy: -0.3, modm:-0.1, "
-               "modc:-0.025}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Social' AND b.name='GP' "
-               "CREATE (a)-[r:REACHES {worth:-5, effort:0, mobility:1, confidence:1, energy: -0.3, modm:-0.1, "
-               "modc:-0.025}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='GP' AND b.name='Hos' "
-               "CREATE (a)-[r:REACHES {effort:0, mobility:1, confidence:1}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='GP' AND b.name='Home' "
-               "CREATE (a)-[r:REACHES {effort:0, mobility:1, confidence:1}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Home' AND b.name='Social' "
-               "CREATE (a)-[r:REACHES {effort:0.1, mobility:0.6, confidence:0.4, worth:1}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Social' AND b.name='Home' "
-               "CREATE (a)-[r:REACHES {effort:0, mobility:1, confidence:1, worth:0}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Home' AND b.name='Intervention' "
-               "CREATE (a)-[r:REACHES {effort:0.3, mobility:0.5, confidence:0.5, worth:2, allowed:'Fallen', "
-               "ref:'True'}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Intervention' AND b.name='Home' "
-               "CREATE (a)-[r:REACHES {effort:0, mobility:1, confidence:1, worth:1}]->(b)")
-        # Falls
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Intervention' AND b.name='Hos' "
-               "CREATE (a)-[r:REACHES {effort:0, mobility:1, confidence:1, energy: -0.8, modm:-0.25, modc:-0.35}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Social' AND b.name='Hos' "
-               "CREATE (a)-[r:REACHES {effort:0, mobility:1, confidence:1, energy: -0.8, modm:-0.25, modc:-0.35}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Home' AND b.name='Hos' "
-               "CREATE (a)-[r:REACHES {effort:0, mobility:1, confidence:1, energy: -0.8, modm:-0.25, modc:-0.5}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Home' AND b.name='Care' "
-               "CREATE (a)-[r:REACHES {effort:0, worth:-1, mobility:1, confidence:1}]->(b)")
-        tx.run("MATCH (a), (b) "
-               "WHERE a.name='Hos' AND b.name='Care' "
-               "CREATE (a)-[r:REACHES {effort:0, worth:-100, mobility:1, confidence:1}]->(b)")
-        if specification.Open_Intervention:
+        topology.clear()
+        for (start, end, props) in v0edges():
             tx.run("MATCH (a), (b) "
-                   "WHERE a.name='InterventionOpen' AND b.name='GP' "
-                   "CREATE (a)-[r:REACHES {worth:-5, effort:0, mobility:1, confidence:1, energy: -0.3, modm:-0.1, "
-                   "modc:-0.025}]->(b)")
-            tx.run("MATCH (a), (b) "
-                   "WHERE a.name='InterventionOpen' AND b.name='Hos' "
-                   "CREATE (a)-[r:REACHES {effort:0, mobility:1, confidence:1, energy: -0.8, modm:-0.25, "
-                   "modc:-0.35}]->(b)")
-            tx.run("MATCH (a), (b) "
-                   "WHERE a.name='InterventionOpen' AND b.name='Home' "
-                   "CREATE (a)-[r:REACHES {effort:0, mobility:1, confidence:1, worth:1}]->(b)")
-            tx.run("MATCH (a), (b) "
-                   "WHERE a.name='Home' AND b.name='InterventionOpen' "
-                   "CREATE (a)-[r:REACHES {effort:0.3, mobility:0.5, confidence:0.5, worth:2, allowed:{limits}, "
-                   "ref:'False'}]->(b)", limits=specification.Open_Intervention_Limits)
+                   "WHERE a.name={start} AND b.name={end} "
+                   "CREATE (a)-[r:REACHES]->(b) "
+                   "SET r = {props}", start=start, end=end, props=props)
 
     @staticmethod
     def generate_population(tx, ps):
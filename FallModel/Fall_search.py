@@ -0,0 +1,163 @@
+import copy
+import math
+import multiprocessing
+import numpy as np
+from FallModel.Fall_engine import PopulationEngine
+from FallModel.Fall_policy import CapacityController, WindowPolicy, SlopePolicy, EWMAPolicy
+
+# Default search space, node capacities and for each policy the values tried for each of its parameters
+SPACE = {"Intervention_cap": (0, 1, 2, 4, 8),
+         "Open_Intervention_cap": (0, 1, 2, 4, 8),
+         "policies": ((WindowPolicy, {"window": (10, 20, 30), "lag": (3, 5, 8), "rise": (0.5, 1, 2), "high": (3, 5, 7),
+                                      "low": (3, 5, 7)}),
+                      (SlopePolicy, {"window": (10, 20, 30), "rise": (0.05, 0.1, 0.2), "high": (3, 5, 7),
+                                     "low": (3, 5, 7)}),
+                      (EWMAPolicy, {"alpha": (0.1, 0.2, 0.4), "hold": (3, 5, 10), "high": (5, 7, 9),
+                                    "low": (1, 3, 5)}))}
+
+
+def candidates(space, count, seed=None):
+    """
+    Utility function, draws candidate capacity settings from a search space. Each candidate has an Intervention and
+    Open Intervention capacity, a policy class chosen with equal probability and a value for each of its parameters.
+
+    :param space: search space in the form of SPACE
+    :param count: number of candidates
+    :param seed: (Optional) seed for the draws
+
+    :return: list of candidate dictionaries
+    """
+    rng = np.random.default_rng(seed)
+    drawn = []
+    for _ in range(count):
+        (policy, parameters) = space["policies"][rng.integers(len(space["policies"]))]
+        drawn.append({"Intervention_cap": space["Intervention_cap"][rng.integers(len(space["Intervention_cap"]))],
+                      "Open_Intervention_cap":
+                          space["Open_Intervention_cap"][rng.integers(len(space["Open_Intervention_cap"]))],
+                      "policy": policy,
+                      "params": {name: values[rng.integers(len(values))] for name, values in parameters.items()}})
+    return drawn
+
+
+def evaluate(topology, candidate, ticks, size=1000, seed=None, dynamic=True):
+    """
+    Utility function, runs the population engine with a candidate capacity setting, applying its policy to the engine
+    network every tick as the Balancer would to the database.
+
+    :param topology: Topology of the network, copied so the run does not change it
+    :param candidate: candidate dictionary, see candidates
+    :param ticks: number of ticks to run
+    :param size: population size
+    :param seed: (Optional) seed for the engine
+    :param dynamic: move capacity between Intervention and InterventionOpen rather than creating or removing it
+
+    :return: (system interval, mean number of agents at intervention nodes per tick)
+    """
+    topology = copy.deepcopy(topology)
+    nodes = {name: topology.node(name) for name in ("Intervention", "InterventionOpen")}
+    nodes = {name: node for name, node in nodes.items() if node >= 0}
+    for name, node in nodes.items():
+        topology.cap[node] = candidate["Intervention_cap" if name == "Intervention" else "Open_Intervention_cap"]
+    controller = CapacityController(candidate["policy"](**candidate["params"]))
+    occupancy = []
+
+    def balance(engine):
+        at = engine.alive & (engine.loc == nodes.get("Intervention", -1)) & ~np.isnan(engine.lastdischarge)
+        changes = controller.decide(engine.time - engine.lastdischarge[at], dynamic)
+        changes = {nodes[name]: change for name, change in changes.items() if name in nodes}
+        if changes and all(topology.cap[node] + change >= 0 for node, change in changes.items()):
+            for node, change in changes.items():
+                topology.cap[node] = topology.cap[node] + change
+        occupancy.append(sum(np.count_nonzero(engine.alive & (engine.loc == node)) for node in nodes.values()))
+
+    engine = PopulationEngine(topology, size, seed=seed)
+    engine.run(ticks, balance)
+    return engine.interval, float(np.mean(occupancy)) if occupancy else 0.0
+
+
+def _evaluate(arguments):
+    (topology, candidate, ticks, size, seeds, dynamic) = arguments
+    scores = [evaluate(topology, candidate, ticks, size, seed, dynamic) for seed in seeds]
+    return tuple(np.mean(scores, axis=0).tolist())
+
+
+def paretoranks(scores):
+    """
+    Utility function, sorts scores into successive Pareto fronts, a higher system interval and a lower intervention load
+    both being better.
+
+    :param scores: list of (system interval, intervention load) tuples
+
+    :return: array of the front number of each score, 0 for the non-dominated front
+    """
+    scores = np.asarray(scores, dtype=float).reshape(-1, 2)
+    interval = scores[:, 0][:, None]
+    load = scores[:, 1][:, None]
+    dominates = (interval >= interval.T) & (load <= load.T) & ((interval > interval.T) | (load < load.T))
+    ranks = np.full(len(scores), -1)
+    remaining = np.arange(len(scores))
+    front = 0
+    while len(remaining):
+        dominated = dominates[np.ix_(remaining, remaining)].any(axis=0)
+        ranks[remaining[~dominated]] = front
+        remaining = remaining[dominated]
+        front = front + 1
+    return ranks
+
+
+def search(topology, space=SPACE, count=64, budget=(50, 400), eta=2, size=1000, seeds=(0,), dynamic=True,
+           processes=None, seed=None):
+    """
+    Searches capacity settings and policies by successive halving. All candidates are run for the smallest number of
+    ticks, the best 1/eta of them by Pareto front, then by system interval, are run again for eta times as many ticks,
+    and so on until the largest number of ticks is reached. Runs are spread over a process pool.
+
+    :param topology: Topology of the network, see Topology.fromspec
+    :param space: search space in the form of SPACE
+    :param count: number of candidates to start with
+    :param budget: (smallest, largest) number of ticks per run
+    :param eta: factor candidates are cut by and ticks are increased by each round
+    :param size: population size
+    :param seeds: engine seeds each candidate is run with, the scores are averaged
+    :param dynamic: move capacity between Intervention and InterventionOpen rather than creating or removing it
+    :param processes: (Optional) number of worker processes, defaults to the number of CPUs, 1 runs in this process
+    :param seed: (Optional) seed for drawing the candidates
+
+    :return: (list of (candidate, ticks, system interval, intervention load) for every run, Pareto front of the final
+             round in the same form ordered by intervention load)
+    """
+    pool = multiprocessing.Pool(processes) if processes != 1 else None
+    remaining = candidates(space, count, seed)
+    ticks = budget[0]
+    results = []
+    try:
+        while True:
+            work = [(topology, candidate, ticks, size, seeds, dynamic) for candidate in remaining]
+            scores = pool.map(_evaluate, work) if pool else [_evaluate(arguments) for arguments in work]
+            results = results + [(candidate, ticks) + score for candidate, score in zip(remaining, scores)]
+            ranks = paretoranks(scores)
+            if ticks >= budget[1] or len(remaining) == 1:
+                break
+            order = sorted(range(len(remaining)), key=lambda i: (ranks[i], -scores[i][0]))
+            remaining = [remaining[i] for i in order[:max(1, math.ceil(len(remaining) / eta))]]
+            ticks = min(ticks * eta, budget[1])
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    final = results[-len(remaining):]
+    front = sorted([result for result, rank in zip(final, ranks) if rank == 0], key=lambda result: result[3])
+    return results, front
+
+
+def describe(candidate):
+    """
+    Utility function, formats a candidate as a line of text.
+
+    :param candidate: candidate dictionary, see candidates
+
+    :return: string
+    """
+    return ("Intervention_cap=" + str(candidate["Intervention_cap"]) + " Open_Intervention_cap=" +
+            str(candidate["Open_Intervention_cap"]) + " " + candidate["policy"].__name__ + "(" +
+            ", ".join(name + "=" + str(value) for name, value in candidate["params"].items()) + ")")
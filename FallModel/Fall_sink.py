@@ -0,0 +1,190 @@
+import atexit
+import os
+import struct
+import numpy as np
+
+MAGIC = b"FMEX0001"
+# agent id, exit time and length of the utf-8 log that follows
+RECORD = struct.Struct("<qqI")
+# agent id, exit time and offset of the record in the record file
+INDEX = np.dtype([("id", "<i8"), ("time", "<i8"), ("offset", "<u8")])
+
+
+def readrecord(file, offset, size):
+    """
+    Utility function, reads the header of a record of an open record file.
+
+    :param file: record file opened for binary reading
+    :param offset: offset of the record
+    :param size: size of the record file in bytes
+
+    :return: (<agent id>, <exit time>, <log length>), None if there is no complete record at the offset
+    """
+    if offset < len(MAGIC) or offset + RECORD.size > size:
+        return None
+    file.seek(offset)
+    header = RECORD.unpack(file.read(RECORD.size))
+    if offset + RECORD.size + header[2] > size:
+        return None
+    return header
+
+
+def scanrecords(file, offset, size):
+    """
+    Utility function, lists the complete records of an open record file from an offset, stopping at the end of the file
+    or at a record cut short by an interrupted write.
+
+    :param file: record file opened for binary reading
+    :param offset: offset of the first record
+    :param size: size of the record file in bytes
+
+    :return: list of (<offset>, <agent id>, <exit time>, <log length>) tuples
+    """
+    found = []
+    header = readrecord(file, offset, size)
+    while header is not None:
+        found.append((offset,) + header)
+        offset = offset + RECORD.size + header[2]
+        header = readrecord(file, offset, size)
+    return found
+
+
+class ExitSink:
+    """
+    Append only store of the logs of agents leaving the system. Logs are written as length framed records to
+    <path>.rec, each with an entry in the fixed width index <path>.idx so the log of any agent can be found without
+    reading the whole file. Both files are held open for the run with large write buffers and are flushed and closed
+    when the process exits. The records of a batch are flushed before their index entries are written so the index
+    never points past the records on disk, and files left out of step by an interrupted run are repaired when they are
+    opened again, see recover.
+    """
+
+    def __init__(self, path, buffersize=1 << 20):
+        """
+        :param path: path of the files without their extensions
+        :param buffersize: size of the write buffers in bytes
+        """
+        self.path = path
+        self.recover()
+        self.records = open(path + ".rec", "ab", buffering=buffersize)
+        self.index = open(path + ".idx", "ab", buffering=buffersize)
+        if self.records.tell() == 0:
+            self.records.write(MAGIC)
+        self.offset = self.records.tell()
+        atexit.register(self.close)
+
+    def recover(self):
+        """
+        Brings existing files back in step after an interrupted run. A record cut short is dropped from the record
+        file, index entries without a complete record are dropped and complete records missing from the index are
+        indexed.
+
+        :return: None
+        """
+        if not os.path.exists(self.path + ".rec") or os.path.getsize(self.path + ".rec") < len(MAGIC):
+            return
+        index = readindex(self.path)
+        size = os.path.getsize(self.path + ".rec")
+        with open(self.path + ".rec", "rb") as file:
+            while len(index) and readrecord(file, int(index["offset"][-1]), size) is None:
+                index = index[:-1]
+            start = len(MAGIC)
+            if len(index):
+                start = int(index["offset"][-1]) + RECORD.size + readrecord(file, int(index["offset"][-1]), size)[2]
+            found = scanrecords(file, start, size)
+        end = found[-1][0] + RECORD.size + found[-1][3] if found else start
+        if end < size:
+            with open(self.path + ".rec", "r+b") as file:
+                file.truncate(end)
+        missing = np.array([(agent_id, time, offset) for offset, agent_id, time, _ in found], dtype=INDEX)
+        if os.path.exists(self.path + ".idx") and os.path.getsize(self.path + ".idx") != index.nbytes or len(missing):
+            np.concatenate([index, missing]).tofile(self.path + ".idx")
+
+    def write(self, entries):
+        """
+        Appends the logs of a batch of agents. The records are flushed before the index entries are written.
+
+        :param entries: list of (<agent id>, <exit time>, <log string>) tuples
+
+        :return: None
+        """
+        if not entries:
+            return
+        chunks = []
+        index = np.zeros(len(entries), dtype=INDEX)
+        for i, (agent_id, time, log) in enumerate(entries):
+            payload = log.encode("utf-8")
+            index[i] = (agent_id, time, self.offset)
+            chunks.append(RECORD.pack(agent_id, time, len(payload)))
+            chunks.append(payload)
+            self.offset = self.offset + RECORD.size + len(payload)
+        self.records.write(b"".join(chunks))
+        self.records.flush()
+        self.index.write(index.tobytes())
+
+    def flush(self):
+        """
+        Writes any buffered logs to disk.
+
+        :return: None
+        """
+        if not self.records.closed:
+            self.records.flush()
+            self.index.flush()
+
+    def close(self):
+        """
+        Flushes and closes the files, safe to call more than once.
+
+        :return: None
+        """
+        if not self.records.closed:
+            self.flush()
+            self.records.close()
+            self.index.close()
+
+
+def readindex(path):
+    """
+    Utility function, reads the index of an exit log. A partly written last entry and entries pointing past the end
+    of the record file are left out.
+
+    :param path: path of the files without their extensions
+
+    :return: numpy structured array with fields id, time and offset
+    """
+    if not os.path.exists(path + ".idx"):
+        return np.zeros(0, dtype=INDEX)
+    with open(path + ".idx", "rb") as file:
+        data = file.read()
+    index = np.frombuffer(data[:len(data) - len(data) % INDEX.itemsize], dtype=INDEX)
+    size = os.path.getsize(path + ".rec") if os.path.exists(path + ".rec") else 0
+    return index[index["offset"] + RECORD.size <= size].copy()
+
+
+def readexits(path, offsets=None):
+    """
+    Utility function, reads logs from an exit log. Without offsets every complete record is read in order from the
+    record file. Given offsets must each point at a complete record, and given index entries must also match the id
+    and exit time of their record, otherwise the files are out of step and a ValueError is raised.
+
+    :param path: path of the files without their extensions
+    :param offsets: (Optional) record offsets, or entries from readindex, to read
+
+    :return: list of (<agent id>, <exit time>, <log string>) tuples
+    """
+    entries = []
+    size = os.path.getsize(path + ".rec")
+    with open(path + ".rec", "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + ".rec is not an exit log")
+        if offsets is None:
+            offsets = [offset for offset, _, _, _ in scanrecords(file, len(MAGIC), size)]
+        for entry in offsets:
+            offset = int(entry["offset"] if isinstance(entry, np.void) else entry)
+            header = readrecord(file, offset, size)
+            if header is None or isinstance(entry, np.void) and header[:2] != (entry["id"], entry["time"]):
+                raise ValueError(path + ".rec has no record matching index entry at offset " + str(offset))
+            (agent_id, time, length) = header
+            entries.append((agent_id, time, file.read(length).decode("utf-8")))
+    return entries
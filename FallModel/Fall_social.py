@@ -0,0 +1,446 @@
+import heapq
+import numpy as np
+
+
+STRIDE = 1 << 32
+
+
+def socialkey(labels, agent_id):
+    """
+    Utility function, builds the key used for a node of the social network. Patients and carers are numbered
+    separately so the label is part of the key.
+
+    :param labels: label or list of labels of the node
+    :param agent_id: id of the node
+
+    :return: (<label>, <id>) tuple
+    """
+    if isinstance(labels, str):
+        labels = labels.split(":")
+    if "Carer" in labels:
+        return "Carer", agent_id
+    return "Agent", agent_id
+
+
+def evictions(friends, carers, limit, time, recent=5):
+    """
+    Utility function, picks the social links a patient drops when it has more than it can manage. If the carers alone
+    reach the limit every friend is dropped along with the most recently created carers over the limit. Otherwise
+    friends created in the last recent timesteps are dropped newest first, followed by the friends with the oldest last
+    usage, until the patient is within its limit. Only the links dropped are ordered, using heaps.
+
+    :param friends: list of the patients links to other patients
+    :param carers: list of the patients links to carers
+    :param limit: number of links the patient can manage
+    :param time: current timestep
+    :param recent: number of timesteps a new friendship is kept at risk for
+
+    :return: list of (<label>, <id>) keys of the contacts to drop
+    """
+    excess = len(friends) + len(carers) - limit
+    if excess <= 0:
+        return []
+    if len(carers) >= limit:
+        drops = [("Agent", friend.end_node["id"]) for friend in friends]
+        newest = heapq.nlargest(len(carers) - limit, carers, key=lambda carer: carer["created"])
+        return drops + [("Carer", carer.end_node["id"]) for carer in newest]
+    newfriends = [friend for friend in friends if time - friend["created"] < recent]
+    drops = heapq.nlargest(excess, newfriends, key=lambda friend: friend["created"])
+    if len(drops) < excess:
+        dropped = {id(friend) for friend in drops}
+        older = [friend for friend in friends if id(friend) not in dropped]
+        drops = drops + heapq.nsmallest(excess - len(drops), older, key=lambda friend: friend["usage"])
+    return [("Agent", friend.end_node["id"]) for friend in drops]
+
+
+def deletecontacts(tx, agent_id, keys):
+    """
+    Utility function, deletes a set of a patients social links in a single query.
+
+    :param tx: neo4j database write transaction
+    :param agent_id: id of the patient
+    :param keys: list of (<label>, <id>) keys of the contacts to drop
+
+    :return: None
+    """
+    if keys:
+        tx.run("UNWIND {keys} AS key "
+               "MATCH (a:Agent)-[r:SOCIAL|FRIEND]-(b) "
+               "WHERE a.id={agent_id} AND b.id=key.id AND key.label IN labels(b) "
+               "DELETE r", agent_id=agent_id, keys=[{"label": label, "id": other} for label, other in keys])
+
+
+class SocialGraph:
+    """
+    In memory mirror of the SOCIAL and FRIEND links between patients and carers. The links read from the database are
+    held in compressed sparse row form, links created or deleted since are held as a small overlay which is folded into
+    the rows once it grows past a fraction of the graph. Contact lists and distances are answered without querying the
+    database. The mirror is read again the first time it is used in a timestep, so links changed by other processes,
+    such as agents deleted at Care by the Flow process, are picked up by the next timestep. Changes to the links made
+    in this process must also be passed to add or remove.
+    """
+
+    def __init__(self, compact=0.1):
+        """
+        :param compact: fraction of the number of links the overlay may reach before the rows are rebuilt
+        """
+        self.compact = compact
+        self.clear()
+
+    def clear(self):
+        """
+        Empties the mirror, it is loaded from the database again the next time it is used.
+
+        :return: None
+        """
+        self.rows = {}
+        self.keys = []
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.added = {}
+        # removed links are held as <row> * STRIDE + <row> codes so they can be matched against gathered arrays
+        self.removed = set()
+        self.loaded = False
+        self.time = None
+
+    def load(self, tx):
+        """
+        Reads every social link from the database and builds the rows.
+
+        :param tx: neo4j database transaction
+
+        :return: None
+        """
+        self.clear()
+        records = tx.run("MATCH (a)-[:SOCIAL|FRIEND]->(b) "
+                         "RETURN labels(a), a.id, labels(b), b.id").values()
+        pairs = [(self.row(socialkey(la, ia)), self.row(socialkey(lb, ib))) for la, ia, lb, ib in records]
+        self.build(pairs)
+        self.loaded = True
+
+    def ensure(self, tx, time):
+        """
+        Loads the mirror from the database if it was not loaded in this timestep.
+
+        :param tx: neo4j database transaction
+        :param time: current timestep
+
+        :return: None
+        """
+        if not self.loaded or time != self.time:
+            self.load(tx)
+            self.time = time
+
+    def row(self, key):
+        """
+        Returns the row of a node, adding a row without links for nodes not seen before.
+
+        :param key: (<label>, <id>) node key
+
+        :return: integer row
+        """
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            self.rows[key] = row
+            self.keys.append(key)
+        return row
+
+    def build(self, pairs):
+        """
+        Builds the compressed rows from a list of links, each link is stored in both directions.
+
+        :param pairs: list of (<row>, <row>) links
+
+        :return: None
+        """
+        size = len(self.keys)
+        if pairs:
+            links = np.array(pairs, dtype=np.int64)
+            links = links[links[:, 0] != links[:, 1]]
+            links = np.concatenate([links, links[:, ::-1]])
+            links = np.unique(links[:, 0] * size + links[:, 1])
+            sources = links // size
+            self.indices = links % size
+        else:
+            sources = np.zeros(0, dtype=np.int64)
+            self.indices = np.zeros(0, dtype=np.int64)
+        self.indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=size), out=self.indptr[1:])
+        self.added = {}
+        self.removed = set()
+
+    def rebuild(self):
+        """
+        Folds the overlay of added and removed links into the compressed rows.
+
+        :return: None
+        """
+        pairs = [(a, b) for a in range(len(self.indptr) - 1) for b in self.neighbours(a) if a < b]
+        self.build(pairs)
+
+    def changed(self):
+        """
+        Rebuilds the rows once the overlay is large relative to the graph.
+
+        :return: None
+        """
+        overlay = len(self.removed) + sum(len(links) for links in self.added.values())
+        if overlay > max(64, self.compact * len(self.indices)):
+            self.rebuild()
+
+    def add(self, a, b):
+        """
+        Records a link created in the database.
+
+        :param a: (<label>, <id>) key of one end of the link
+        :param b: (<label>, <id>) key of the other end of the link
+
+        :return: None
+        """
+        ra = self.row(a)
+        rb = self.row(b)
+        if ra == rb:
+            return
+        if ra * STRIDE + rb in self.removed:
+            self.removed.discard(ra * STRIDE + rb)
+            self.removed.discard(rb * STRIDE + ra)
+        else:
+            self.added.setdefault(ra, set()).add(rb)
+            self.added.setdefault(rb, set()).add(ra)
+        self.changed()
+
+    def remove(self, a, b):
+        """
+        Records a link deleted from the database.
+
+        :param a: (<label>, <id>) key of one end of the link
+        :param b: (<label>, <id>) key of the other end of the link
+
+        :return: None
+        """
+        ra = self.row(a)
+        rb = self.row(b)
+        if rb in self.added.get(ra, ()):
+            self.added[ra].discard(rb)
+            self.added[rb].discard(ra)
+        else:
+            self.removed.add(ra * STRIDE + rb)
+            self.removed.add(rb * STRIDE + ra)
+        self.changed()
+
+    def detach(self, key):
+        """
+        Records a node deleted from the database together with all of its links.
+
+        :param key: (<label>, <id>) node key
+
+        :return: None
+        """
+        row = self.rows.get(key)
+        if row is None:
+            return
+        for other in self.neighbours(row):
+            self.remove(key, self.keys[other])
+
+    def neighbours(self, row):
+        """
+        Returns the rows linked to a row.
+
+        :param row: integer row
+
+        :return: set of rows
+        """
+        linked = set()
+        if row < len(self.indptr) - 1:
+            linked.update(self.indices[self.indptr[row]:self.indptr[row + 1]].tolist())
+        if self.removed:
+            linked = {other for other in linked if row * STRIDE + other not in self.removed}
+        linked.update(self.added.get(row, ()))
+        return linked
+
+    def expand(self, frontier):
+        """
+        Returns all rows linked to any row of the frontier, reading the compressed rows in one gather.
+
+        :param frontier: array of rows
+
+        :return: array of rows, may contain duplicates
+        """
+        stored = frontier[frontier < len(self.indptr) - 1]
+        starts = self.indptr[stored]
+        counts = self.indptr[stored + 1] - starts
+        total = counts.sum()
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+        found = self.indices[offsets]
+        if self.removed and total:
+            removed = np.fromiter(self.removed, dtype=np.int64, count=len(self.removed))
+            found = found[~np.isin(np.repeat(stored, counts) * STRIDE + found, removed)]
+        if self.added:
+            rows = np.fromiter(self.added.keys(), dtype=np.int64, count=len(self.added))
+            extra = [other for row in rows[np.isin(rows, frontier)].tolist() for other in self.added[row]]
+            if extra:
+                found = np.concatenate([found, np.array(extra, dtype=np.int64)])
+        return found
+
+    def contacts(self, key, label=None):
+        """
+        Returns the ids of the nodes linked to a node.
+
+        :param key: (<label>, <id>) node key
+        :param label: (Optional) only return contacts with this label, "Agent" or "Carer"
+
+        :return: list of ids
+        """
+        row = self.rows.get(key)
+        if row is None:
+            return []
+        return [self.keys[other][1] for other in self.neighbours(row)
+                if label is None or self.keys[other][0] == label]
+
+    def distance(self, a, b, limit=6):
+        """
+        Length of the shortest social path between two nodes by breadth first search, stopping after limit steps.
+
+        :param a: (<label>, <id>) key of the first node
+        :param b: (<label>, <id>) key of the second node
+        :param limit: maximum path length searched
+
+        :return: path length, None if the nodes are not connected within limit steps
+        """
+        if a == b:
+            return 0
+        start = self.rows.get(a)
+        target = self.rows.get(b)
+        if start is None or target is None:
+            return None
+        visited = np.zeros(len(self.keys), dtype=bool)
+        visited[start] = True
+        frontier = np.array([start], dtype=np.int64)
+        for depth in range(1, limit + 1):
+            found = self.expand(frontier)
+            found = np.unique(found[~visited[found]])
+            if not len(found):
+                return None
+            if np.any(found == target):
+                return depth
+            visited[found] = True
+            frontier = found
+        return None
+
+
+socialgraph = SocialGraph()
+
+
+class LocationIndex:
+    """
+    Index of which patients are located at each node, shared by all patients in their social steps. The index is built
+    with one query the first time it is used in a timestep and is kept up to date by Patient.move for the rest of that
+    timestep.
+    """
+
+    def __init__(self):
+        self.time = None
+        self.nodes = {}
+        self.agents = {}
+
+    def ensure(self, tx, time):
+        """
+        Builds the index if it was not built in this timestep.
+
+        :param tx: neo4j database transaction
+        :param time: current timestep
+
+        :return: None
+        """
+        if time != self.time:
+            self.build(tx)
+            self.time = time
+
+    def build(self, tx):
+        """
+        Reads the location and social value of every patient in one query.
+
+        :param tx: neo4j database transaction
+
+        :return: None
+        """
+        self.nodes = {}
+        self.agents = {}
+        records = tx.run("MATCH (a:Patient)-[:LOCATED]->(n) "
+                         "RETURN a.id, a.social, n.name").values()
+        for agent_id, social, node in records:
+            self.agents[agent_id] = (node, {"id": agent_id, "social": social})
+            self.nodes.setdefault(node, {})[agent_id] = self.agents[agent_id][1]
+
+    def relocate(self, agent_id, node):
+        """
+        Records a patient moving to a new node, does nothing until the index has been built.
+
+        :param agent_id: id of the patient
+        :param node: name of the node the patient moved to
+
+        :return: None
+        """
+        if self.time is None or agent_id not in self.agents:
+            return
+        (old, record) = self.agents[agent_id]
+        self.nodes.get(old, {}).pop(agent_id, None)
+        self.nodes.setdefault(node, {})[agent_id] = record
+        self.agents[agent_id] = (node, record)
+
+    def discard(self, agent_id):
+        """
+        Records a patient deleted from the database.
+
+        :param agent_id: id of the patient
+
+        :return: None
+        """
+        if agent_id in self.agents:
+            (node, _) = self.agents.pop(agent_id)
+            self.nodes.get(node, {}).pop(agent_id, None)
+
+    def invalidate(self):
+        """
+        Drops the index so it is rebuilt the next time it is used.
+
+        :return: None
+        """
+        self.time = None
+        self.nodes = {}
+        self.agents = {}
+
+    def locate(self, agent_id):
+        """
+        :param agent_id: id of the patient
+
+        :return: name of the node the patient is located at, None if unknown
+        """
+        if agent_id in self.agents:
+            return self.agents[agent_id][0]
+        return None
+
+    def record(self, agent_id):
+        """
+        :param agent_id: id of the patient
+
+        :return: dictionary with the id and social value of the patient, None if unknown
+        """
+        if agent_id in self.agents:
+            return self.agents[agent_id][1]
+        return None
+
+    def colocated(self, agent_id):
+        """
+        :param agent_id: id of the patient
+
+        :return: list of the records of the other patients at the same node
+        """
+        node = self.locate(agent_id)
+        if node is None:
+            return []
+        return [record for other, record in self.nodes[node].items() if other != agent_id]
+
+
+locationindex = LocationIndex()
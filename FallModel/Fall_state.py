@@ -0,0 +1,47 @@
+def loadagent(tx, agent_id, label="Agent", uid="id"):
+    """
+    Utility function, fetches every property of an agent in a single query so the decision phases of a move can be
+    served from memory instead of one database round trip per attribute.
+
+    :param tx: neo4j database transaction
+    :param agent_id: id of the agent to load
+    :param label: label of the agent node, "Agent" or "Patient"
+    :param uid: property used to identify the agent
+
+    :return: dictionary of the agents properties, empty if no agent was found
+    """
+    record = tx.run("MATCH (a:" + label + ") "
+                    "WHERE a." + uid + "={agent_id} "
+                    "RETURN properties(a)", agent_id=agent_id).values()
+    if record:
+        return record[0][0]
+    return {}
+
+
+def saveagent(tx, agent_id, props, events=None, label="Agent", uid="id"):
+    """
+    Utility function, writes a set of agent properties back to the database in a single parameterised SET, appending
+    any new log entries to the agents log in the same query.
+
+    :param tx: neo4j database write transaction
+    :param agent_id: id of the agent to update
+    :param props: dictionary of property names and their new values
+    :param events: (Optional) list of (<event>, <timestep>) tuples to append to the agents log
+    :param label: label of the agent node
+    :param uid: property used to identify the agent
+
+    :return: None
+    """
+    if events:
+        tx.run("MATCH (a:" + label + ") "
+               "WHERE a." + uid + "={agent_id} "
+               "SET a += {props}, "
+               "a.log_events = coalesce(a.log_events, []) + {events}, "
+               "a.log_times = coalesce(a.log_times, []) + {times}",
+               agent_id=agent_id, props=props, events=[event for event, _ in events],
+               times=[int(time) for _, time in events])
+    elif props:
+        tx.run("MATCH (a:" + label + ") "
+               "WHERE a." + uid + "={agent_id} "
+               "SET a += {props}", agent_id=agent_id, props=props)
+
@@ -0,0 +1,227 @@
+def parseallowed(allowed):
+    """
+    Utility function, converts the allowed property of an edge to the value the wellbeing of an agent is matched
+    against. The property is either a list, matched by membership, or a comma separated string such as
+    "'Fallen, At risk, Healthy'", matched by containment as the perception filter always has.
+
+    :param allowed: edge allowed property
+
+    :return: tuple of wellbeing values or the string property, None if the edge has no limits
+    """
+    if allowed is None or isinstance(allowed, str):
+        return allowed
+    return tuple(allowed)
+
+
+class TopologyCache:
+    """
+    In process copy of the REACHES edges of the network. The edges do not change after the network is reset so they
+    are read from the database once, with the allowed wellbeing limits of each edge parsed and the minimum energy
+    needed to leave each node worked out. Only node capacities and loads change during a run, the Balancer runs in its
+    own process, so they are read again in one query the first time they are needed in a transaction. Loads are kept as
+    occupancy counters, moveload applies the change of an agent moving between nodes in the database and to the copy.
+
+    Every change to a capacity or load starts a new load epoch, views memoised with memoise are kept for one epoch.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """
+        Drops the cached network, it is read from the database again the next time it is used.
+
+        :return: None
+        """
+        self.loaded = False
+        self.edges = {}
+        self.allowed = {}
+        self.minenergies = {}
+        self.capacities = {}
+        self.loads = {}
+        self.tx = None
+        self.epoch = 0
+        self.memo = {}
+
+    def load(self, tx):
+        """
+        Reads every REACHES edge and its end nodes in one query.
+
+        :param tx: neo4j database transaction
+
+        :return: None
+        """
+        self.clear()
+        records = tx.run("MATCH (a:Node)-[r:REACHES]->(b:Node) "
+                         "RETURN a, r, b").values()
+        for start, edge, end in records:
+            self.edges.setdefault(start["name"], []).append(edge)
+            self.allowed[edge.id] = parseallowed(edge.get("allowed"))
+        for name, edges in self.edges.items():
+            energies = [edge["energy"] for edge in edges if edge["energy"]] + \
+                       [edge.end_node["energy"] for edge in edges if edge.end_node["energy"]]
+            self.minenergies[name] = min(energies) if energies else None
+        self.loaded = True
+
+    def ensure(self, tx):
+        """
+        Reads the network if it has not been read yet and the node capacities and loads if they have not been read in
+        this transaction.
+
+        :param tx: neo4j database transaction
+
+        :return: None
+        """
+        if not self.loaded:
+            self.load(tx)
+        if tx is not self.tx:
+            capacities = {}
+            loads = {}
+            for name, cap, load in tx.run("MATCH (n:Node) "
+                                          "WHERE exists(n.cap) "
+                                          "RETURN n.name, n.cap, n.load").values():
+                capacities[name] = cap
+                loads[name] = load if load is not None else 0
+            if capacities != self.capacities or loads != self.loads:
+                self.capacities = capacities
+                self.loads = loads
+                self.newepoch()
+            self.tx = tx
+
+    def newepoch(self):
+        """
+        Starts a new load epoch, dropping the memoised views.
+
+        :return: None
+        """
+        self.epoch = self.epoch + 1
+        self.memo = {}
+
+    def memoise(self, tx, key, build):
+        """
+        Returns the view memoised for a key in the current load epoch, building it if there is none.
+
+        :param tx: neo4j database transaction
+        :param key: hashable key of everything the view depends on other than capacities and loads
+        :param build: function returning the view
+
+        :return: the memoised view
+        """
+        self.ensure(tx)
+        view = self.memo.get(key)
+        if view is None:
+            view = build()
+            self.memo[key] = view
+        return view
+
+    def outgoing(self, tx, name):
+        """
+        :param tx: neo4j database transaction
+        :param name: name of the node
+
+        :return: list of the REACHES edges leaving the node
+        """
+        self.ensure(tx)
+        return self.edges.get(name, [])
+
+    def limits(self, edge):
+        """
+        :param edge: cached REACHES edge
+
+        :return: wellbeing limits of the edge as returned by parseallowed, None if the edge has no limits
+        """
+        return self.allowed.get(edge.id)
+
+    def permits(self, edge, wellbeing, split=False):
+        """
+        Matches the wellbeing of an agent against the limits of an edge exactly as it is stored, an agent created with
+        the wellbeing "'At risk'" does not match an "At risk" limit.
+
+        :param edge: REACHES edge
+        :param wellbeing: wellbeing of the agent
+        :param split: (Optional) match string limits against their comma separated values rather than the whole string,
+                      as the perception filter does for a single predicted edge
+
+        :return: True if the edge has no limits or the agents wellbeing matches them
+        """
+        allowed = self.allowed[edge.id] if edge.id in self.allowed else parseallowed(edge.get("allowed"))
+        if allowed is None:
+            return True
+        if split and isinstance(allowed, str):
+            allowed = allowed.split(",")
+        return wellbeing in allowed
+
+    def minenergy(self, tx, name):
+        """
+        :param tx: neo4j database transaction
+        :param name: name of the node
+
+        :return: smallest energy requirement of the edges leaving the node and their end nodes
+        """
+        self.ensure(tx)
+        return self.minenergies.get(name)
+
+    def currentload(self, tx, name):
+        """
+        :param tx: neo4j database transaction
+        :param name: name of the node
+
+        :return: current load of the node, 0 for nodes without a capacity
+        """
+        self.ensure(tx)
+        return self.loads.get(name, 0)
+
+    def spare(self, tx, name):
+        """
+        :param tx: neo4j database transaction
+        :param name: name of the node
+
+        :return: True if the node has no capacity or its load is below its capacity
+        """
+        self.ensure(tx)
+        if name not in self.capacities or self.capacities[name] is None:
+            return True
+        return self.loads[name] < self.capacities[name]
+
+    def moveload(self, tx, origin, destination):
+        """
+        Records an agent moving from one node to another in the loads of the nodes with a capacity. The loads are
+        incremented and decremented in the database in one atomic query, rather than being read and written back, and
+        the updated values are copied into the cache.
+
+        :param tx: neo4j database write transaction
+        :param origin: name of the node the agent left
+        :param destination: name of the node the agent moved to
+
+        :return: None
+        """
+        self.ensure(tx)
+        if origin == destination:
+            return
+        changes = [{"name": name, "change": change} for name, change in ((origin, -1), (destination, 1))
+                   if name in self.capacities]
+        if not changes:
+            return
+        records = tx.run("UNWIND {changes} AS change "
+                         "MATCH (n:Node) "
+                         "WHERE n.name=change.name "
+                         "SET n.load = coalesce(n.load, 0) + change.change "
+                         "RETURN n.name, n.load", changes=changes).values()
+        for name, load in records:
+            self.setload(name, load)
+
+    def setload(self, name, load):
+        """
+        Records a change to the load of a node made in this process.
+
+        :param name: name of the node
+        :param load: new load
+
+        :return: None
+        """
+        if name in self.loads and self.loads[name] != load:
+            self.loads[name] = load
+            self.newepoch()
+
+
+topology = TopologyCache()
@@ -3,4 +3,6 @@ from FallModel.Fall_agent import Patient
 from FallModel.Fall_reset import Reset, ResetV0
 # from FallModel.Fall_Monitor import Monitor
 from FallModel.Fall_Balancer import parselog, FlowReaction
+from FallModel.Fall_log import agentlog, formatlog
+from FallModel.Fall_engine import PopulationEngine, Topology
 import FallModel.specification
\ No newline at end of file
@@ -0,0 +1,131 @@
+import weakref
+import numpy as np
+from SPmodelling.Agent import MobileAgent
+from FallModel.Fall_agent import Patient, ChoicePlan, choiceplan, edgearrays, inclinationchoice
+from FallModel.Fall_clock import clock
+from FallModel.Fall_nodes import SocialNode
+from FallModel.Fall_random import agentrandom, streams
+from FallModel.Fall_topology import topology
+
+INCLINATION = [1, 0, 3, 0]
+
+
+class StubTx:
+
+    def __init__(self, time):
+        clock.tx = weakref.ref(self)
+        clock.time = time
+
+
+class StubEdge(dict):
+
+    def __init__(self, edge_id, mood, kind):
+        super(StubEdge, self).__init__(mood=mood, type=kind)
+        self.id = edge_id
+
+
+def edges():
+    return [StubEdge(10, 0, "social"), StubEdge(11, 0.2, "medical"), StubEdge(12, 0.9, "social")]
+
+
+def patient(monkeypatch, view, mood=0.5):
+    monkeypatch.setattr(MobileAgent, "choose", lambda self, tx, perc: None, raising=False)
+    agent = Patient.__new__(Patient)
+    (agent.id, agent.state, agent.view, agent.mood, agent.inclination) = (1, {}, view, mood, list(INCLINATION))
+    return agent
+
+
+def owndraw(view, mood):
+    """
+    The first choice the patient draws from its own stream at timestep 4, the streams are reseeded afterwards.
+    """
+    streams.seed(3)
+    (edge_moods, edge_types) = edgearrays(view)
+    choice = inclinationchoice(np.array([mood]), np.array([INCLINATION]), edge_moods, edge_types,
+                               agentrandom(StubTx(4), 1))[0]
+    streams.seed(3)
+    return choice
+
+
+def test_plan_used_once():
+    tx = StubTx(1)
+    plan = ChoicePlan()
+    plan.set(tx, {1: ((10, 11), 0.5, tuple(INCLINATION), 1)})
+    assert plan.take(tx, 1, edges()[:2], 0.5, INCLINATION) == 1
+    assert plan.take(tx, 1, edges()[:2], 0.5, INCLINATION) is None
+
+
+def test_stale_plan_not_used():
+    tx = StubTx(1)
+    plan = ChoicePlan()
+    stored = {1: ((10, 11), 0.5, tuple(INCLINATION), 1)}
+    for (edge_list, mood, inclination) in [(edges(), 0.5, INCLINATION), (edges()[:2], 0.6, INCLINATION),
+                                           (edges()[:2], 0.5, [1, 1, 3, 0])]:
+        plan.set(tx, dict(stored))
+        assert plan.take(tx, 1, edge_list, mood, inclination) is None
+    plan.set(tx, dict(stored))
+    assert plan.take(StubTx(2), 1, edges()[:2], 0.5, INCLINATION) is None
+
+
+def test_choose_uses_plan_once(monkeypatch):
+    view = edges()
+    expected = owndraw(view, 0.5)
+    agent = patient(monkeypatch, view)
+    tx = StubTx(4)
+    choiceplan.set(tx, {1: ((10, 11, 12), 0.5, tuple(INCLINATION), 1 - expected)})
+    assert agent.choose(tx, None) is view[1 - expected]
+    # the plan is used up and drew nothing, the next choice is the patients first own draw
+    assert agent.choose(tx, None) is view[expected]
+
+
+def test_choose_falls_back_on_stale_plan(monkeypatch):
+    view = edges()
+    expected = owndraw(view, 0.95)
+    agent = patient(monkeypatch, view, 0.95)
+    tx = StubTx(4)
+    # planned before the patients mood changed
+    choiceplan.set(tx, {1: ((10, 11, 12), 0.5, tuple(INCLINATION), 1 - expected)})
+    assert agent.choose(tx, None) is view[expected]
+
+
+def test_inclinationchoice_batch():
+    rng = np.random.default_rng(5)
+    (edge_moods, edge_types) = edgearrays(edges())
+    moods = np.array([0.5] * 20000 + [-1, 0.1])
+    inclinations = np.array([INCLINATION] * 20000 + [INCLINATION, [0, 0, 0, 0]])
+    valid = np.ones((len(moods), 3), dtype=bool)
+    valid[-1, 0] = False
+    choice = inclinationchoice(moods, inclinations, edge_moods, edge_types, rng, valid)
+    # social 1 against medical 3 over the two edges within the mood
+    assert abs(np.mean(choice[:-2] == 0) - 0.25) < 0.015
+    assert abs(np.mean(choice[:-2] == 1) - 0.75) < 0.015
+    # no edge within the mood, and no valid edge within the mood
+    assert choice[-2:].tolist() == [-1, -1]
+
+
+class StubNodeEdge(StubEdge):
+
+    def __init__(self, edge_id, end, mood, kind, energy=None):
+        super(StubNodeEdge, self).__init__(edge_id, mood, kind)
+        self.end_node = {"name": end, "energy": energy}
+
+
+def test_node_plans_choices(monkeypatch):
+    tx = StubTx(6)
+    network = [StubNodeEdge(20, "Home", 0, "inactive"), StubNodeEdge(21, "Intervention", 0.1, "medical", -0.2),
+               StubNodeEdge(22, "GP", 0, "fall"), StubNodeEdge(23, "Hos", 0, "fall")]
+    monkeypatch.setattr(topology, "edges", {"Social": network})
+    monkeypatch.setattr(topology, "loaded", True)
+    monkeypatch.setattr(topology, "tx", tx)
+    monkeypatch.setattr(topology, "memo", {})
+    agents = [{"id": i, "wellbeing": "At risk", "referral": True, "mob": 0.5, "energy": energy, "mood": 0.5,
+               "inclination": inclination}
+              for i, energy, inclination in [(1, 0.5, INCLINATION), (2, 0.1, INCLINATION), (3, 0.5, None),
+                                             (4, 0.5, [0, 0, 1, 0])]]
+    SocialNode().agentschoice(tx, agents)
+    # 2 can only reach Home and 3 has no inclination, neither is planned
+    assert set(choiceplan.plans) == {1, 4}
+    assert choiceplan.plans[1][:3] == ((20, 21), 0.5, tuple(INCLINATION))
+    # 4 is only inclined to medical edges
+    assert choiceplan.take(tx, 4, network[:2], 0.5, [0, 0, 1, 0]) == 1
+    assert choiceplan.take(tx, 1, network[:2], 0.5, INCLINATION) == 1
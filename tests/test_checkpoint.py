@@ -0,0 +1,62 @@
+import pickle
+from FallModel.Fall_checkpoint import writecheckpoint, readcheckpoint, nodestate, restorenodes
+from FallModel.Fall_nodes import HomeNode, HosNode
+from FallModel.Fall_topology import topology
+
+
+class StubEdge:
+    """
+    REACHES edge standing in for a database relationship, which can not be pickled.
+    """
+
+    def __init__(self, end):
+        self.end_node = {"name": end}
+
+    def __reduce__(self):
+        raise pickle.PicklingError("Can't pickle edge")
+
+
+class StubTx:
+    pass
+
+
+def network(tx):
+    edges = {"Home": [StubEdge("GP"), StubEdge("Hos")], "Hos": [StubEdge("Home")]}
+    topology.clear()
+    topology.edges = edges
+    topology.loaded = True
+    topology.tx = tx
+    return edges
+
+
+def test_queue_round_trip(tmp_path):
+    tx = StubTx()
+    edges = network(tx)
+    home = HomeNode()
+    home.queue.push(3, 1, (None, 1))
+    home.queue.advance(3)
+    home.queue.push(5, 2, (edges["Home"][1], 2))
+    home.queue.push(6.5, 3, (edges["Home"][0], 3))
+    path = str(tmp_path / "checkpoint.p.gz")
+    writecheckpoint(path, 3, nodestate([home]))
+    (time, state) = readcheckpoint(path)
+    restored = HomeNode()
+    restorenodes(tx, [restored], state)
+    assert time == 3
+    assert restored.queue.visited == 3
+    assert restored.queue.due(3) == {1: (None, 1)}
+    assert restored.queue.due(5) == {2: (edges["Home"][1], 2)}
+    assert restored.queue.due(7) == {3: (edges["Home"][0], 3)}
+    assert len(restored.queue) == 3
+
+
+def test_admissions_round_trip(tmp_path):
+    tx = StubTx()
+    edges = network(tx)
+    hos = HosNode()
+    hos.admissions = [(4, 5.0, edges["Hos"][0], 2), (7, 9.5, edges["Hos"][0], 2)]
+    path = str(tmp_path / "checkpoint.p.gz")
+    writecheckpoint(path, 2, nodestate([hos]))
+    restored = HosNode()
+    restorenodes(tx, [restored], readcheckpoint(path)[1])
+    assert restored.admissions == hos.admissions
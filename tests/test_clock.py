@@ -0,0 +1,26 @@
+import SPmodelling.Interface as intf
+from FallModel.Fall_clock import TickClock
+
+
+class StubTx:
+    pass
+
+
+def test_time_read_once_per_transaction(monkeypatch):
+    reads = []
+    monkeypatch.setattr(intf, "gettime", lambda tx: reads.append(tx) or len(reads), raising=False)
+    clock = TickClock()
+    first = StubTx()
+    assert clock.gettime(first) == 1
+    assert clock.gettime(first) == 1
+    second = StubTx()
+    assert clock.gettime(second) == 2
+    assert clock.gettime(first) == 3
+    assert reads == [first, second, first]
+
+
+def test_transaction_not_kept_alive(monkeypatch):
+    monkeypatch.setattr(intf, "gettime", lambda tx: 4, raising=False)
+    clock = TickClock()
+    clock.gettime(StubTx())
+    assert clock.tx() is None
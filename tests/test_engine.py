@@ -0,0 +1,128 @@
+import weakref
+import numpy as np
+from FallModel.Fall_clock import clock
+from FallModel.Fall_engine import PopulationEngine, Topology
+from FallModel.Fall_hazard import fallcheck
+from FallModel.Fall_nodes import admitagents, dischargeagents
+from FallModel.Fall_queue import EventQueue
+from FallModel.Fall_random import RandomStreams, streams, agentrandom, noderandom, populationrandom
+
+SEED = 11
+
+
+class StubResult:
+
+    def __init__(self, values):
+        self.rows = values
+
+    def values(self):
+        return self.rows
+
+
+class StubTx:
+    """
+    Transaction standing in for the database at one timestep. Queries are recorded and answered from a list of
+    results, the clock is set directly so no query is made for the time.
+    """
+
+    def __init__(self, time, results=()):
+        self.results = list(results)
+        self.runs = []
+        clock.tx = weakref.ref(self)
+        clock.time = time
+
+    def run(self, query, **params):
+        self.runs.append(params)
+        return StubResult(self.results.pop(0) if "RETURN" in query and self.results else [])
+
+
+def engine(nodes, edges, size):
+    streams.seed(SEED)
+    return PopulationEngine(Topology(nodes, edges), size, streams=RandomStreams(SEED))
+
+
+def test_spawn_matches_generator():
+    e = engine([{"name": "Home"}], [], 3)
+    rng = populationrandom(StubTx(0))
+    for agent in range(3):
+        # FallAgent.generator draws mobility, energy then confidence
+        assert e.mob[agent] == rng.normal(0.8, 0.05)
+        assert e.energy[agent] == rng.normal(1, 0.05)
+        assert e.conf[agent] == rng.normal(0.9, 0.05)
+
+
+def test_fall_check_matches_graph():
+    nodes = [{"name": "Home", "energy": 0.1}, {"name": "Social"}, {"name": "Hos"}, {"name": "GP"}]
+    edges = [("Social", "Home", {"worth": 1}), ("Social", "Hos", {}), ("Social", "GP", {}),
+             ("Home", "Hos", {"energy": 0.5})]
+    e = engine(nodes, edges, 4)
+    e.loc[:] = e.topology.node("Social")
+    e.mob[:] = [0.05, 0.2, 0.5, 0.9]
+    e.time = 3
+    e.step()
+    tx = StubTx(3)
+    # FallNode.checkfalls
+    kinds = fallcheck([0.05, 0.2, 0.5, 0.9], [noderandom(tx, "Social", agent_id).random() for agent_id in e.ids])
+    expected = np.zeros((4, 3), dtype=np.int64)
+    for agent, kind in enumerate(kinds):
+        if kind >= 0:
+            expected[agent, kind] = 1
+    assert np.array_equal(e.falls, expected)
+
+
+def test_move_matches_agent_stream():
+    nodes = [{"name": "Home", "modm": -0.01, "modc": -0.02, "energy": 0.1}, {"name": "Social"}]
+    edges = [("Social", "Home", {"worth": 1, "energy": -0.2, "modm": 0.05}), ("Home", "Social", {"energy": -0.3})]
+    e = engine(nodes, edges, 2)
+    e.loc[:] = e.topology.node("Social")
+    (mob, conf, energy) = (e.mob.copy(), e.conf.copy(), e.energy.copy())
+    e.time = 2
+    e.step()
+    tx = StubTx(2)
+    for agent, agent_id in enumerate(e.ids):
+        rng = agentrandom(tx, agent_id)
+        # FallAgent.payment then FallAgent.learn
+        current = rng.normal(-0.2, 0.05) + energy[agent]
+        mobility = max(rng.normal(0.05, 0.05) + mob[agent], 0)
+        mobility = max(rng.normal(-0.01, 0.05) + mobility, 0)
+        confidence = max(rng.normal(-0.02, 0.05) + conf[agent], 0)
+        current = rng.normal(0.1, 0.05) + current
+        assert e.loc[agent] == e.topology.node("Home")
+        assert np.isclose(e.mob[agent], mobility)
+        assert np.isclose(e.conf[agent], confidence)
+        assert np.isclose(e.energy[agent], current)
+
+
+def test_hospital_matches_graph():
+    nodes = [{"name": "Home"}, {"name": "Hos", "modm": -0.1, "modc": -0.05, "energy": 0.2}]
+    edges = [("Hos", "Home", {"worth": 1}), ("Home", "Hos", {"energy": 0.5})]
+    e = engine(nodes, edges, 3)
+    e.loc[:] = e.topology.node("Hos")
+    e.dest[:] = 0
+    e.admitted[:] = 4
+    e.staymean[:] = [0.5, 3, 1]
+    e.time = 5
+    e.step()
+    # the graph backed path queues the admissions then discharges the agents due in one node stream
+    tx = StubTx(5, [[[-0.1, -0.05, 0.2]]])
+    queue = EventQueue()
+    queue.advance(4)
+    admitagents(tx, queue, [(agent_id, mean, "edge", 4) for agent_id, mean in zip(e.ids, [0.5, 3, 1])],
+                noderandom(tx, "Hos"))
+    queue.advance(5)
+    due = queue.due(5)
+    dischargeagents(tx, "Hos", due, [{"id": agent_id} for agent_id in e.ids], [("mob", "modm"), ("conf", "modc")],
+                    noderandom(tx, "Hos"))
+    discharged = {row["id"]: row["props"] for row in tx.runs[-1].get("rows", [])}
+    for agent, agent_id in enumerate(e.ids):
+        if agent_id in due:
+            assert e.loc[agent] == e.topology.node("Home")
+        if agent_id in discharged:
+            assert e.lastdischarge[agent] == 5
+            assert np.isclose(e.mob[agent], discharged[agent_id]["mob"])
+            assert np.isclose(e.conf[agent], discharged[agent_id]["conf"])
+        if agent_id not in due:
+            assert e.loc[agent] == e.topology.node("Hos")
+            (slot, entry) = next((slot, entries[agent_id]) for slot, entries in queue.items() if agent_id in entries)
+            assert e.duration[agent] == entry[1]
+            assert e.ready[agent] == slot
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from FallModel.Fall_hazard import predictfalls, falldraw, fallcheck
+
+SAMPLES = 20000
+
+
+def referencefall(mobility, rng):
+    """
+    The original per step fall draw, severe then moderate then mild, a later draw only taking over if it is strictly
+    earlier so ties go to the more severe fall.
+    """
+    (falltime, falltype) = (rng.poisson(-np.log(1 - mobility)), 2)
+    moderate = rng.poisson(-np.log(1 - 0.9 * mobility))
+    if moderate < falltime:
+        (falltime, falltype) = (moderate, 1)
+    mild = rng.poisson(-np.log(1 - 0.7 * mobility))
+    if mild < falltime:
+        (falltime, falltype) = (mild, 0)
+    return falltime, falltype
+
+
+def referencepath(mobility, mobchange, rng):
+    """
+    The original HomeNode prediction loop, drawing step by step until the current prediction is reached.
+    """
+    (falltime, falltype) = referencefall(mobility, rng)
+    t = 1
+    while t < falltime:
+        mobility = mobility + mobchange
+        (nexttime, nexttype) = referencefall(mobility, rng)
+        if nexttime + t < falltime:
+            (falltime, falltype) = (nexttime + t, nexttype)
+        t = t + 1
+    return falltime, falltype
+
+
+def frequencies(times, types):
+    counts = {}
+    for key in zip(np.asarray(times).tolist(), np.asarray(types).tolist()):
+        counts[key] = counts.get(key, 0) + 1
+    return {key: count / len(times) for key, count in counts.items()}
+
+
+@pytest.mark.parametrize("mobility, mobchange", [(0.9, -0.015), (0.6, -0.1), (0.3, 0.05), (0.97, -0.2)])
+def test_predictfalls_matches_reference_loop(mobility, mobchange):
+    rng = np.random.default_rng(7)
+    (times, types) = predictfalls(np.full(SAMPLES, mobility), mobchange, rng)
+    expected = [referencepath(mobility, mobchange, rng) for _ in range(SAMPLES)]
+    (reftimes, reftypes) = (np.array([time for time, _ in expected]), np.array([kind for _, kind in expected]))
+    (found, wanted) = (frequencies(times, types), frequencies(reftimes, reftypes))
+    for key in set(found) | set(wanted):
+        assert abs(found.get(key, 0) - wanted.get(key, 0)) < 0.015, key
+    assert abs(times.mean() - reftimes.mean()) < 0.05 * max(reftimes.mean(), 1)
+    for kind in range(3):
+        assert abs(np.mean(types == kind) - np.mean(reftypes == kind)) < 0.015
+
+
+def test_falldraw_ties_go_to_severe():
+    # every draw is zero at zero mobility, so all three fall types tie
+    (times, types) = falldraw(np.zeros(5), np.random.default_rng(0))
+    assert times.tolist() == [0] * 5
+    assert types.tolist() == [2] * 5
+
+
+def test_fallcheck_thresholds():
+    mobility = np.full(4, 0.5)
+    draws = [np.exp(-1.5) - 1e-9, np.exp(-1.35) - 1e-9, np.exp(-1.05) - 1e-9, np.exp(-1.05) + 1e-9]
+    assert fallcheck(mobility, draws).tolist() == [2, 1, 0, -1]
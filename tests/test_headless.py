@@ -0,0 +1,20 @@
+import numpy as np
+from FallModel.Fall_headless import SeriesBuffer
+
+
+def test_series_buffer_grows_in_order():
+    series = SeriesBuffer(("time", "value"), capacity=2)
+    sizes = []
+    for step in range(11):
+        series.append([step, step * 0.5])
+        sizes.append(len(series.data))
+    assert sizes == [2, 2, 4, 4, 8, 8, 8, 8, 16, 16, 16]
+    assert len(series) == 11
+    assert series.column("time").tolist() == list(range(11))
+    assert np.array_equal(series.column("value"), np.arange(11) * 0.5)
+
+
+def test_series_buffer_empty():
+    series = SeriesBuffer(("time",))
+    assert len(series) == 0
+    assert series.column("time").tolist() == []
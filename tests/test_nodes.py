@@ -0,0 +1,67 @@
+import weakref
+import numpy as np
+import pytest
+import SPmodelling.Interface as intf
+from FallModel.Fall_clock import clock
+from FallModel.Fall_nodes import FallNode, HomeNode, admitagents
+from FallModel.Fall_queue import EventQueue
+
+
+class StubTx:
+    """
+    Transaction standing in for the database at one timestep, queries are recorded and return nothing.
+    """
+
+    def __init__(self, time):
+        self.runs = []
+        clock.tx = weakref.ref(self)
+        clock.time = time
+
+    def run(self, query, **params):
+        self.runs.append((query, params))
+
+
+class StubRandom:
+    """
+    Random generator giving fixed hospital stays.
+    """
+
+    def __init__(self, stays):
+        self.stays = stays
+
+    def poisson(self, means):
+        return np.array(self.stays[:len(means)])
+
+
+@pytest.mark.parametrize("stay, leaves", [(0, 5), (1, 5), (2, 6), (4, 8)])
+def test_admission_leaves_on_expected_tick(stay, leaves):
+    # admitted at 4, queued when the hospital is next processed at 5
+    queue = EventQueue()
+    queue.advance(4)
+    admitagents(StubTx(5), queue, [(1, 3.0, "edge", 4)], StubRandom([stay]))
+    for time in range(5, leaves + 1):
+        queue.advance(time)
+        assert (1 in queue.due(time)) == (time == leaves)
+    assert queue.due(leaves)[1] == ("edge", stay)
+
+
+def test_home_applies_wait_changes(monkeypatch):
+    tx = StubTx(5)
+    reads = []
+    updates = []
+    monkeypatch.setattr(intf, "getnodeagents", lambda tx, name, key=None: [{"id": 1}, {"id": 2}, {"id": 3}],
+                        raising=False)
+    monkeypatch.setattr(intf, "getnodevalue", lambda tx, name, prop, label, key: reads.append(prop) or 0.5,
+                        raising=False)
+    monkeypatch.setattr(intf, "updateagent", lambda *args: updates.append(args), raising=False)
+    monkeypatch.setattr(FallNode, "agentsready", lambda self, tx, agentclass="FallAgent": None)
+    home = HomeNode()
+    home.queue.push(5, 1, ("edge", 2))
+    home.queue.push(5, 2, ("edge", 4))
+    home.queue.push(6, 3, ("edge", 1))
+    home.agentsready(tx)
+    assert sorted(reads) == ["energy", "modm", "modmood"]
+    assert [(args[1], args[2]) for args in updates] == [(1, "mob"), (1, "mood"), (1, "energy"),
+                                                        (2, "mob"), (2, "mood"), (2, "energy")]
+    assert all(args[0] is tx and np.ndim(args[3]) == 0 for args in updates)
+    assert updates[2][3] == 1.0 and updates[5][3] == 2.0
@@ -0,0 +1,92 @@
+from statistics import mean
+import numpy as np
+import pytest
+from FallModel.Fall_policy import RingBuffer, WindowPolicy, CapacityController
+
+
+def originalrule(caps, times, history, dynamic):
+    """
+    The original adjustcapasity rule run against a dictionary of capacities rather than the database.
+    """
+    if not times and history:
+        currentav = history[-1]
+    elif not times:
+        currentav = 14
+    else:
+        currentav = mean(times)
+    history = history + [currentav]
+    if len(history) < 20:
+        return history
+    if history[-5] - history[-1] < -1 and history[-1] > 5:
+        if not dynamic:
+            caps["Intervention"] = caps["Intervention"] + 1
+        elif caps["InterventionOpen"] > 0:
+            caps["Intervention"] = caps["Intervention"] + 1
+            caps["InterventionOpen"] = caps["InterventionOpen"] - 1
+        return []
+    if history[-5] - history[-1] > 0 and history[-1] < 5:
+        if caps["Intervention"] > 0:
+            caps["Intervention"] = caps["Intervention"] - 1
+            if dynamic:
+                caps["InterventionOpen"] = caps["InterventionOpen"] + 1
+        return []
+    return history
+
+
+def shift(caps, changes):
+    """
+    shiftcapacity against a dictionary of capacities.
+    """
+    if all(caps[name] + change >= 0 for name, change in changes.items()):
+        for name, change in changes.items():
+            caps[name] = caps[name] + change
+
+
+@pytest.mark.parametrize("dynamic", [True, False])
+@pytest.mark.parametrize("seed", range(4))
+def test_window_policy_matches_original_rule(dynamic, seed):
+    rng = np.random.default_rng(seed)
+    (original, controlled) = ({"Intervention": 1, "InterventionOpen": 1}, {"Intervention": 1, "InterventionOpen": 1})
+    controller = CapacityController(WindowPolicy())
+    history = []
+    changes = 0
+    for step in range(2000):
+        # runs of rising and falling intervals with steps where no discharged agent is at Intervention
+        level = 6 + 5 * np.sin(step / (15 + 10 * seed))
+        times = [] if rng.random() < 0.2 else rng.poisson(max(level, 0), rng.integers(1, 5)).tolist()
+        history = originalrule(original, times, history, dynamic)
+        decided = controller.decide(times, dynamic)
+        shift(controlled, decided)
+        changes = changes + bool(decided)
+        assert controlled == original
+        assert len(controller.history) == min(len(history), controller.history.size)
+        if history:
+            assert controller.history.last() == pytest.approx(history[-1])
+    assert changes > 10
+
+
+def test_ring_buffer_matches_recomputation():
+    rng = np.random.default_rng(3)
+    ring = RingBuffer(7, alpha=0.3)
+    pushed = []
+    ewma = None
+    for step in range(200):
+        if step in (50, 51, 120):
+            ring.clear()
+            (pushed, ewma) = ([], None)
+        value = float(rng.normal(5, 3))
+        ring.push(value)
+        pushed.append(value)
+        ewma = value if ewma is None else 0.3 * value + 0.7 * ewma
+        window = np.array(pushed[-7:])
+        assert len(ring) == len(window)
+        assert ring.last() == value
+        assert ring.last(len(window)) == window[0]
+        assert ring.mean() == pytest.approx(window.mean())
+        assert ring.ewma == pytest.approx(ewma)
+        if len(window) > 1:
+            assert ring.slope() == pytest.approx(np.polyfit(np.arange(len(window)), window, 1)[0])
+        else:
+            assert ring.slope() is None
+    with pytest.raises(IndexError):
+        ring.last(8)
@@ -0,0 +1,53 @@
+from FallModel.Fall_queue import EventQueue
+
+
+def test_push_rounds_up_to_slot():
+    queue = EventQueue()
+    queue.push(4.2, 1, (None, 3))
+    assert 5 in queue
+    assert queue[5] == {1: (None, 3)}
+
+
+def test_push_moves_queued_agent():
+    queue = EventQueue()
+    queue.push(5, 1, (None, 3))
+    queue.push(7, 1, (None, 4))
+    assert queue.get(5) == {}
+    assert queue.due(7) == {1: (None, 4)}
+    assert len(queue) == 1
+
+
+def test_advance_merges_skipped_slots():
+    queue = EventQueue()
+    queue.push(3, 1, (None, 1))
+    queue.push(4, 2, (None, 2))
+    queue.advance(6)
+    assert queue.due(6) == {1: (None, 1), 2: (None, 2)}
+    assert len(queue) == 2
+
+
+def test_advance_drops_processed_slots():
+    queue = EventQueue()
+    queue.push(5, 1, (None, 1))
+    queue.advance(5)
+    queue.advance(6)
+    assert 5 not in queue
+    assert len(queue) == 0
+
+
+def test_push_into_processed_slot_is_kept():
+    queue = EventQueue()
+    queue.push(6, 2, (None, 1))
+    queue.advance(5)
+    queue.push(5, 1, (None, 2))
+    queue.advance(6)
+    assert queue.due(6) == {1: (None, 2), 2: (None, 1)}
+    assert len(queue) == 2
+
+
+def test_push_before_advance_is_due():
+    queue = EventQueue()
+    queue.advance(4)
+    queue.push(5, 1, (None, 0))
+    queue.advance(5)
+    assert queue.due(5) == {1: (None, 0)}
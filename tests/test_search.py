@@ -0,0 +1,13 @@
+from FallModel.Fall_search import paretoranks
+
+
+def test_pareto_fronts():
+    scores = [(10, 2), (8, 1), (10, 2), (9, 3), (7, 1), (8, 3), (12, 5), (6, 6)]
+    # (10, 2) twice tie and neither dominates, (9, 3) is beaten by (10, 2), (7, 1) by (8, 1), (8, 3) by (9, 3) and
+    # (6, 6) by (8, 3)
+    assert paretoranks(scores).tolist() == [0, 0, 0, 1, 1, 2, 0, 3]
+
+
+def test_pareto_single_and_empty():
+    assert paretoranks([(5, 5)]).tolist() == [0]
+    assert paretoranks([]).tolist() == []
@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pytest
+from FallModel.Fall_sink import ExitSink, readindex, readexits, INDEX
+
+FIRST = [(1, 5, "Agent 1: Severe Fall, 3"), (2, 5, "Agent 2: ")]
+SECOND = [(7, 6, "Agent 7: Mild Fall, 4, Hos admitted, 5 é")]
+
+
+def sink(tmp_path):
+    path = str(tmp_path / "exits")
+    exits = ExitSink(path, buffersize=64)
+    exits.write(FIRST)
+    exits.write([])
+    exits.write(SECOND)
+    exits.close()
+    return path
+
+
+def test_round_trip(tmp_path):
+    path = sink(tmp_path)
+    index = readindex(path)
+    assert index["id"].tolist() == [1, 2, 7]
+    assert index["time"].tolist() == [5, 5, 6]
+    assert readexits(path) == FIRST + SECOND
+    assert readexits(path, index) == FIRST + SECOND
+    assert readexits(path, index["offset"][[2, 0]]) == [SECOND[0], FIRST[0]]
+
+
+def test_reopen_appends(tmp_path):
+    path = sink(tmp_path)
+    exits = ExitSink(path)
+    exits.write([(9, 8, "Agent 9: ")])
+    exits.close()
+    assert readexits(path, readindex(path)) == FIRST + SECOND + [(9, 8, "Agent 9: ")]
+
+
+def test_interrupted_write(tmp_path):
+    path = sink(tmp_path)
+    # records flushed but the last index entry lost, then a record cut short
+    with open(path + ".idx", "r+b") as file:
+        file.truncate(2 * INDEX.itemsize + 5)
+    with open(path + ".rec", "ab") as file:
+        file.write(b"\x03\x00\x00")
+    assert readindex(path)["id"].tolist() == [1, 2]
+    assert readexits(path) == FIRST + SECOND
+    exits = ExitSink(path)
+    exits.write([(9, 8, "Agent 9: ")])
+    exits.close()
+    assert readindex(path)["id"].tolist() == [1, 2, 7, 9]
+    assert readexits(path, readindex(path)) == FIRST + SECOND + [(9, 8, "Agent 9: ")]
+
+
+def test_out_of_step_index(tmp_path):
+    path = sink(tmp_path)
+    index = readindex(path)
+    shifted = index.copy()
+    shifted["offset"][1] = shifted["offset"][1] + 1
+    with pytest.raises(ValueError):
+        readexits(path, shifted)
+    swapped = index.copy()
+    swapped["id"][0] = 2
+    with pytest.raises(ValueError):
+        readexits(path, swapped)
+    with pytest.raises(ValueError):
+        readexits(path, [os.path.getsize(path + ".rec") - 2])
+    assert len(readindex(str(tmp_path / "missing"))) == 0
+    assert readindex(path).dtype == INDEX and np.array_equal(readindex(path), index)
@@ -0,0 +1,124 @@
+import pytest
+from FallModel.Fall_social import SocialGraph, evictions
+
+# 1 - 2 - 3 - 4 - 5, 2 - 6, carer 1 linked to patients 1 and 6
+LINKS = [(1, 2), (2, 3), (3, 4), (4, 5), (2, 6)]
+
+
+class StubTx:
+    """
+    Transaction standing in for the database, answering the social link query from a list of records.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.loads = 0
+
+    def run(self, query, **params):
+        self.loads = self.loads + 1
+        return self
+
+    def values(self):
+        return self.records
+
+
+def records():
+    rows = [(["Agent", "Patient"], a, ["Agent", "Patient"], b) for a, b in LINKS]
+    return rows + [(["Agent", "Patient"], 1, ["Carer"], 1), (["Carer"], 1, ["Agent", "Patient"], 6)]
+
+
+def graph():
+    social = SocialGraph()
+    social.ensure(StubTx(records()), 0)
+    return social
+
+
+def test_contacts():
+    social = graph()
+    assert sorted(social.contacts(("Agent", 2))) == [1, 3, 6]
+    assert social.contacts(("Agent", 1), "Carer") == [1]
+    assert sorted(social.contacts(("Carer", 1))) == [1, 6]
+    assert social.contacts(("Agent", 9)) == []
+
+
+def test_distance():
+    social = graph()
+    assert social.distance(("Agent", 1), ("Agent", 1)) == 0
+    assert social.distance(("Agent", 1), ("Agent", 2)) == 1
+    assert social.distance(("Agent", 1), ("Agent", 5)) == 4
+    # through the carer rather than 2
+    assert social.distance(("Agent", 1), ("Agent", 6)) == 2
+    assert social.distance(("Agent", 1), ("Agent", 5), 3) is None
+    assert social.distance(("Agent", 1), ("Agent", 9)) is None
+
+
+def test_overlay_links():
+    social = graph()
+    social.add(("Agent", 1), ("Agent", 5))
+    social.add(("Agent", 5), ("Agent", 7))
+    social.remove(("Agent", 2), ("Agent", 3))
+    assert sorted(social.contacts(("Agent", 5))) == [1, 4, 7]
+    assert sorted(social.contacts(("Agent", 2))) == [1, 6]
+    assert social.distance(("Agent", 6), ("Agent", 7)) == 4
+    assert social.distance(("Agent", 3), ("Agent", 7)) == 3
+    social.remove(("Agent", 1), ("Agent", 5))
+    social.add(("Agent", 2), ("Agent", 3))
+    assert sorted(social.contacts(("Agent", 5))) == [4, 7]
+    assert social.distance(("Agent", 1), ("Agent", 7)) == 5
+    social.rebuild()
+    assert sorted(social.contacts(("Agent", 5))) == [4, 7]
+    assert social.distance(("Agent", 1), ("Agent", 7)) == 5
+
+
+def test_detach():
+    social = graph()
+    social.detach(("Agent", 2))
+    assert social.contacts(("Agent", 2)) == []
+    assert social.contacts(("Agent", 1), "Agent") == []
+    assert social.distance(("Agent", 1), ("Agent", 3)) is None
+    assert social.distance(("Agent", 1), ("Agent", 6)) == 2
+
+
+def test_reload_each_timestep():
+    tx = StubTx(records())
+    social = SocialGraph()
+    social.ensure(tx, 3)
+    social.ensure(tx, 3)
+    assert tx.loads == 1
+    # patient 2 deleted by another process
+    tx.records = [record for record in records() if 2 not in (record[1], record[3])]
+    social.ensure(tx, 4)
+    assert tx.loads == 2
+    assert social.contacts(("Agent", 1), "Agent") == []
+    assert social.distance(("Agent", 1), ("Agent", 3)) is None
+
+
+class StubLink(dict):
+    """
+    SOCIAL or FRIEND link from a patient to a contact.
+    """
+
+    def __init__(self, other, created, usage=None):
+        super(StubLink, self).__init__(created=created, usage=usage)
+        self.end_node = {"id": other}
+
+
+@pytest.mark.parametrize("friends, carers, limit, expected", [
+    # within the limit nothing is dropped
+    ([(1, 0, 9), (2, 0, 9)], [(10, 0)], 3, []),
+    # more carers than the limit, every friend and the most recently met carers over the limit
+    ([(1, 0, 9), (2, 9, 9)], [(10, 2), (11, 8), (12, 5)], 1,
+     [("Agent", 1), ("Agent", 2), ("Carer", 11), ("Carer", 12)]),
+    # as many carers as the limit, every friend and no carers
+    ([(1, 0, 9), (2, 9, 9)], [(10, 2), (11, 8)], 2, [("Agent", 1), ("Agent", 2)]),
+    # friends made in the last 5 timesteps go first, newest first
+    ([(1, 0, 1), (2, 6, 9), (3, 8, 9), (4, 9, 9)], [], 2, [("Agent", 4), ("Agent", 3)]),
+    # then the friends with the oldest last usage
+    ([(1, 0, 7), (2, 1, 3), (3, 8, 9), (4, 2, 5)], [(10, 0)], 2, [("Agent", 3), ("Agent", 2), ("Agent", 4)]),
+    # a friend made 5 timesteps ago is no longer new
+    ([(1, 5, 2), (2, 0, 6), (3, 6, 8)], [], 1, [("Agent", 3), ("Agent", 1)]),
+])
+def test_evictions_follow_react_rules(friends, carers, limit, expected):
+    friends = [StubLink(other, created, usage) for other, created, usage in friends]
+    carers = [StubLink(other, created) for other, created in carers]
+    assert evictions(friends, carers, limit, 10) == expected
@@ -0,0 +1,31 @@
+import pytest
+from FallModel.Fall_topology import TopologyCache, parseallowed
+
+
+class StubEdge:
+
+    def __init__(self, edge_id, allowed):
+        self.id = edge_id
+        self.props = {"allowed": allowed}
+
+    def get(self, key):
+        return self.props.get(key)
+
+
+@pytest.mark.parametrize("allowed, wellbeing, split, permitted", [
+    (None, "'At risk'", False, True),
+    (["Healthy", "At risk"], "At risk", False, True),
+    (["Healthy", "At risk"], "'At risk'", False, False),
+    (["Healthy", "At risk"], "Fallen", False, False),
+    ("'Fallen, At risk, Healthy'", "Healthy", False, True),
+    ("'Fallen, At risk, Healthy'", "'At risk'", False, False),
+    ("'Fallen, At risk, Healthy'", "Fallen", True, False),
+    ("'Fallen, At risk, Healthy'", " At risk", True, True),
+    ("Fallen", "Fallen", True, True),
+])
+def test_permits_matches_stored_limits(allowed, wellbeing, split, permitted):
+    cache = TopologyCache()
+    edge = StubEdge(1, allowed)
+    assert cache.permits(edge, wellbeing, split) == permitted
+    cache.allowed[edge.id] = parseallowed(allowed)
+    assert cache.permits(edge, wellbeing, split) == permitted